@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, PasswordResetOTP
+from .models import User, PasswordResetOTP, EmailOutbox
 
 
 @admin.register(User)
@@ -22,3 +22,12 @@ class PasswordResetOTPAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__email', 'otp')
     readonly_fields = ('otp', 'created_at')
     ordering = ('-created_at',)
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'expires_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients', 'last_error')
+    readonly_fields = ('attempts', 'last_error', 'sent_at', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
@@ -1,52 +1,194 @@
 """
 Custom Email Backend to handle SSL certificate issues
+and keep authenticated SMTP connections alive between sends
 """
+import os
 import ssl
 import smtplib
+import threading
+import time
+from django.conf import settings
 from django.core.mail.backends.smtp import EmailBackend
 
 
+_ssl_context = None
+
+# Per-process pool of logged-in connections: {key: [(connection, last_used), ...]}
+_pool = {}
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+_stats = {
+    'connects': 0,
+    'reuses': 0,
+    'sends': 0,
+    'failures': 0,
+}
+
+
+def get_ssl_context():
+    """Create the less strict SSL context once per process"""
+    global _ssl_context
+    if _ssl_context is None:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        _ssl_context = ssl_context
+    return _ssl_context
+
+
+def get_pool_stats():
+    """Return a snapshot of connection counters and idle pool size"""
+    with _pool_lock:
+        stats = dict(_stats)
+        stats['idle'] = sum(len(conns) for conns in _pool.values()) if _pool_pid == os.getpid() else 0
+    return stats
+
+
+def _incr(counter, amount=1):
+    with _pool_lock:
+        _stats[counter] += amount
+
+
+def _quit_quietly(connection):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, ssl.SSLError, OSError):
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+
 class CustomEmailBackend(EmailBackend):
     """
     Custom SMTP Email Backend that creates a less strict SSL context
-    to handle certificate verification issues
+    to handle certificate verification issues.
+
+    Connections are returned to a small per-process pool on close() and
+    checked with NOOP before reuse, so repeated send_mail calls skip the
+    SSL handshake and login.
     """
-    
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = getattr(settings, 'EMAIL_POOL_SIZE', 2)
+        self.idle_timeout = getattr(settings, 'EMAIL_POOL_IDLE_TIMEOUT', 60)
+        self._broken = False
+
+    def _pool_key(self):
+        return (self.host, self.port, self.username, self.use_ssl, self.use_tls)
+
+    def _checkout(self):
+        """Take a live connection from the pool, or None"""
+        global _pool, _pool_pid
+        key = self._pool_key()
+        while True:
+            with _pool_lock:
+                if _pool_pid != os.getpid():
+                    # Forked worker: never share sockets with the parent process
+                    _pool = {}
+                    _pool_pid = os.getpid()
+                conns = _pool.get(key)
+                if not conns:
+                    return None
+                connection, last_used = conns.pop()
+
+            if time.monotonic() - last_used > self.idle_timeout:
+                # Server has most likely dropped it already
+                _quit_quietly(connection)
+                continue
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, ssl.SSLError, OSError):
+                pass
+            _quit_quietly(connection)
+
+    def _checkin(self, connection):
+        """Return a connection to the pool; False if the pool is full"""
+        key = self._pool_key()
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                return False
+            conns = _pool.setdefault(key, [])
+            if len(conns) >= self.pool_size:
+                return False
+            conns.append((connection, time.monotonic()))
+        return True
+
     def open(self):
         """
-        Open the connection to the mail server with custom SSL context.
+        Open the connection to the mail server with custom SSL context,
+        reusing a pooled connection when one is available.
         """
         if self.connection:
             return False
-        
-        # Create a custom SSL context with less strict verification
-        ssl_context = ssl.create_default_context()
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-        
+
+        self._broken = False
+        pooled = self._checkout()
+        if pooled is not None:
+            self.connection = pooled
+            _incr('reuses')
+            return True
+
         connection_params = {}
         if self.timeout is not None:
             connection_params['timeout'] = self.timeout
-        
-        if self.use_ssl:
-            connection_params['context'] = ssl_context
-            self.connection = smtplib.SMTP_SSL(
-                self.host, 
-                self.port, 
-                **connection_params
-            )
-        else:
-            self.connection = smtplib.SMTP(
-                self.host, 
-                self.port, 
-                **connection_params
-            )
-            if self.use_tls:
-                self.connection.starttls(context=ssl_context)
-        
-        if self.username and self.password:
-            self.connection.login(self.username, self.password)
-        
+
+        connection = None
+        try:
+            if self.use_ssl:
+                connection_params['context'] = get_ssl_context()
+                connection = smtplib.SMTP_SSL(
+                    self.host,
+                    self.port,
+                    **connection_params
+                )
+            else:
+                connection = smtplib.SMTP(
+                    self.host,
+                    self.port,
+                    **connection_params
+                )
+                if self.use_tls:
+                    connection.starttls(context=get_ssl_context())
+
+            if self.username and self.password:
+                connection.login(self.username, self.password)
+        except (smtplib.SMTPException, OSError):
+            _incr('failures')
+            if connection is not None:
+                # Connected, but STARTTLS or AUTH failed: do not leak the socket
+                _quit_quietly(connection)
+            if not self.fail_silently:
+                raise
+            return None
+
+        self.connection = connection
+        _incr('connects')
         return True
 
+    def close(self):
+        """Return a healthy connection to the pool instead of quitting"""
+        if self.connection is None:
+            return
+        connection = self.connection
+        self.connection = None
+        if self._broken or not self._checkin(connection):
+            _quit_quietly(connection)
 
+    def _send(self, email_message):
+        try:
+            sent = super()._send(email_message)
+        except Exception:
+            # Don't hand a connection in an unknown state back to the pool
+            self._broken = True
+            _incr('failures')
+            raise
+        if sent:
+            _incr('sends')
+        elif email_message.recipients():
+            self._broken = True
+            _incr('failures')
+        return sent
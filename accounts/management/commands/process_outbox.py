@@ -0,0 +1,110 @@
+"""
+Management command to deliver queued emails from the EmailOutbox table
+Run this as a long-lived process (systemd/supervisor) next to gunicorn
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.core.mail import get_connection
+from django.db import transaction
+from accounts.models import EmailOutbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox with retries and exponential backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Number of emails claimed per batch (default: 20)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep when the outbox is empty (default: 5)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the currently due emails and exit',
+        )
+        parser.add_argument(
+            '--backend',
+            default=None,
+            help='Email backend to deliver with (default: settings.EMAIL_BACKEND)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        poll_interval = options['poll_interval']
+        once = options['once']
+        backend = options['backend']
+
+        total_sent = 0
+        total_failed = 0
+
+        try:
+            while True:
+                sent, failed = self.process_batch(batch_size, backend)
+                total_sent += sent
+                total_failed += failed
+
+                if sent or failed:
+                    self.stdout.write(f'Batch done: {sent} sent, {failed} failed')
+                    # More rows may be waiting - claim the next batch right away
+                    continue
+
+                if once:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrupted, stopping outbox worker.'))
+
+        self.stdout.write(self.style.SUCCESS(f'\nSent {total_sent} email(s), {total_failed} failure(s)'))
+
+    def process_batch(self, batch_size, backend=None):
+        """Claim one batch of due emails and deliver them over a single connection"""
+        sent = 0
+        failed = 0
+
+        expired = EmailOutbox.expire_stale()
+        if expired:
+            self.stdout.write(self.style.WARNING(f'Dropped {expired} expired email(s)'))
+
+        # Rows stay locked until the transaction ends, so concurrent workers
+        # skip them instead of sending the same email twice.
+        with transaction.atomic():
+            batch = list(
+                EmailOutbox.due().select_for_update(skip_locked=True).order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            if not batch:
+                return 0, 0
+
+            connection = get_connection(backend=backend, fail_silently=False)
+            try:
+                connection.open()
+            except Exception as e:
+                # Server unreachable - push the whole batch back with backoff
+                for email in batch:
+                    email.mark_failed(e)
+                self.stdout.write(self.style.ERROR(f'✗ Could not connect to mail server: {str(e)}'))
+                return 0, len(batch)
+
+            try:
+                for email in batch:
+                    try:
+                        email.build_message(connection=connection).send()
+                        email.mark_sent()
+                        sent += 1
+                    except Exception as e:
+                        email.mark_failed(e)
+                        failed += 1
+                        self.stdout.write(
+                            self.style.ERROR(f'✗ Error sending email #{email.pk} to {email.recipients}: {str(e)}')
+                        )
+            finally:
+                connection.close()
+
+        return sent, failed
@@ -43,9 +43,127 @@ class PasswordResetOTP(models.Model):
         """Generate a 6-digit OTP"""
         return ''.join(random.choices(string.digits, k=6))
     
+    @property
+    def expires_at(self):
+        """When the OTP stops being accepted (OTP_EXPIRY_MINUTES after it was created)"""
+        from django.conf import settings
+        expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
+        return self.created_at + timezone.timedelta(minutes=expiry_minutes)
+    
     def is_valid(self):
         """Check if OTP is still valid (within 10 minutes)"""
+        return timezone.now() <= self.expires_at and not self.is_used
+
+
+class EmailOutbox(models.Model):
+    """Queued transactional email, delivered by the process_outbox command"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+        ('EXPIRED', 'Expired'),
+    ]
+    
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=255)
+    recipients = models.TextField(help_text="Comma-separated recipient addresses")
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Not sent after this time (e.g. when its OTP expires)")
+    last_error = models.TextField(blank=True, null=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'email_outbox'
+        ordering = ['next_attempt_at', 'id']
+        verbose_name = 'Email Outbox'
+        verbose_name_plural = 'Email Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {self.recipients} ({self.status})"
+    
+    @classmethod
+    def enqueue(cls, subject, message, recipient_list, html_message=None, from_email=None, expires_at=None):
+        """
+        Queue an email for background delivery (same arguments as send_mail).
+        An email with `expires_at` is dropped instead of sent after that time.
+        """
         from django.conf import settings
-        expiry_minutes = getattr(settings, 'OTP_EXPIRY_MINUTES', 10)
-        expiry_time = self.created_at + timezone.timedelta(minutes=expiry_minutes)
-        return timezone.now() <= expiry_time and not self.is_used
+        return cls.objects.create(
+            subject=subject,
+            body=message,
+            html_body=html_message,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=','.join(recipient_list),
+            expires_at=expires_at,
+        )
+    
+    @classmethod
+    def due(cls):
+        """Pending emails whose next attempt is due and that have not expired"""
+        now = timezone.now()
+        return cls.objects.filter(status='PENDING', next_attempt_at__lte=now).filter(
+            models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=now)
+        )
+    
+    @classmethod
+    def expire_stale(cls):
+        """Mark pending emails past their expiry EXPIRED; returns how many"""
+        return cls.objects.filter(status='PENDING', expires_at__lte=timezone.now()).update(
+            status='EXPIRED', updated_at=timezone.now(),
+        )
+    
+    def get_recipient_list(self):
+        """Return recipients as a list"""
+        return [email.strip() for email in self.recipients.split(',') if email.strip()]
+
+    def build_message(self, connection=None):
+        """Build the EmailMultiAlternatives message for this row"""
+        from django.core.mail import EmailMultiAlternatives
+        message = EmailMultiAlternatives(
+            self.subject,
+            self.body,
+            self.from_email,
+            self.get_recipient_list(),
+            connection=connection,
+        )
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
+
+    def mark_sent(self):
+        """Record a successful delivery"""
+        self.status = 'SENT'
+        self.attempts += 1
+        self.sent_at = timezone.now()
+        self.last_error = None
+        self.save(update_fields=['status', 'attempts', 'sent_at', 'last_error', 'updated_at'])
+    
+    def mark_failed(self, error):
+        """Record a failed attempt and schedule a retry with exponential backoff, unless it would come too late"""
+        from django.conf import settings
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+        backoff_seconds = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_SECONDS', 30)
+        
+        self.attempts += 1
+        self.last_error = str(error)
+        # 30s, 60s, 120s, 240s, ... capped at one hour
+        delay = min(backoff_seconds * (2 ** (self.attempts - 1)), 3600)
+        next_attempt_at = timezone.now() + timezone.timedelta(seconds=delay)
+        if self.attempts >= max_attempts:
+            self.status = 'FAILED'
+        elif self.expires_at and next_attempt_at >= self.expires_at:
+            # The retry would deliver something already useless, e.g. a dead OTP
+            self.status = 'EXPIRED'
+        else:
+            self.next_attempt_at = next_attempt_at
+        self.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at', 'updated_at'])
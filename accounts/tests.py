@@ -1,3 +1,316 @@
-from django.test import TestCase
+"""
+Query budgets for the accounts URLs
 
-# Create your tests here.
+Like invoices.tests, every view must run a fixed number of queries whether
+there is 1 user (with one reset OTP) or 500 of each.
+
+The email outbox (claiming, retries with backoff, expiry) and the pooled SMTP
+backend, against a stub server, are tested at the end.
+"""
+import socketserver
+import threading
+import time
+from io import StringIO
+from smtplib import SMTPAuthenticationError, SMTPException, SMTPRecipientsRefused
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.urls import URLPattern, reverse
+from .models import EmailOutbox, PasswordResetOTP
+from . import email_backend
+from . import urls as account_urls
+
+
+User = get_user_model()
+
+# (url name, method): queries for one request, at any data size
+QUERY_BUDGETS = {
+    ('accounts:login', 'get'): 0,
+    ('accounts:login', 'post'): 9,
+    ('accounts:signup', 'get'): 0,
+    ('accounts:signup', 'post'): 13,
+    ('accounts:logout', 'get'): 3,
+    ('accounts:forgot_password', 'get'): 0,
+    ('accounts:forgot_password', 'post'): 9,
+    ('accounts:verify_otp', 'get'): 0,
+    ('accounts:verify_otp', 'post'): 5,
+    ('accounts:reset_password', 'get'): 0,
+    ('accounts:reset_password', 'post'): 7,
+    ('accounts:resend_otp', 'get'): 4,
+}
+
+
+class QueryBudgetTests:
+    """Mixin with the accounts flows; subclasses set `rows`"""
+    rows = None
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password('secret')
+        cls.user = User.objects.create(
+            username='owner', email='owner@example.com', password=password, mobile='9800000000',
+        )
+        users = User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@example.com', password=password) for i in range(cls.rows - 1)
+        ])
+        PasswordResetOTP.objects.bulk_create(
+            [PasswordResetOTP(user=cls.user, otp=f'{i:06d}', is_used=True) for i in range(cls.rows)]
+            + [PasswordResetOTP(user=user, otp='123456') for user in users]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def start_reset(self, verified=False):
+        """Session state of a password reset for the owner, as forgot_password/verify_otp leave it"""
+        otp = PasswordResetOTP.objects.create(user=self.user, otp='654321')
+        session = self.client.session
+        session['reset_email'] = self.user.email
+        if verified:
+            session['otp_verified'] = True
+            session['otp_id'] = otp.pk
+        session.save()
+        return otp
+
+    def assertQueryBudget(self, name, method='get', status=200, **kwargs):
+        """Request the named URL and check it runs exactly QUERY_BUDGETS[(name, method)] queries"""
+        with self.assertNumQueries(QUERY_BUDGETS[(name, method)]):
+            response = getattr(self.client, method)(reverse(name), **kwargs)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_every_url_has_a_budget(self):
+        names = {f'accounts:{pattern.name}' for pattern in account_urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names, {name for name, _ in QUERY_BUDGETS})
+
+    def test_login_and_logout(self):
+        self.assertQueryBudget('accounts:login')
+        self.assertQueryBudget('accounts:login', 'post', status=302, data={'username': 'owner', 'password': 'secret'})
+        self.assertQueryBudget('accounts:logout', status=302)
+
+    def test_signup(self):
+        self.assertQueryBudget('accounts:signup')
+        self.assertQueryBudget('accounts:signup', 'post', status=302, data={
+            'username': 'newuser', 'first_name': 'New', 'last_name': 'User', 'email': 'new@example.com',
+            'mobile': '9811111111', 'password': 'S3cure-pass!', 'confirm_password': 'S3cure-pass!',
+        })
+
+    def test_forgot_password(self):
+        self.assertQueryBudget('accounts:forgot_password')
+        self.assertQueryBudget('accounts:forgot_password', 'post', status=302, data={'email': self.user.email})
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_verify_otp(self):
+        otp = self.start_reset()
+        self.assertQueryBudget('accounts:verify_otp')
+        self.assertQueryBudget('accounts:verify_otp', 'post', status=302, data={'otp': otp.otp})
+        self.assertQueryBudget('accounts:resend_otp', status=302)
+
+    def test_reset_password(self):
+        self.start_reset(verified=True)
+        self.assertQueryBudget('accounts:reset_password')
+        self.assertQueryBudget('accounts:reset_password', 'post', status=302, data={
+            'new_password': 'An0ther-pass!', 'confirm_password': 'An0ther-pass!',
+        })
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class OneRowQueryBudgetTests(QueryBudgetTests, TestCase):
+    rows = 1
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ManyRowsQueryBudgetTests(QueryBudgetTests, TestCase):
+    rows = 500
+
+
+class FailingBackend(BaseEmailBackend):
+    """Email backend whose server accepts the connection and rejects every message"""
+
+    def send_messages(self, email_messages):
+        raise SMTPException('451 Try again later')
+
+
+@override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_BACKOFF_SECONDS=30)
+class EmailOutboxTests(TestCase):
+    """process_outbox: which rows it claims, how failures are retried and when it gives up"""
+
+    def process(self, backend=None):
+        call_command('process_outbox', once=True, backend=backend, stdout=StringIO())
+
+    def enqueue(self, subject, **fields):
+        email = EmailOutbox.enqueue(subject, 'Body', ['owner@example.com'])
+        if fields:
+            EmailOutbox.objects.filter(pk=email.pk).update(**fields)
+            email.refresh_from_db()
+        return email
+
+    def test_claims_only_due_unexpired_emails(self):
+        now = timezone.now()
+        due = self.enqueue('Due')
+        later = self.enqueue('Later', next_attempt_at=now + timezone.timedelta(minutes=5))
+        expired = self.enqueue('Expired', expires_at=now - timezone.timedelta(seconds=1))
+        sent = self.enqueue('Sent', status='SENT')
+        self.process()
+
+        self.assertEqual([message.subject for message in mail.outbox], ['Due'])
+        statuses = dict(EmailOutbox.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {due.pk: 'SENT', later.pk: 'PENDING', expired.pk: 'EXPIRED', sent.pk: 'SENT'})
+
+    def test_retries_with_backoff_then_fails(self):
+        email = self.enqueue('Flaky')
+        delays = []
+        for _ in range(3):
+            started = timezone.now()
+            self.process(backend='accounts.tests.FailingBackend')
+            email.refresh_from_db()
+            delays.append(round((email.next_attempt_at - started).total_seconds() / 30) * 30)
+            EmailOutbox.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+
+        self.assertEqual(email.status, 'FAILED')
+        self.assertEqual(email.attempts, 3)
+        self.assertIn('451', email.last_error)
+        # Attempts 1 and 2 are retried after 30 s and 60 s; the third is the last
+        self.assertEqual(delays[:2], [30, 60])
+
+        self.process()
+        self.assertEqual(mail.outbox, [])
+
+    def test_no_retry_after_expiry(self):
+        email = self.enqueue('OTP', expires_at=timezone.now() + timezone.timedelta(seconds=45))
+        email.mark_failed('timeout')
+        self.assertEqual(email.status, 'PENDING')
+        # The next retry would come 60 s later, after the OTP has expired
+        email.mark_failed('timeout')
+        self.assertEqual(email.status, 'EXPIRED')
+
+    def test_otp_email_expires_with_the_otp(self):
+        user = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.client.post(reverse('accounts:forgot_password'), {'email': user.email})
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.expires_at, PasswordResetOTP.objects.get(user=user).expires_at)
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """
+    Just enough SMTP for smtplib: refuses RCPT for bounce@ addresses, rejects
+    every AUTH, and can hang up after a message
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stub ESMTP')
+        try:
+            self.converse()
+        finally:
+            self.server.closed += 1
+
+    def converse(self):
+        for line in self.rfile:
+            command = line.decode().strip().upper()
+            if command.startswith('EHLO'):
+                self.reply('250-stub')
+                self.reply('250 AUTH PLAIN')
+            elif command.startswith('HELO'):
+                self.reply('250 stub')
+            elif command.startswith('AUTH'):
+                self.reply('535 Authentication credentials invalid')
+            elif command.startswith('RCPT') and 'BOUNCE@' in command:
+                self.reply('550 No such user')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                self.server.messages += 1
+                self.reply('250 Queued')
+                if self.server.hang_up:
+                    return
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+@override_settings(EMAIL_POOL_SIZE=2, EMAIL_POOL_IDLE_TIMEOUT=60)
+class PooledEmailBackendTests(SimpleTestCase):
+    """CustomEmailBackend reuses logged-in connections and never pools a broken one"""
+
+    def setUp(self):
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStubHandler)
+        self.server.daemon_threads = True
+        self.server.connections = self.server.messages = self.server.closed = 0
+        self.server.hang_up = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.empty_pool)
+        self.empty_pool()
+
+    def empty_pool(self):
+        with email_backend._pool_lock:
+            pooled = [connection for conns in email_backend._pool.values() for connection, _ in conns]
+            email_backend._pool.clear()
+        for connection in pooled:
+            email_backend._quit_quietly(connection)
+
+    def send(self, to='owner@example.com', username=''):
+        # A new backend per message, as send_mail() does
+        backend = get_connection(
+            'accounts.email_backend.CustomEmailBackend', host='127.0.0.1', port=self.server.server_address[1],
+            username=username, password='secret' if username else '', use_ssl=False, use_tls=False, timeout=5,
+        )
+        return EmailMessage('Subject', 'Body', 'noreply@example.com', [to], connection=backend).send()
+
+    def test_connections_are_reused(self):
+        before = email_backend.get_pool_stats()
+        for _ in range(3):
+            self.assertEqual(self.send(), 1)
+        after = email_backend.get_pool_stats()
+        self.assertEqual((self.server.connections, self.server.messages), (1, 3))
+        self.assertEqual(after['reuses'] - before['reuses'], 2)
+        self.assertEqual(after['idle'], 1)
+
+    def test_failed_send_is_not_pooled(self):
+        self.send()
+        with self.assertRaises(SMTPRecipientsRefused):
+            self.send('bounce@example.com')
+        self.assertEqual(email_backend.get_pool_stats()['idle'], 0)
+        self.send()
+        self.assertEqual(self.server.connections, 2)
+
+    def test_dropped_connection_is_replaced(self):
+        self.server.hang_up = True
+        self.send()
+        # The pooled socket fails NOOP and is thrown away
+        self.assertEqual(self.send(), 1)
+        self.assertEqual((self.server.connections, self.server.messages), (2, 2))
+
+    def test_failed_login_closes_the_socket(self):
+        errors = []
+        for _ in range(3):
+            # Not assertRaises, which clears the traceback: kept, it holds the
+            # backend's frames, and any socket they leaked, alive
+            try:
+                self.send(username='mailer')
+            except SMTPAuthenticationError as error:
+                errors.append(error)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(email_backend.get_pool_stats()['idle'], 0)
+        for _ in range(50):
+            if self.server.closed == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual((self.server.connections, self.server.closed), (3, 3))
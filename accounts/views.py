@@ -2,12 +2,11 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from .forms import LoginForm, SignupForm, ForgotPasswordForm, VerifyOTPForm, ResetPasswordForm
-from .models import PasswordResetOTP
+from .models import PasswordResetOTP, EmailOutbox
 
 User = get_user_model()
 
@@ -66,7 +65,7 @@ def forgot_password(request):
             
             # Generate new OTP
             otp_code = PasswordResetOTP.generate_otp()
-            PasswordResetOTP.objects.create(user=user, otp=otp_code)
+            otp = PasswordResetOTP.objects.create(user=user, otp=otp_code)
             
             # Send email with OTP
             subject = 'Password Reset OTP - InvoicePro'
@@ -77,20 +76,17 @@ def forgot_password(request):
             })
             plain_message = strip_tags(html_message)
             
-            try:
-                send_mail(
-                    subject,
-                    plain_message,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [email],
-                    html_message=html_message,
-                    fail_silently=False,
-                )
-                messages.success(request, f'OTP sent to {email}. Please check your inbox.')
-                request.session['reset_email'] = email
-                return redirect('accounts:verify_otp')
-            except Exception as e:
-                messages.error(request, f'Failed to send email. Please try again later.')
+            # Queue for the outbox worker instead of blocking on SMTP
+            EmailOutbox.enqueue(
+                subject,
+                plain_message,
+                [email],
+                html_message=html_message,
+                expires_at=otp.expires_at,
+            )
+            messages.success(request, f'OTP sent to {email}. Please check your inbox.')
+            request.session['reset_email'] = email
+            return redirect('accounts:verify_otp')
     else:
         form = ForgotPasswordForm()
     
@@ -196,7 +192,7 @@ def resend_otp(request):
         
         # Generate new OTP
         otp_code = PasswordResetOTP.generate_otp()
-        PasswordResetOTP.objects.create(user=user, otp=otp_code)
+        otp = PasswordResetOTP.objects.create(user=user, otp=otp_code)
         
         # Send email
         subject = 'Password Reset OTP - InvoicePro'
@@ -207,13 +203,12 @@ def resend_otp(request):
         })
         plain_message = strip_tags(html_message)
         
-        send_mail(
+        EmailOutbox.enqueue(
             subject,
             plain_message,
-            settings.DEFAULT_FROM_EMAIL,
             [email],
             html_message=html_message,
-            fail_silently=False,
+            expires_at=otp.expires_at,
         )
         messages.success(request, f'New OTP sent to {email}.')
     except Exception as e:
@@ -41,11 +41,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'invoices.middleware.MetricsMiddleware',
+    'invoices.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'invoices.middleware.ProfilerMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -145,20 +148,96 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='InvoicePro <noreply@invoicepro.com>')
 
+# SMTP connection pool (per process) used by CustomEmailBackend
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=20, cast=int)
+EMAIL_POOL_SIZE = config('EMAIL_POOL_SIZE', default=2, cast=int)
+EMAIL_POOL_IDLE_TIMEOUT = config('EMAIL_POOL_IDLE_TIMEOUT', default=60, cast=int)
+
+# Email outbox (delivered by `manage.py process_outbox`)
+EMAIL_OUTBOX_MAX_ATTEMPTS = config('EMAIL_OUTBOX_MAX_ATTEMPTS', default=6, cast=int)
+EMAIL_OUTBOX_BACKOFF_SECONDS = config('EMAIL_OUTBOX_BACKOFF_SECONDS', default=30, cast=int)
+
+# Background jobs (run by `manage.py run_jobs`): queue name -> worker threads
+JOB_QUEUES = {
+    'default': 1,
+    'pdf': 2,
+    'email': 1,
+}
+JOB_LOCK_TIMEOUT = 600  # seconds without a heartbeat before a RUNNING job from a dead worker is retried
+JOB_HEARTBEAT_SECONDS = 60  # how often a running job refreshes locked_at; well below JOB_LOCK_TIMEOUT
+JOB_RETRY_BACKOFF_SECONDS = 30
+
+# Scheduled tasks (run by `manage.py run_scheduler`, replaces cron)
+# Each task has 'every' (seconds) or 'at' (daily "HH:MM", TIME_ZONE) and
+# either 'command' (+ 'args'/'options') or 'job' (+ 'payload').
+SCHEDULER_TASKS = [
+    {'name': 'invoice_reminders', 'at': '09:00', 'command': 'send_invoice_reminders'},
+    {'name': 'overdue_sweep', 'every': 3600, 'command': 'sweep_overdue_invoices'},
+    # Well within REFERENCE_CACHE_TIMEOUT, so active users rarely meet a cold entry
+    {'name': 'reference_cache_warm', 'every': 900, 'command': 'warm_reference_cache'},
+]
+# send_invoice_reminders only sends overdue reminders for invoices that fell
+# overdue in the last N days; older ones are not backfilled (0 = no limit)
+REMINDER_OVERDUE_WINDOW_DAYS = 7
+
 # OTP Settings
 OTP_EXPIRY_MINUTES = 10
 
 # Session optimization
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 
-# Cache configuration
+# Cache configuration: one SQLite file shared by every gunicorn worker (invoices.cache_backends),
+# so sessions, invalidations and version keys are the same in all of them
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
+        'BACKEND': 'invoices.cache_backends.SQLiteCache',
+        'LOCATION': config('CACHE_PATH', default=str(BASE_DIR / 'cache' / 'cache.sqlite3')),
         'TIMEOUT': 300,
         'OPTIONS': {
-            'MAX_ENTRIES': 1000
+            'MAX_ENTRIES': 20000
         }
     }
 }
+
+# Two-tier cache for UOMs, companies and PO choices (invoices.reference_cache)
+REFERENCE_CACHE_ALIAS = 'default'  # shared tier holding values and version keys
+REFERENCE_CACHE_SIZE = 1024  # entries in each process's LRU
+REFERENCE_CACHE_TIMEOUT = 3600
+
+# Per-request SQL/template instrumentation (invoices.middleware)
+SQL_INSTRUMENTATION = config('SQL_INSTRUMENTATION', default=True, cast=bool)
+SERVER_TIMING_HEADER = config('SERVER_TIMING_HEADER', default=DEBUG, cast=bool)  # for everyone; staff always get it
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', default=500, cast=int)  # log requests slower than this
+
+# Diagnostic mode: EXPLAIN slow SELECTs in a background job (invoices.slow_queries), listed in the admin
+SLOW_QUERY_CAPTURE = config('SLOW_QUERY_CAPTURE', default=False, cast=bool)
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=100, cast=int)
+SLOW_QUERY_SAMPLE_RATE = config('SLOW_QUERY_SAMPLE_RATE', default=1.0, cast=float)  # share of requests checked
+SLOW_QUERY_EXPLAIN_INTERVAL = 3600  # seconds before the same query shape is explained again
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = 10000
+SLOW_QUERY_MAX_ROWS = 200
+
+# Staff-only cProfile runs with ?_profile=1 (invoices.profiling), browsed at /profiles/
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=True, cast=bool)
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_MAX_COUNT = 50
+
+# Prometheus metrics (invoices.metrics) kept in per-process mmap files, served at /metrics
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default=str(BASE_DIR / 'metrics'))
+METRICS_TOKEN = config('METRICS_TOKEN', default='')  # require "Authorization: Bearer <token>" when set
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+
+# manage.py test moves the cache, media, metrics and profiles to a temporary directory
+TEST_RUNNER = 'invoice_project.test_runner.IsolatedTestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'invoices.performance': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -0,0 +1,126 @@
+"""
+Free-text address parsing into structured fields
+
+Company and Client keep the address as entered, plus address_line1/2, city,
+pin and state_code parsed from it when the object is created or its address
+or GSTIN changes. Exports and PDFs read the stored fields instead of
+re-parsing the text on every request.
+"""
+import re
+from .validation_utils import STATE_CODES
+
+
+ADDRESS_FIELDS = ('address_line1', 'address_line2', 'city', 'pin', 'state_code')
+LINE_MAX_LENGTH = 100
+
+# Spellings seen in addresses besides the official state names
+STATE_ALIASES = {
+    'new delhi': '07', 'nct of delhi': '07', 'orissa': '21', 'pondicherry': '34',
+    'daman and diu': '26', 'dadra and nagar haveli': '26', 'j&k': '01',
+    'andaman & nicobar': '35', 'jammu & kashmir': '01', 'uttaranchal': '05',
+}
+
+# Union territories that are a single city, named like their capital
+CITY_STATES = {'04', '07'}
+
+STATE_NAMES = {
+    **{name.lower(): code for code, name in STATE_CODES.items() if code not in ('96', '97')},
+    **STATE_ALIASES,
+}
+
+# Longest names first so "Dadra and Nagar Haveli and Daman and Diu" wins over "Daman and Diu"
+STATE_NAME_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(name) for name in sorted(STATE_NAMES, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE,
+)
+PIN_RE = re.compile(r'(?:\b(?:pin(?:\s*code)?|pincode)\b\W*)?\b([1-9]\d{2}\s?\d{3})\b', re.IGNORECASE)
+COUNTRY_RE = re.compile(r'\bindia\b', re.IGNORECASE)
+# Punctuation and brackets left behind once the PIN, state and country are removed
+LEFTOVER_RE = re.compile(r'^[\s\-–:()/.]+|[\s\-–:()/.]+$')
+
+
+def _strip(text):
+    return LEFTOVER_RE.sub('', text)
+
+
+def _pack_lines(parts):
+    """Pack street parts into two lines of at most LINE_MAX_LENGTH characters"""
+    line1, line2 = '', ''
+    for part in parts:
+        if not line2 and len(line1) + len(part) + 2 <= LINE_MAX_LENGTH:
+            line1 = f'{line1}, {part}' if line1 else part
+        else:
+            line2 = f'{line2}, {part}' if line2 else part
+    return line1[:LINE_MAX_LENGTH], line2[:LINE_MAX_LENGTH]
+
+
+def parse_address(address, gstin=None):
+    """
+    Split a free-text Indian address into a dict of ADDRESS_FIELDS, e.g.
+    '123 Business Street, Ahmedabad, Gujarat - 380001' ->
+    line1 '123 Business Street', city 'Ahmedabad', pin '380001', state_code '24'.
+
+    The state code is taken from the GSTIN when there is one, since that is
+    what the GST portals check it against.
+    """
+    parts = [part.strip() for part in re.split(r'[,\n]', (address or '').replace('\r\n', '\n'))]
+    parts = [part for part in parts if part]
+
+    pin = ''
+    state_code = ''
+    state_name = ''
+    city = ''
+    # PIN, state and country come last and the city just before them
+    while parts:
+        part = parts[-1]
+        pin_match = PIN_RE.search(part)
+        if pin_match:
+            pin = pin or pin_match.group(1).replace(' ', '')
+            part = part[:pin_match.start()] + ' ' + part[pin_match.end():]
+        state_match = STATE_NAME_RE.search(part)
+        if state_match:
+            state_name = state_name or state_match.group(1)
+            state_code = state_code or STATE_NAMES[state_name.lower()]
+            part = part[:state_match.start()] + ' ' + part[state_match.end():]
+        part = _strip(COUNTRY_RE.sub(' ', part))
+        if not part:
+            parts.pop()
+            if (state_match and STATE_NAMES[state_match.group(1).lower()] in CITY_STATES
+                    and not (parts and STATE_NAME_RE.fullmatch(parts[-1]))):
+                # "Sector 17, Chandigarh - 160017": the state is the city,
+                # not the sector before it
+                city = state_match.group(1)
+                break
+            continue
+        if len(parts) > 1:
+            # "Ahmedabad" or "Surat 394130"
+            city = part
+            parts.pop()
+        else:
+            # Only the street is left
+            parts[-1] = part
+        break
+
+    if not city:
+        # "New Delhi 110020", "Chandigarh - 160017": the state doubles as the place
+        city = state_name
+
+    if gstin and gstin[:2] in STATE_CODES:
+        state_code = gstin[:2]
+
+    line1, line2 = _pack_lines(parts)
+    return {
+        'address_line1': line1,
+        'address_line2': line2,
+        'city': city[:50],
+        'pin': pin,
+        'state_code': state_code,
+    }
+
+
+def fill_address_fields(obj, replace=()):
+    """Set blank structured address fields, and those in `replace`, on a Company/Client from its free-text address"""
+    parsed = parse_address(obj.address, getattr(obj, 'gstin', None))
+    for field in ADDRESS_FIELDS:
+        if field in replace or not getattr(obj, field):
+            setattr(obj, field, parsed[field])
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Client, Product, PurchaseOrder, POLineItem, Invoice, InvoiceItem, Company, CompanySettings, UOM, Payment
+from django.utils.html import format_html
+from .models import Client, Product, PurchaseOrder, POLineItem, Invoice, InvoiceItem, Company, CompanySettings, UOM, Payment, Job, ScheduledRun, StatementCheckpoint, SlowQuery
 
 
 @admin.register(UOM)
@@ -12,9 +13,9 @@ class UOMAdmin(admin.ModelAdmin):
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'email', 'phone', 'is_active', 'created_at')
-    list_filter = ('is_active', 'created_at')
-    search_fields = ('name', 'email', 'phone')
+    list_display = ('name', 'email', 'phone', 'city', 'state_code', 'is_active', 'created_at')
+    list_filter = ('is_active', 'state_code', 'created_at')
+    search_fields = ('name', 'email', 'phone', 'city', 'pin')
     ordering = ('name',)
 
 
@@ -63,7 +64,7 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_display = ('invoice_number', 'company', 'client', 'invoice_date', 'due_date', 'total', 'status', 'created_at')
     list_filter = ('status', 'invoice_date', 'created_at', 'company')
     search_fields = ('invoice_number', 'client__name', 'company__name')
-    readonly_fields = ('subtotal', 'cgst_amount', 'sgst_amount', 'tax_amount', 'total', 'created_at', 'updated_at')
+    readonly_fields = ('subtotal', 'cgst_amount', 'sgst_amount', 'tax_amount', 'total', 'amount_in_words', 'created_at', 'updated_at')
     inlines = [InvoiceItemInline]
     ordering = ('-created_at',)
     
@@ -72,7 +73,7 @@ class InvoiceAdmin(admin.ModelAdmin):
             'fields': ('invoice_number', 'company', 'client', 'po_reference', 'po_number', 'po_date', 'vendor_code', 'invoice_date', 'due_date', 'status')
         }),
         ('Financial Details', {
-            'fields': ('subtotal', 'tax_rate', 'cgst_rate', 'sgst_rate', 'cgst_amount', 'sgst_amount', 'tax_amount', 'discount', 'total')
+            'fields': ('subtotal', 'tax_rate', 'cgst_rate', 'sgst_rate', 'cgst_amount', 'sgst_amount', 'tax_amount', 'discount', 'total', 'amount_in_words')
         }),
         ('Tax & Supply Details', {
             'fields': ('place_of_supply', 'state_code', 'reverse_charge', 'reverse_charge_amount')
@@ -85,7 +86,7 @@ class InvoiceAdmin(admin.ModelAdmin):
 
 @admin.register(Company)
 class CompanyAdmin(admin.ModelAdmin):
-    list_display = ('name', 'gstin', 'user', 'is_active', 'is_default', 'has_stamp', 'created_at')
+    list_display = ('name', 'gstin', 'city', 'state_code', 'user', 'is_active', 'is_default', 'has_stamp', 'created_at')
     list_filter = ('is_active', 'is_default', 'created_at')
     search_fields = ('name', 'gstin', 'pan', 'cin')
     ordering = ('-is_default', 'name')
@@ -121,6 +122,67 @@ class PaymentAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'queue', 'priority', 'status', 'attempts', 'run_at', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'last_error', 'locked_by')
+    readonly_fields = ('attempts', 'locked_at', 'locked_by', 'result', 'last_error', 'created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
+
+
+@admin.register(ScheduledRun)
+class ScheduledRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'started_at', 'duration_ms', 'success', 'host')
+    list_filter = ('name', 'success', 'host')
+    readonly_fields = ('name', 'started_at', 'finished_at', 'duration_ms', 'success', 'output', 'host')
+    ordering = ('-started_at',)
+
+
+@admin.register(StatementCheckpoint)
+class StatementCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('client', 'company', 'month', 'invoiced', 'received', 'closing_balance', 'computed_at')
+    list_filter = ('company', 'month')
+    search_fields = ('client__name', 'company__name')
+    readonly_fields = ('company', 'client', 'month', 'invoiced', 'received', 'closing_balance', 'computed_at')
+    ordering = ('company', 'client', '-month')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('short_sql', 'view_name', 'calls', 'total_ms', 'avg_ms', 'max_ms', 'has_plan', 'last_seen')
+    list_filter = ('view_name', 'database')
+    search_fields = ('fingerprint', 'view_name', 'path')
+    ordering = ('-total_ms',)
+    fields = ('fingerprint', 'view_name', 'method', 'path', 'calls', 'total_ms', 'avg_ms', 'max_ms',
+              'sample_sql', 'sample_params', 'database', 'formatted_plan', 'plan_error', 'explained_at',
+              'first_seen', 'last_seen')
+    readonly_fields = fields
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def short_sql(self, obj):
+        return obj.fingerprint[:120]
+    short_sql.short_description = 'Query'
+    
+    def avg_ms(self, obj):
+        return round(obj.avg_ms, 1)
+    avg_ms.short_description = 'Avg ms'
+    
+    def has_plan(self, obj):
+        return bool(obj.plan)
+    has_plan.boolean = True
+    has_plan.short_description = 'Plan'
+    
+    def formatted_plan(self, obj):
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', obj.plan) if obj.plan else '-'
+    formatted_plan.short_description = 'Plan'
+
+
 @admin.register(CompanySettings)
 class CompanySettingsAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
@@ -0,0 +1,70 @@
+"""Indian-numbering (lakh/crore) amount-in-words conversion"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from functools import lru_cache
+
+
+ONES = [
+    '', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine',
+    'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen',
+    'Seventeen', 'Eighteen', 'Nineteen',
+]
+TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+
+# (divisor, name), largest first; anything above 99 crore recurses on the crore part
+SCALES = [
+    (10 ** 7, 'Crore'),
+    (10 ** 5, 'Lakh'),
+    (10 ** 3, 'Thousand'),
+    (10 ** 2, 'Hundred'),
+]
+
+
+def _below_hundred(n):
+    if n < 20:
+        return ONES[n]
+    tens, ones = divmod(n, 10)
+    return f"{TENS[tens]} {ONES[ones]}".strip()
+
+
+@lru_cache(maxsize=1024)
+def integer_to_words(n):
+    """Spell a non-negative integer using Indian grouping, e.g. 150000 -> 'One Lakh Fifty Thousand'"""
+    if n == 0:
+        return 'Zero'
+    words = []
+    for divisor, name in SCALES:
+        if n >= divisor:
+            count, n = divmod(n, divisor)
+            words.append(f"{integer_to_words(count)} {name}")
+    if n:
+        words.append(_below_hundred(n))
+    return ' '.join(words)
+
+
+@lru_cache(maxsize=4096)
+def _amount_words(rupees, paise):
+    words = f"Rupees {integer_to_words(rupees)}"
+    if paise:
+        words += f" and {integer_to_words(paise)} Paise"
+    return f"{words} Only"
+
+
+def amount_in_words(amount):
+    """
+    Convert a rupee amount to words, e.g.
+    Decimal('123456.78') -> 'Rupees One Lakh Twenty Three Thousand Four Hundred
+    Fifty Six and Seventy Eight Paise Only'.
+
+    Decimals are used as-is (no float round-trip); paise are rounded the
+    same way DecimalField rounds the stored total.
+    """
+    if amount is None:
+        amount = Decimal('0')
+    elif not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+
+    negative = amount < 0
+    rupees, paise = divmod(int(abs(amount) * 100), 100)
+    words = _amount_words(rupees, paise)
+    return f"Minus {words}" if negative else words
@@ -0,0 +1,96 @@
+"""
+Timing statistics and baselines for the bench commands
+
+A benchmark run produces {name: {metric: value}}. Saved as JSON together
+with where it was measured, a run becomes the baseline the next run is
+compared with; compare() flags every metric that got worse by more than its
+tolerance, so noise in fast operations does not count as a regression.
+"""
+import json
+import math
+import platform
+import statistics
+from datetime import datetime
+import django
+from django.db import connection
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not values:
+        return 0.0
+    return values[max(math.ceil(pct / 100 * len(values)), 1) - 1]
+
+
+def summarize(durations):
+    """Distribution in milliseconds of durations in seconds"""
+    values = sorted(duration * 1000 for duration in durations)
+    return {
+        'n': len(values),
+        'min_ms': round(values[0], 4) if values else 0.0,
+        'p50_ms': round(percentile(values, 50), 4),
+        'p95_ms': round(percentile(values, 95), 4),
+        'p99_ms': round(percentile(values, 99), 4),
+        'max_ms': round(values[-1], 4) if values else 0.0,
+        'mean_ms': round(statistics.fmean(values), 4) if values else 0.0,
+        'stdev_ms': round(statistics.stdev(values), 4) if len(values) > 1 else 0.0,
+    }
+
+
+def environment():
+    """Where a run was measured; runs are only comparable on similar machines and data"""
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'host': platform.node(),
+        'measured_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def save_baseline(path, results, **details):
+    with open(path, 'w') as handle:
+        json.dump({'environment': environment(), **details, 'results': results}, handle, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def change(current, baseline):
+    """Relative change, e.g. 0.25 for 25% more; None without a baseline value"""
+    if baseline is None or current is None:
+        return None
+    if baseline == 0:
+        return 0.0 if current == 0 else math.inf
+    return (current - baseline) / baseline
+
+
+def compare(results, baseline, tolerances):
+    """
+    Compare results with baseline results metric by metric. `tolerances` is
+    {metric: (relative, absolute)}: a metric regresses when it grows by more
+    than both, e.g. (0.2, 1.0) for "over 20% and over 1 ms slower".
+
+    Returns [{name, metric, baseline, current, change, regressed}] for every
+    metric present in both.
+    """
+    rows = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, (relative, absolute) in tolerances.items():
+            if metric not in metrics or metric not in previous:
+                continue
+            current, before = metrics[metric], previous[metric]
+            rows.append({
+                'name': name,
+                'metric': metric,
+                'baseline': before,
+                'current': current,
+                'change': change(current, before),
+                'regressed': current - before > absolute and current > before * (1 + relative),
+            })
+    return rows
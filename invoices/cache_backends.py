@@ -0,0 +1,206 @@
+"""
+Cache backend shared by all worker processes, in a SQLite file
+
+LocMemCache is private to each gunicorn worker, so a value cached (or
+invalidated) by one worker is invisible to the others. SQLiteCache keeps the
+cache in one SQLite database in WAL mode instead. Every process on the host
+opens the same file, so there is no cache service to run:
+
+- readers never wait for the writer, and each statement is its own
+  transaction, so all processes see one consistent cache;
+- incr() is a single UPDATE, atomic across processes, which is what the
+  version keys of the reference cache rely on;
+- add() only replaces a row that has expired, in one statement;
+- expired rows are never returned, and every CULL_EVERY writes the expired
+  rows are deleted; beyond MAX_ENTRIES, 1/CULL_FREQUENCY of the rows closest
+  to expiry go as well.
+
+Integers are stored as SQLite integers (so incr() can add to them in SQL),
+everything else as pickles.
+
+    CACHES = {'default': {
+        'BACKEND': 'invoices.cache_backends.SQLiteCache',
+        'LOCATION': '/var/www/invoice_mlworkers/cache/cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 20000, 'CULL_FREQUENCY': 3},
+    }}
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+'''
+
+# Writes between two sweeps of expired rows, per process; MAX_ENTRIES is enforced then
+CULL_EVERY = 500
+
+NOT_EXPIRED = '(expires IS NULL OR expires > ?)'
+
+
+class SQLiteCache(BaseCache):
+    """Django cache backend in a SQLite database shared by every process; see the module docstring"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = Path(location)
+        options = params.get('OPTIONS', {})
+        self.busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self.cull_every = int(options.get('CULL_EVERY', CULL_EVERY))
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        """This thread's connection; a forked process opens its own"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self.path), timeout=self.busy_timeout / 1000, isolation_level=None)
+        connection.execute(f'PRAGMA busy_timeout = {self.busy_timeout}')
+        connection.execute('PRAGMA journal_mode = WAL')
+        # A crash may lose the last writes, never corrupt the file: good enough for a cache
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.executescript(SCHEMA)
+        self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @staticmethod
+    def _encode(value):
+        # bool is an int subclass but must come back as a bool
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _wrote(self, count=1):
+        self._writes += count
+        if self._writes >= self.cull_every:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries and self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+        elif count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (max(count // self._cull_frequency, count - self._max_entries),),
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = self._connection().execute(
+            f'SELECT value FROM cache WHERE key = ? AND {NOT_EXPIRED}', (key, time.time()),
+        ).fetchall()
+        return self._decode(rows[0][0]) if rows else default
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) AND {NOT_EXPIRED}',
+            (*keys, time.time()),
+        ).fetchall()
+        return {keys[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._encode(value), self.get_backend_timeout(timeout)),
+        )
+        self._wrote()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self.make_and_validate_key(key, version=version), self._encode(value), expires)
+                for key, value in data.items()]
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)', rows)
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        self._wrote(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Set the key only if it is missing or expired; True if it was set"""
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires <= ?',
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._wrote()
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """Add delta to an integer value in one statement; ValueError if the key is missing"""
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        connection = self._connection()
+        rows = connection.execute(
+            f"UPDATE cache SET value = value + ? WHERE key = ? AND {NOT_EXPIRED} AND typeof(value) = 'integer' "
+            'RETURNING value',
+            (delta, key, now),
+        ).fetchall()
+        if rows:
+            return rows[0][0]
+        if connection.execute(f'SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}', (key, now)).fetchall():
+            raise TypeError(f"Key '{key}' does not hold an integer")
+        raise ValueError(f"Key '{key}' not found")
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {NOT_EXPIRED}',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._connection().execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {NOT_EXPIRED}', (key, time.time()),
+        ).fetchall())
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection().execute(f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections stay open across requests; they are per thread and cheap to keep
+        pass
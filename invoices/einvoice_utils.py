@@ -0,0 +1,320 @@
+"""E-invoice (GST INV-01) and e-way bill payload builders"""
+import json
+from decimal import Decimal, ROUND_HALF_UP
+
+
+MONEY = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+# Invoices fetched per round-trip in bulk exports (items are prefetched per chunk)
+EXPORT_CHUNK_SIZE = 200
+
+
+def money(value):
+    """Round to paise; Decimal amounts are serialized as exact JSON numbers"""
+    return Decimal(value).quantize(MONEY, rounding=ROUND_HALF_UP)
+
+
+def iter_json(value):
+    """
+    Yield compact JSON text for `value`.
+
+    Unlike json.dumps, Decimal values are written as exact JSON numbers
+    instead of going through float.
+    """
+    if isinstance(value, dict):
+        yield '{'
+        first = True
+        for key, item in value.items():
+            if not first:
+                yield ','
+            first = False
+            yield json.dumps(key)
+            yield ':'
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ','
+            yield from iter_json(item)
+        yield ']'
+    elif isinstance(value, Decimal):
+        yield str(value)
+    else:
+        yield json.dumps(value)
+
+
+def dumps_json(value):
+    """Compact JSON string with exact Decimal numbers"""
+    return ''.join(iter_json(value))
+
+
+def _seller_details(company):
+    return {
+        "Gstin": company.gstin or "",
+        "LglNm": company.name,
+        "TrdNm": company.name,
+        "Addr1": company.address_line1 or "",
+        "Addr2": company.address_line2 or "",
+        "Loc": company.city or "",
+        "Pin": company.pin or "",
+        "Stcd": company.state_code or "",
+        "Ph": company.phone or "",
+        "Em": company.email or ""
+    }
+
+
+def build_einvoice_data(invoice, items, company, client):
+    """Build e-invoice data according to GST INV-01 schema"""
+    einvoice_data = {
+        "Version": "1.1",
+        "TranDtls": {
+            "TaxSch": "GST",
+            "SupTyp": "B2B",  # B2B, B2C, etc.
+            "IgstOnIntra": "N",  # Y if IGST, N if CGST+SGST
+            "RegRev": "N",
+            "EcmGstin": ""
+        },
+        "DocDtls": {
+            "Typ": "INV",  # INV=Invoice, CRN=Credit Note, DBN=Debit Note
+            "No": invoice.invoice_number,
+            "Dt": invoice.invoice_date.strftime("%d/%m/%Y")
+        },
+        "SellerDtls": _seller_details(company),
+        "BuyerDtls": {
+            "Gstin": client.gstin or "",
+            "LglNm": client.name,
+            "TrdNm": client.name,
+            "Pos": invoice.state_code or client.state_code or "",  # Place of Supply state code
+            "Addr1": client.address_line1 or "",
+            "Addr2": client.address_line2 or "",
+            "Loc": client.city or "",
+            "Pin": client.pin or "",
+            "Stcd": client.state_code or "",
+            "Ph": client.phone or "",
+            "Em": client.email or ""
+        },
+        "ItemList": [],
+        "ValDtls": {
+            "AssVal": money(invoice.subtotal - invoice.discount),
+            "CgstVal": money(invoice.cgst_amount),
+            "SgstVal": money(invoice.sgst_amount),
+            "IgstVal": ZERO,
+            "CesVal": ZERO,
+            "StCesVal": ZERO,
+            "Discount": money(invoice.discount),
+            "OthChrg": ZERO,
+            "RndOffAmt": ZERO,
+            "TotInvVal": money(invoice.total),
+            "TotInvValFc": money(invoice.total)
+        },
+        "PayDtls": {
+            "Nm": company.bank_name or "",
+            "AccDet": company.account_number or "",
+            "Mode": "",
+            "FinInsBr": company.ifsc_code or "",
+            "PayTerm": "",
+            "PayInstr": "",
+            "CrTrn": "",
+            "DirDr": "",
+            "CrDay": "",
+            "PaidAmt": ZERO,
+            "PaymtDue": money(invoice.total)
+        },
+        "RefDtls": {
+            "InvRm": "",
+            "DocPerdDtls": {
+                "InvStDt": invoice.invoice_date.strftime("%d/%m/%Y"),
+                "InvEndDt": invoice.due_date.strftime("%d/%m/%Y")
+            },
+            "PrecDocDtls": [],
+            "ContrDtls": []
+        },
+        "AddlDocDtls": [],
+        "ExpDtls": {},
+        "EwbDtls": {}
+    }
+
+    # Add items
+    for idx, item in enumerate(items, 1):
+        # Calculate tax values for item
+        item_taxable_amt = money(item.total)
+        item_cgst = money(item.total * invoice.cgst_rate / 100)
+        item_sgst = money(item.total * invoice.sgst_rate / 100)
+
+        item_data = {
+            "SlNo": str(idx),
+            "PrdDesc": item.description,
+            "IsServc": "Y",  # Y=Service, N=Goods
+            "HsnCd": item.sac_code or "",
+            "Barcde": "",
+            "Qty": item.quantity,
+            "FreeQty": ZERO,
+            "Unit": "",  # UOM code
+            "UnitPrice": money(item.rate),
+            "TotAmt": item_taxable_amt,
+            "Discount": ZERO,
+            "PreTaxVal": item_taxable_amt,
+            "AssAmt": item_taxable_amt,
+            "GstRt": invoice.tax_rate,
+            "IgstAmt": ZERO,
+            "CgstAmt": item_cgst,
+            "SgstAmt": item_sgst,
+            "CesRt": ZERO,
+            "CesAmt": ZERO,
+            "CesNonAdvlAmt": ZERO,
+            "StateCesRt": ZERO,
+            "StateCesAmt": ZERO,
+            "StateCesNonAdvlAmt": ZERO,
+            "OthChrg": ZERO,
+            "TotItemVal": item_taxable_amt + item_cgst + item_sgst,
+            "OrdLineRef": "",
+            "OrgCntry": "IN",
+            "PrdSlNo": "",
+            "BchDtls": {},
+            "AttribDtls": []
+        }
+        einvoice_data["ItemList"].append(item_data)
+
+    return einvoice_data
+
+
+def export_invoices_queryset(company, date_from, date_to):
+    """Issued (non-draft) invoices of a company in a date range, ready for bulk export"""
+    from .models import Invoice
+    return Invoice.objects.filter(
+        company=company,
+        invoice_date__gte=date_from,
+        invoice_date__lte=date_to,
+    ).exclude(status='DRAFT').select_related('company', 'client').prefetch_related('items').order_by('invoice_date', 'invoice_number')
+
+
+def iter_einvoice_export(invoices):
+    """
+    Stream a JSON array of INV-01 documents, one chunk per invoice.
+
+    `invoices` should come from export_invoices_queryset(); iterator() keeps at
+    most EXPORT_CHUNK_SIZE invoices (and their prefetched items) in memory.
+    """
+    yield '['
+    for index, invoice in enumerate(invoices.iterator(chunk_size=EXPORT_CHUNK_SIZE)):
+        data = build_einvoice_data(invoice, invoice.items.all(), invoice.company, invoice.client)
+        yield (',' if index else '') + dumps_json(data)
+    yield ']'
+
+
+# ==================== E-WAY BILL ====================
+
+EWAY_BILL_VERSION = "1.0.0421"
+
+
+def _eway_from_details(company):
+    return {
+        "userGstin": company.gstin or "",
+        "fromGstin": company.gstin or "",
+        "fromTrdName": company.name,
+        "fromAddr1": company.address_line1 or "",
+        "fromAddr2": company.address_line2 or "",
+        "fromPlace": company.city or "",
+        "fromPincode": company.pin or "",
+        "fromStateCode": company.state_code or "",
+        "actFromStateCode": company.state_code or "",  # Dispatch from the registered address
+    }
+
+
+def build_eway_bill(invoice, items, company, client):
+    """Build one `billLists` entry of the GSTN e-way bill JSON"""
+    from_details = _eway_from_details(company)
+
+    bill = {
+        "userGstin": from_details["userGstin"],
+        "supplyType": "O",  # O=Outward, I=Inward
+        "subSupplyType": "1",  # 1=Supply, 2=Import, etc.
+        "docType": "INV",  # INV=Invoice, CHL=Challan, etc.
+        "docNo": invoice.invoice_number,
+        "docDate": invoice.invoice_date.strftime("%d/%m/%Y"),
+        "fromGstin": from_details["fromGstin"],
+        "fromTrdName": from_details["fromTrdName"],
+        "fromAddr1": from_details["fromAddr1"],
+        "fromAddr2": from_details["fromAddr2"],
+        "fromPlace": from_details["fromPlace"],
+        "fromPincode": from_details["fromPincode"],
+        "fromStateCode": from_details["fromStateCode"],
+        "actFromStateCode": from_details["actFromStateCode"],
+        "toGstin": client.gstin or "URP",  # URP = unregistered person
+        "toTrdName": client.name,
+        "toAddr1": client.address_line1 or "",
+        "toAddr2": client.address_line2 or "",
+        "toPlace": client.city or "",
+        "toPincode": client.pin or "",
+        "toStateCode": client.state_code or "",
+        "actToStateCode": invoice.state_code or client.state_code or "",  # Place of supply
+        "transactionType": "1",  # 1=Regular, 2=Bill to Ship to
+        "otherValue": ZERO,
+        "totInvValue": money(invoice.total),
+        "cgstValue": money(invoice.cgst_amount),
+        "sgstValue": money(invoice.sgst_amount),
+        "igstValue": ZERO,
+        "cessValue": ZERO,
+        "transMode": "",  # 1=Road, 2=Rail, 3=Air, 4=Ship
+        "transDistance": "",
+        "transporterName": "",
+        "transporterId": "",
+        "transporterDocNo": "",
+        "transporterDocDate": "",
+        "vehicleNo": "",
+        "vehicleType": "",
+        "itemList": []
+    }
+
+    # Add items
+    for idx, item in enumerate(items, 1):
+        bill["itemList"].append({
+            "itemNo": idx,
+            "productName": item.description,
+            "productDesc": item.description,
+            "hsnCode": item.sac_code or "",
+            "qtyUnit": "",  # UOM code
+            "quantity": item.quantity,
+            "taxableAmount": money(item.total),
+            "igstRate": ZERO,
+            "igstValue": ZERO,
+            "cgstRate": invoice.cgst_rate,
+            "cgstValue": money(item.total * invoice.cgst_rate / 100),
+            "sgstRate": invoice.sgst_rate,
+            "sgstValue": money(item.total * invoice.sgst_rate / 100),
+            "cessRate": ZERO,
+            "cessValue": ZERO,
+            "cessNonAdvolValue": ZERO
+        })
+
+    return bill
+
+
+def build_eway_bill_data(invoice, items, company, client):
+    """Single-invoice e-way bill JSON (the billLists envelope with one bill)"""
+    return {
+        "version": EWAY_BILL_VERSION,
+        "billLists": [build_eway_bill(invoice, items, company, client)]
+    }
+
+
+def eway_bill_queryset(invoices):
+    """Prepare an invoice queryset for a bulk e-way bill export"""
+    return invoices.select_related('company', 'client').prefetch_related('items').order_by('invoice_date', 'invoice_number')
+
+
+def iter_eway_bill_export(invoices):
+    """
+    Stream one e-way bill JSON document whose `billLists` holds every invoice.
+
+    `invoices` should come from eway_bill_queryset(); like iter_einvoice_export
+    it is read in chunks of EXPORT_CHUNK_SIZE with items prefetched per chunk.
+    """
+    yield '{"version":' + json.dumps(EWAY_BILL_VERSION) + ',"billLists":['
+    for index, invoice in enumerate(invoices.iterator(chunk_size=EXPORT_CHUNK_SIZE)):
+        bill = build_eway_bill(invoice, invoice.items.all(), invoice.company, invoice.client)
+        yield (',' if index else '') + dumps_json(bill)
+    yield ']}'
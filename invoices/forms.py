@@ -3,9 +3,72 @@ from django.forms import inlineformset_factory
 from .models import (
     PurchaseOrder, POLineItem, Invoice, InvoiceItem, Client, Product, Company, CompanySettings, UOM, Payment
 )
+from . import reference_cache
+from .address_utils import ADDRESS_FIELDS, parse_address
+from .validation_utils import STATE_CODES
 from decimal import Decimal
 
 
+ADDRESS_WIDGETS = {
+    'address_line1': forms.TextInput(attrs={'class': 'form-control', 'maxlength': '100'}),
+    'address_line2': forms.TextInput(attrs={'class': 'form-control', 'maxlength': '100'}),
+    'city': forms.TextInput(attrs={'class': 'form-control', 'maxlength': '50'}),
+    'pin': forms.TextInput(attrs={'class': 'form-control', 'maxlength': '6', 'placeholder': 'e.g., 395003'}),
+    'state_code': forms.TextInput(attrs={'class': 'form-control', 'maxlength': '2', 'placeholder': 'e.g., 24 for Gujarat'}),
+}
+
+
+def _share_choices(forms_, field_name, queryset):
+    """
+    Run a select field's choice query once for a whole formset. Each form
+    would otherwise query (and build labels for) the same options again.
+    """
+    if not forms_:
+        return
+    field = forms_[0].fields[field_name]
+    field.queryset = queryset
+    choices = list(field.choices)
+    for form in forms_:
+        form.fields[field_name].queryset = queryset
+        form.fields[field_name].choices = choices
+
+
+def _cached_choices(field, choices):
+    """
+    Render a select field from (pk, label) choices kept in the reference
+    cache. The queryset is still used to validate a submitted value.
+    """
+    field.choices = ([('', field.empty_label)] if field.empty_label is not None else []) + choices
+
+
+class StructuredAddressFormMixin:
+    """Re-parse address_line1/2, city, pin and state_code when the address or GSTIN changes,
+    keeping any of them the user edited by hand."""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if 'address' in self.changed_data or 'gstin' in self.changed_data:
+            parsed = parse_address(cleaned_data.get('address'), cleaned_data.get('gstin'))
+            for field in ADDRESS_FIELDS:
+                if field not in self.changed_data:
+                    cleaned_data[field] = parsed[field]
+        return cleaned_data
+
+    def clean_pin(self):
+        pin = (self.cleaned_data.get('pin') or '').replace(' ', '')
+        if pin and (len(pin) != 6 or not pin.isdigit() or pin[0] == '0'):
+            raise forms.ValidationError('Enter a valid 6-digit PIN code.')
+        return pin
+
+    def clean_state_code(self):
+        state_code = (self.cleaned_data.get('state_code') or '').strip()
+        if len(state_code) == 1:
+            state_code = state_code.zfill(2)
+        if state_code and state_code not in STATE_CODES:
+            raise forms.ValidationError('Enter a valid GST state code (e.g., 24 for Gujarat).')
+        return state_code
+
+
 class PurchaseOrderForm(forms.ModelForm):
     class Meta:
         model = PurchaseOrder
@@ -23,6 +86,7 @@ class PurchaseOrderForm(forms.ModelForm):
         if user:
             # Filter companies for current user
             self.fields['company'].queryset = Company.objects.filter(user=user, is_active=True)
+            _cached_choices(self.fields['company'], reference_cache.company_choices(user.pk))
             # Set default company
             default_company = Company.get_default(user)
             if default_company:
@@ -46,6 +110,7 @@ class POLineItemForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Only show active UOMs
         self.fields['uom'].queryset = UOM.objects.filter(is_active=True).order_by('name')
+        _cached_choices(self.fields['uom'], reference_cache.uom_choices())
 
 
 POLineItemFormSet = inlineformset_factory(
@@ -92,6 +157,7 @@ class InvoiceForm(forms.ModelForm):
         if user:
             # Filter companies for current user
             self.fields['company'].queryset = Company.objects.filter(user=user, is_active=True)
+            _cached_choices(self.fields['company'], reference_cache.company_choices(user.pk))
             # Set default company
             default_company = Company.get_default(user)
             if default_company:
@@ -103,16 +169,18 @@ class InvoiceForm(forms.ModelForm):
                     self.fields['invoice_number'].help_text = 'Auto-generated from company prefix'
             
             # Filter PO reference by company
-            if self.instance and self.instance.pk and self.instance.company:
+            if self.instance and self.instance.pk and self.instance.company_id:
                 # Editing existing invoice - filter by invoice's company
                 self.fields['po_reference'].queryset = PurchaseOrder.objects.filter(
-                    company=self.instance.company
+                    company_id=self.instance.company_id
                 ).order_by('-created_at')
+                _cached_choices(self.fields['po_reference'], reference_cache.po_choices(self.instance.company_id))
             elif default_company:
                 # New invoice with default company - show POs for default company
                 self.fields['po_reference'].queryset = PurchaseOrder.objects.filter(
                     company=default_company
                 ).order_by('-created_at')
+                _cached_choices(self.fields['po_reference'], reference_cache.po_choices(default_company.pk))
             else:
                 # New invoice without default company - start with empty queryset
                 self.fields['po_reference'].queryset = PurchaseOrder.objects.none()
@@ -187,26 +255,21 @@ def get_invoice_item_formset(invoice=None, po_reference=None):
             if invoice:
                 for form in self.forms:
                     form._invoice = invoice
-                    # Update PO line item queryset based on invoice's PO reference
-                    if invoice.po_reference:
-                        form.fields['po_line_item'].queryset = POLineItem.objects.filter(
-                            purchase_order=invoice.po_reference
-                        ).order_by('subline_number')
-            elif po_ref:
-                # For new invoices, use the provided PO reference
-                for form in self.forms:
-                    form.fields['po_line_item'].queryset = POLineItem.objects.filter(
-                        purchase_order=po_ref
-                    ).order_by('subline_number')
+            if po_ref:
+                # Line items of the invoice's PO, or the provided one for new invoices
+                _share_choices(self.forms, 'po_line_item', POLineItem.objects.filter(
+                    purchase_order=po_ref
+                ).select_related('purchase_order').order_by('subline_number'))
     
     return InvoiceItemFormSetBase
 
 
-class ClientForm(forms.ModelForm):
+class ClientForm(StructuredAddressFormMixin, forms.ModelForm):
     class Meta:
         model = Client
-        fields = ['name', 'email', 'phone', 'address', 'gstin', 'is_active']
+        fields = ['name', 'email', 'phone', 'address', 'gstin', 'is_active', *ADDRESS_FIELDS]
         widgets = {
+            **ADDRESS_WIDGETS,
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'email': forms.EmailInput(attrs={'class': 'form-control'}),
             'phone': forms.TextInput(attrs={'class': 'form-control'}),
@@ -230,13 +293,14 @@ class ProductForm(forms.ModelForm):
         }
 
 
-class CompanyForm(forms.ModelForm):
+class CompanyForm(StructuredAddressFormMixin, forms.ModelForm):
     class Meta:
         model = Company
-        fields = ['name', 'gstin', 'pan', 'cin', 'address', 'email', 'phone',
+        fields = ['name', 'gstin', 'pan', 'cin', 'address', *ADDRESS_FIELDS, 'email', 'phone',
                   'invoice_prefix', 'default_due_days', 'default_tax_rate', 'currency',
                   'bank_name', 'account_number', 'ifsc_code', 'branch', 'stamp', 'is_default']
         widgets = {
+            **ADDRESS_WIDGETS,
             'name': forms.TextInput(attrs={'class': 'form-control', 'required': True}),
             'gstin': forms.TextInput(attrs={'class': 'form-control'}),
             'pan': forms.TextInput(attrs={'class': 'form-control'}),
@@ -345,6 +409,57 @@ class PaymentForm(forms.ModelForm):
         return cleaned_data
 
 
+class ReceiptForm(forms.Form):
+    """One customer remittance to spread over several invoices"""
+    payment_date = forms.DateField(widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
+    amount = forms.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal('0.01'), help_text="Amount received",
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
+    )
+    tds_percentage = forms.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal('0'), max_value=Decimal('100'), required=False, label='TDS %',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0', 'max': '100'}),
+    )
+    tds_amount = forms.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal('0'), required=False, label='TDS Deducted',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
+    )
+    fine_amount = forms.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal('0'), required=False, label='Fine/Penalty',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01', 'min': '0'}),
+    )
+    payment_method = forms.ChoiceField(
+        choices=Payment.PAYMENT_METHOD_CHOICES, initial='BANK_TRANSFER',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    reference_number = forms.CharField(
+        max_length=100, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Transaction/Cheque Number'}),
+    )
+    bank_name = forms.CharField(
+        max_length=200, required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Bank Name'}),
+    )
+    remarks = forms.CharField(
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 2, 'placeholder': 'Additional remarks'}),
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        amount = cleaned_data.get('amount') or Decimal('0')
+        for field in ('tds_percentage', 'tds_amount', 'fine_amount'):
+            cleaned_data[field] = cleaned_data.get(field) or Decimal('0')
+        
+        # Auto-calculate TDS if percentage is provided
+        if cleaned_data['tds_percentage'] > 0 and cleaned_data['tds_amount'] == 0:
+            cleaned_data['tds_amount'] = (amount * cleaned_data['tds_percentage'] / 100).quantize(Decimal('0.01'))
+        
+        if amount and amount - cleaned_data['tds_amount'] - cleaned_data['fine_amount'] <= 0:
+            raise forms.ValidationError('Net amount must be positive after TDS and fine.')
+        return cleaned_data
+
+
 class UOMForm(forms.ModelForm):
     class Meta:
         model = UOM
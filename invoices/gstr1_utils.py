@@ -0,0 +1,252 @@
+"""
+GSTR-1 (outward supplies) return for a company and month
+
+Every section is one grouped query over Invoice / InvoiceItem, so the cost is
+a few index scans regardless of how many line items the month has:
+
+- B2B: invoices to registered recipients (client GSTIN present)
+- B2CS: supplies to unregistered recipients by place of supply and rate
+- HSN: line items by SAC/HSN code and rate
+"""
+import calendar
+import csv
+import io
+import zipfile
+from datetime import date
+from django.db.models import Case, DecimalField, F, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, NullIf
+from .einvoice_utils import ZERO, dumps_json, money
+from .validation_utils import STATE_CODES
+
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+# Services carry no unit of quantity on the portal
+SERVICE_UQC = 'NA'
+
+
+def month_period(year, month):
+    """First and last day of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def gstr1_invoices(company, date_from, date_to):
+    """Issued (non-draft) invoices of a company in the return period"""
+    from .models import Invoice
+    return Invoice.objects.filter(
+        company=company,
+        invoice_date__gte=date_from,
+        invoice_date__lte=date_to,
+    ).exclude(status='DRAFT')
+
+
+def _registered():
+    return Q(client__gstin__isnull=False) & ~Q(client__gstin='')
+
+
+def _place_of_supply():
+    # Invoice place of supply, else the recipient's state
+    return Coalesce(NullIf('state_code', Value('')), NullIf('client__state_code', Value('')), Value(''))
+
+
+def b2b_rows(invoices):
+    """One row per invoice to a registered recipient, ordered by recipient GSTIN"""
+    rows = invoices.filter(_registered()).annotate(
+        pos=_place_of_supply(),
+        txval=F('subtotal') - F('discount'),
+    ).values(
+        'invoice_number', 'invoice_date', 'total', 'tax_rate', 'cgst_amount', 'sgst_amount',
+        'reverse_charge', 'pos', 'txval', 'client__gstin', 'client__name',
+    ).order_by('client__gstin', 'invoice_date', 'invoice_number')
+
+    return [{
+        'ctin': row['client__gstin'],
+        'name': row['client__name'],
+        'inum': row['invoice_number'],
+        'idt': row['invoice_date'],
+        'val': money(row['total']),
+        'pos': row['pos'],
+        'rchrg': 'Y' if row['reverse_charge'] else 'N',
+        'rt': row['tax_rate'],
+        'txval': money(row['txval']),
+        'iamt': ZERO,
+        'camt': money(row['cgst_amount']),
+        'samt': money(row['sgst_amount']),
+        'csamt': ZERO,
+    } for row in rows]
+
+
+def b2cs_rows(invoices, supplier_state):
+    """Unregistered supplies summed by place of supply and rate"""
+    rows = invoices.exclude(_registered()).annotate(pos=_place_of_supply()).values('pos', 'tax_rate').annotate(
+        txval=Sum(F('subtotal') - F('discount'), output_field=AMOUNT),
+        camt=Sum('cgst_amount'),
+        samt=Sum('sgst_amount'),
+    ).order_by('pos', 'tax_rate')
+
+    return [{
+        'sply_ty': 'INTRA' if not row['pos'] or row['pos'] == supplier_state else 'INTER',
+        'pos': row['pos'],
+        'typ': 'OE',
+        'rt': row['tax_rate'],
+        'txval': money(row['txval']),
+        'iamt': ZERO,
+        'camt': money(row['camt']),
+        'samt': money(row['samt']),
+        'csamt': ZERO,
+    } for row in rows]
+
+
+def hsn_rows(invoices):
+    """Line items summed by SAC/HSN code and rate; invoice discounts are apportioned by item value"""
+    from .models import InvoiceItem
+    item_txval = F('total') - Case(
+        When(invoice__subtotal__gt=0, then=F('total') * F('invoice__discount') / F('invoice__subtotal')),
+        default=Value(ZERO),
+        output_field=AMOUNT,
+    )
+    rows = InvoiceItem.objects.filter(invoice__in=invoices).alias(item_txval=item_txval).values(
+        'sac_code', rt=F('invoice__tax_rate'),
+    ).annotate(
+        desc=Min('description'),
+        qty=Sum('quantity'),
+        txval=Sum('item_txval', output_field=AMOUNT),
+        camt=Sum(F('item_txval') * F('invoice__cgst_rate') / 100, output_field=AMOUNT),
+        samt=Sum(F('item_txval') * F('invoice__sgst_rate') / 100, output_field=AMOUNT),
+    ).order_by('sac_code', 'rt')
+
+    result = []
+    for num, row in enumerate(rows, 1):
+        txval, camt, samt = money(row['txval']), money(row['camt']), money(row['samt'])
+        result.append({
+            'num': num,
+            'hsn_sc': row['sac_code'] or '',
+            'desc': (row['desc'] or '')[:30],
+            'uqc': SERVICE_UQC,
+            'qty': row['qty'],
+            'rt': row['rt'],
+            'val': txval + camt + samt,
+            'txval': txval,
+            'iamt': ZERO,
+            'camt': camt,
+            'samt': samt,
+            'csamt': ZERO,
+        })
+    return result
+
+
+def build_gstr1(company, year, month):
+    """All GSTR-1 sections for a month as flat rows"""
+    date_from, date_to = month_period(year, month)
+    invoices = gstr1_invoices(company, date_from, date_to)
+    return {
+        'company': company,
+        'gstin': company.gstin or '',
+        'fp': f'{month:02d}{year}',
+        'date_from': date_from,
+        'date_to': date_to,
+        'b2b': b2b_rows(invoices),
+        'b2cs': b2cs_rows(invoices, company.state_code or ''),
+        'hsn': hsn_rows(invoices),
+    }
+
+
+# ==================== EXPORTS ====================
+
+def gstr1_portal_json(report):
+    """GSTR-1 JSON in the GST offline tool format"""
+    b2b = []
+    for row in report['b2b']:
+        if not b2b or b2b[-1]['ctin'] != row['ctin']:
+            b2b.append({'ctin': row['ctin'], 'inv': []})
+        b2b[-1]['inv'].append({
+            'inum': row['inum'],
+            'idt': row['idt'].strftime('%d-%m-%Y'),
+            'val': row['val'],
+            'pos': row['pos'],
+            'rchrg': row['rchrg'],
+            'inv_typ': 'R',
+            'itms': [{
+                # Item number convention: rate * 100 + 1
+                'num': int(row['rt'] * 100) + 1,
+                'itm_det': {key: row[key] for key in ('txval', 'rt', 'iamt', 'camt', 'samt', 'csamt')},
+            }],
+        })
+
+    return dumps_json({
+        'gstin': report['gstin'],
+        'fp': report['fp'],
+        'b2b': b2b,
+        'b2cs': report['b2cs'],
+        'hsn': {'data': report['hsn']},
+    })
+
+
+def _state_label(code):
+    return f"{code}-{STATE_CODES[code]}" if code in STATE_CODES else code
+
+
+def _csv(header, rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return output.getvalue()
+
+
+def gstr1_csv_files(report):
+    """{filename: CSV text} with the offline tool's column headings"""
+    return {
+        'b2b.csv': _csv(
+            ['GSTIN/UIN of Recipient', 'Receiver Name', 'Invoice Number', 'Invoice date', 'Invoice Value',
+             'Place Of Supply', 'Reverse Charge', 'Invoice Type', 'Rate', 'Taxable Value', 'Cess Amount'],
+            ([row['ctin'], row['name'], row['inum'], row['idt'].strftime('%d-%b-%Y'), row['val'],
+              _state_label(row['pos']), row['rchrg'], 'Regular', row['rt'], row['txval'], row['csamt']]
+             for row in report['b2b']),
+        ),
+        'b2cs.csv': _csv(
+            ['Type', 'Place Of Supply', 'Rate', 'Taxable Value', 'Cess Amount'],
+            ([row['typ'], _state_label(row['pos']), row['rt'], row['txval'], row['csamt']]
+             for row in report['b2cs']),
+        ),
+        'hsn.csv': _csv(
+            ['HSN', 'Description', 'UQC', 'Total Quantity', 'Total Value', 'Taxable Value',
+             'Integrated Tax Amount', 'Central Tax Amount', 'State/UT Tax Amount', 'Cess Amount'],
+            ([row['hsn_sc'], row['desc'], row['uqc'], row['qty'], row['val'], row['txval'],
+              row['iamt'], row['camt'], row['samt'], row['csamt']]
+             for row in report['hsn']),
+        ),
+    }
+
+
+def gstr1_zip(report):
+    """ZIP bytes with the portal JSON and one CSV per section"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f"GSTR1_{report['gstin'] or 'NA'}_{report['fp']}.json", gstr1_portal_json(report))
+        for filename, content in gstr1_csv_files(report).items():
+            archive.writestr(filename, content)
+    return buffer.getvalue()
+
+
+def b2b_by_recipient(rows):
+    """Invoice count and totals per recipient GSTIN, largest first"""
+    recipients = {}
+    for row in rows:
+        entry = recipients.setdefault(row['ctin'], {'ctin': row['ctin'], 'name': row['name'], 'count': 0, 'val': ZERO, 'txval': ZERO, 'tax': ZERO})
+        entry['count'] += 1
+        entry['val'] += row['val']
+        entry['txval'] += row['txval']
+        entry['tax'] += row['camt'] + row['samt'] + row['iamt']
+    return sorted(recipients.values(), key=lambda entry: entry['val'], reverse=True)
+
+
+def gstr1_totals(report):
+    """Taxable value and tax per section for the report summary"""
+    totals = {}
+    for section in ('b2b', 'b2cs', 'hsn'):
+        rows = report[section]
+        totals[section] = {
+            'txval': sum((row['txval'] for row in rows), ZERO),
+            'tax': sum((row['camt'] + row['samt'] + row['iamt'] for row in rows), ZERO),
+        }
+    return totals
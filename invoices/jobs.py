@@ -0,0 +1,205 @@
+"""
+Database-backed background jobs
+
+Handlers are registered with @job_handler and executed by the run_jobs
+management command. Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED,
+so any number of worker processes can share the same table.
+
+While a handler runs, a heartbeat thread refreshes the job's locked_at every
+JOB_HEARTBEAT_SECONDS. Only a job whose heartbeat has stopped for
+JOB_LOCK_TIMEOUT, because its worker died, is claimed again. A worker that
+was only stalled and finishes after that is not the job's owner any more:
+its outcome is dropped instead of overwriting the new run.
+"""
+import os
+import socket
+import threading
+from io import StringIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Job
+
+
+JOB_HANDLERS = {}
+
+# Outcome of a run that finished after another worker had claimed the job
+LOST_CLAIM = 'Claimed again by another worker; this run was dropped'
+
+
+def job_handler(name, queue='default', priority=100):
+    """Register a function as the handler for jobs called `name`"""
+    def decorator(func):
+        JOB_HANDLERS[name] = {'func': func, 'queue': queue, 'priority': priority}
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, user=None, queue=None, priority=None, run_at=None, max_attempts=None):
+    """Create a queued job for a registered handler"""
+    if name not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job handler: {name}')
+    handler = JOB_HANDLERS[name]
+    job = Job(
+        name=name,
+        queue=queue or handler['queue'],
+        priority=handler['priority'] if priority is None else priority,
+        payload=payload or {},
+        created_by=user,
+    )
+    if run_at is not None:
+        job.run_at = run_at
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    job.save()
+    return job
+
+
+def worker_id():
+    """Identify this worker thread in Job.locked_by"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_job(queue, locked_by=None):
+    """Lock and mark RUNNING the next due job in `queue`, or return None"""
+    now = timezone.now()
+    lock_timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', 600)
+    stale_before = now - timezone.timedelta(seconds=lock_timeout)
+
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status='QUEUED', run_at__lte=now) |
+            # No heartbeat for too long: the worker that claimed it has died
+            Q(status='RUNNING', locked_at__lt=stale_before),
+            queue=queue,
+        ).order_by('priority', 'run_at', 'id').first()
+        if job is None:
+            return None
+
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.locked_at = now
+        job.locked_by = locked_by or worker_id()
+        job.started_at = now
+        job.save(update_fields=['status', 'attempts', 'locked_at', 'locked_by', 'started_at'])
+    return job
+
+
+class Heartbeat:
+    """Context manager refreshing a claimed job's locked_at from a background thread"""
+
+    def __init__(self, job, interval=None):
+        self.job = job
+        self.interval = interval or getattr(settings, 'JOB_HEARTBEAT_SECONDS', 60)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def beat(self):
+        """Refresh locked_at; False once the job is no longer running under this worker"""
+        return Job.objects.filter(
+            pk=self.job.pk, status='RUNNING', locked_by=self.job.locked_by,
+        ).update(locked_at=timezone.now()) == 1
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not self.beat():
+                        break
+                except DatabaseError:
+                    # Try again on the next beat with a fresh connection
+                    connection.close()
+        finally:
+            # The thread has its own database connection
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_job(job):
+    """Execute a claimed job and record the outcome. Returns True on success, False on failure or a lost claim."""
+    handler = JOB_HANDLERS.get(job.name)
+    if handler is None:
+        job.mark_failed(f'Unknown job handler: {job.name}', retry=False)
+        return False
+    if job.attempts > job.max_attempts:
+        job.mark_failed('Worker was lost while running this job', retry=False)
+        return False
+
+    try:
+        with Heartbeat(job):
+            result = handler['func'](job, **job.payload)
+    except Exception as e:
+        if not job.mark_failed(f'{type(e).__name__}: {e}'):
+            job.last_error = LOST_CLAIM
+        return False
+
+    if not job.mark_done(result):
+        if job.result_file:
+            job.result_file.delete(save=False)
+        job.last_error = LOST_CLAIM
+        return False
+    return True
+
+
+# ==================== HANDLERS ====================
+
+@job_handler('invoice_pdf', queue='pdf')
+def invoice_pdf_job(job, invoice_id):
+    """Render an invoice PDF into job.result_file"""
+    from .models import Invoice
+    from .pdf_utils import build_invoice_pdf
+
+    invoice = Invoice.objects.select_related('company', 'client').get(pk=invoice_id)
+    pdf_bytes = build_invoice_pdf(invoice, invoice.items.all(), invoice.company, invoice.client)
+    job.result_file.save(f'Invoice_{invoice.invoice_number}.pdf', ContentFile(pdf_bytes), save=False)
+    return {'invoice_number': invoice.invoice_number, 'size': len(pdf_bytes)}
+
+
+@job_handler('einvoice_json', queue='default')
+def einvoice_json_job(job, invoice_id):
+    """Build an invoice's INV-01 JSON into job.result_file"""
+    from .models import Invoice
+    from .einvoice_utils import build_einvoice_data, dumps_json
+
+    invoice = Invoice.objects.select_related('company', 'client').get(pk=invoice_id)
+    data = build_einvoice_data(invoice, invoice.items.all(), invoice.company, invoice.client)
+    content = dumps_json(data).encode('utf-8')
+    job.result_file.save(f'einvoice_{invoice.invoice_number}.json', ContentFile(content), save=False)
+    return {'invoice_number': invoice.invoice_number, 'size': len(content)}
+
+
+@job_handler('invoice_reminders', queue='email', priority=50)
+def invoice_reminders_job(job, days_before=3, days_after=0):
+    """Run the send_invoice_reminders command as a job"""
+    from django.core.management import call_command
+
+    output = StringIO()
+    call_command('send_invoice_reminders', days_before=days_before, days_after=days_after, stdout=output)
+    return {'output': output.getvalue()[-2000:]}
+
+
+@job_handler('deliver_outbox', queue='email', priority=10)
+def deliver_outbox_job(job, batch_size=20):
+    """Deliver due OTP and transactional emails from the EmailOutbox"""
+    from django.core.management import call_command
+
+    output = StringIO()
+    call_command('process_outbox', once=True, batch_size=batch_size, stdout=output)
+    return {'output': output.getvalue()[-2000:]}
+
+
+@job_handler('explain_slow_queries', queue='default', priority=200)
+def explain_slow_queries_job(job, queries, view_name='', method='', path=''):
+    """EXPLAIN the slow queries captured in one request into SlowQuery rows"""
+    from .slow_queries import record
+
+    return {'captured': len(queries), 'explained': record(queries, view_name, method, path)}
@@ -0,0 +1,270 @@
+"""
+Management command to benchmark the main views end to end
+
+Requests go through the full middleware stack with Django's test client,
+logged in as a seeded user (see seed_bulk). For every scenario it reports
+latency percentiles, SQL queries and response bytes per request. A run can
+be saved as a baseline JSON; later runs compared with it fail on a
+regression, so the command can gate a deploy.
+
+Create and edit invoice run inside a transaction that is rolled back, so
+the dataset is the same for every run.
+"""
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from invoices import bench_utils
+from invoices.forms import InvoiceForm, get_invoice_item_formset
+from invoices.middleware import QueryRecorder, RequestStats
+from invoices.models import Company, Invoice
+
+User = get_user_model()
+
+# metric: (relative, absolute) growth that counts as a regression
+TOLERANCES = {
+    'p50_ms': (0.2, 2.0),
+    'p95_ms': (0.2, 5.0),
+    'queries': (0, 0),
+    'bytes': (0.1, 1024),
+}
+
+
+def form_data(form):
+    """POST data that resubmits a form with its current values"""
+    data = {}
+    for bound in form:
+        value = bound.value()
+        if value is None or value is False or isinstance(value, File):
+            continue
+        if value is True:
+            value = 'on'
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        data[bound.html_name] = str(value)
+    return data
+
+
+def invoice_post_data(invoice, user, copy=False):
+    """
+    Invoice form and item formset data as the edit page would post it. With
+    copy=True it creates a new invoice instead: the company's next number
+    (as the create page fills in), no item ids and no PO link, since the
+    original already bills those PO quantities.
+    """
+    form = InvoiceForm(instance=invoice, user=user)
+    formset = get_invoice_item_formset(invoice=invoice)(instance=invoice)
+    item_forms = formset.forms[:formset.initial_form_count()]
+    data = form_data(form)
+    for item_form in item_forms:
+        data.update(form_data(item_form))
+    data[f'{formset.prefix}-TOTAL_FORMS'] = str(len(item_forms))
+    data[f'{formset.prefix}-INITIAL_FORMS'] = '0' if copy else str(len(item_forms))
+    if copy:
+        for key in [key for key in data if key == 'po_reference' or key.endswith(('-id', '-invoice', '-po_line_item'))]:
+            del data[key]
+        data['invoice_number'] = invoice.company.get_next_invoice_number()
+    return data
+
+
+def build_scenarios(user, invoice):
+    """[(name, method, url, expected status, POST data)]"""
+    purchase_order = invoice.po_reference
+    line = purchase_order.subline_items.order_by('subline_number').first()
+    company_id = invoice.company_id
+    return [
+        ('dashboard', 'get', reverse('invoices:dashboard'), 200, None),
+        ('invoice_list', 'get', reverse('invoices:invoice_list'), 200, None),
+        ('invoice_detail', 'get', reverse('invoices:invoice_detail', args=[invoice.pk]), 200, None),
+        ('invoice_pdf', 'get', reverse('invoices:invoice_pdf', args=[invoice.pk]), 200, None),
+        ('einvoice_data', 'get', reverse('invoices:einvoice_data', args=[invoice.pk]), 200, None),
+        ('api_company_pos', 'get', reverse('invoices:api_company_pos', args=[company_id]), 200, None),
+        ('api_company_next_invoice_number', 'get',
+         reverse('invoices:api_company_next_invoice_number', args=[company_id]), 200, None),
+        ('api_po_line_items', 'get', reverse('invoices:api_po_line_items', args=[purchase_order.pk]), 200, None),
+        ('api_po_line_item_detail', 'get', reverse('invoices:api_po_line_item_detail', args=[line.pk]), 200, None),
+        ('create_invoice_form', 'get', reverse('invoices:create_invoice'), 200, None),
+        ('create_invoice', 'post', reverse('invoices:create_invoice'), 302, invoice_post_data(invoice, user, copy=True)),
+        ('edit_invoice_form', 'get', reverse('invoices:edit_invoice', args=[invoice.pk]), 200, None),
+        ('edit_invoice', 'post', reverse('invoices:edit_invoice', args=[invoice.pk]), 302, invoice_post_data(invoice, user)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the main views: latency percentiles, queries and bytes per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bulk_user_001', help='Username to run as (default: bulk_user_001 from seed_bulk)')
+        parser.add_argument('--invoice', type=int, help="Invoice ID to use (default: the user's latest invoice with a PO)")
+        parser.add_argument('--requests', type=int, default=30, help='Timed requests per scenario (default: 30)')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per scenario first (default: 3)')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='Client threads sending requests at once (default: 1); SQLite cannot run the write scenarios concurrently')
+        parser.add_argument('--only', help='Comma-separated scenario names to run')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every request (the shared cache: not against a live server)')
+        parser.add_argument('--baseline', help='Compare with this baseline JSON and fail on regressions')
+        parser.add_argument('--save-baseline', help='Write the results to this baseline JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found; seed a dataset with seed_bulk or pass --user")
+        invoice = self.pick_invoice(user, options['invoice'])
+        scenarios = build_scenarios(user, invoice)
+        if options['only']:
+            wanted = set(options['only'].split(','))
+            unknown = wanted - {scenario[0] for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Unknown scenario(s): {", ".join(sorted(unknown))}')
+            scenarios = [scenario for scenario in scenarios if scenario[0] in wanted]
+        baseline = bench_utils.load_baseline(options['baseline']) if options['baseline'] else None
+        dataset = {'invoices': Invoice.objects.count()}
+        run_options = {key: options[key] for key in ('requests', 'warmup', 'concurrency', 'cold')}
+        baseline_options = baseline.get('options', {}) if baseline else {}
+        comparable = (baseline_options.get('concurrency'), baseline_options.get('cold')) == (options['concurrency'], options['cold'])
+        if baseline and (baseline.get('dataset') != dataset or not comparable):
+            self.stdout.write(self.style.WARNING(
+                f"The baseline was measured with {baseline.get('dataset')} and {baseline.get('options')}; "
+                'differences may not be regressions'
+            ))
+
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG is on; timings will be slower than in production'))
+        self.stdout.write(
+            f'{invoice.invoice_number} ({invoice.items.count()} items) of {invoice.company}, as {user.username}: '
+            f'{options["requests"]} requests x {options["concurrency"]} thread(s) per scenario\n'
+        )
+
+        # Keep the run out of the metrics, the profiler and the slow request log
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], METRICS_ENABLED=False,
+            PROFILING_ENABLED=False, SLOW_REQUEST_MS=10 ** 9,
+        ):
+            clients = []
+            for _ in range(options['concurrency']):
+                client = Client()
+                client.force_login(user)
+                clients.append(client)
+            self.stdout.write(
+                f'{"Scenario":<34}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"bytes":>11}{"req/s":>8}'
+                + ('   vs baseline' if baseline else '')
+            )
+            results = {}
+            for scenario in scenarios:
+                results[scenario[0]] = self.run_scenario(scenario, clients, options)
+                self.report(scenario[0], results[scenario[0]], baseline['results'] if baseline else None)
+            self.stdout.write('')
+
+        if options['save_baseline']:
+            bench_utils.save_baseline(options['save_baseline'], results, dataset=dataset, options=run_options)
+            self.stdout.write(self.style.SUCCESS(f"✓ Baseline written to {options['save_baseline']}"))
+        if baseline:
+            regressions = [row for row in bench_utils.compare(results, baseline['results'], TOLERANCES) if row['regressed']]
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'✓ No regressions against {options["baseline"]}'))
+
+    def pick_invoice(self, user, invoice_id):
+        invoices = Invoice.objects.filter(company__in=Company.objects.filter(user=user)).select_related('company', 'po_reference')
+        if invoice_id:
+            invoice = invoices.filter(pk=invoice_id).first()
+        else:
+            invoice = invoices.filter(po_reference__isnull=False).exclude(status='DRAFT').order_by('-invoice_date', '-pk').first()
+        if invoice is None or invoice.po_reference is None:
+            raise CommandError(f'{user.username} has no invoice with a PO to benchmark; seed data with seed_bulk')
+        return invoice
+
+    def request(self, client, scenario, cold):
+        """(seconds, queries, bytes) of one request, including reading a streamed body"""
+        name, method, url, expected, data = scenario
+        if cold:
+            cache.clear()
+        stats = RequestStats()
+        recorder = QueryRecorder(stats)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if method == 'post':
+                stack.enter_context(transaction.atomic())
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+            response.close()
+            if method == 'post':
+                transaction.set_rollback(True)
+        if response.status_code != expected:
+            raise CommandError(f'{name}: {method.upper()} {url} returned {response.status_code}, expected {expected}')
+        return elapsed, stats.query_count, len(body)
+
+    def run_scenario(self, scenario, clients, options):
+        samples = []
+        errors = []
+
+        def worker(client, count, warmup):
+            try:
+                for _ in range(warmup):
+                    self.request(client, scenario, options['cold'])
+                for _ in range(count):
+                    samples.append(self.request(client, scenario, options['cold']))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connections.close_all()
+
+        # Split the requests over the clients, one thread per client
+        shares = [options['requests'] // len(clients) + (index < options['requests'] % len(clients))
+                  for index in range(len(clients))]
+        started = time.perf_counter()
+        if len(clients) == 1:
+            worker(clients[0], shares[0], options['warmup'])
+        else:
+            threads = [threading.Thread(target=worker, args=(client, share, options['warmup']))
+                       for client, share in zip(clients, shares)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - started
+        if errors:
+            if isinstance(errors[0], CommandError):
+                raise errors[0]
+            raise CommandError(f'{scenario[0]}: {errors[0]!r}') from errors[0]
+
+        result = bench_utils.summarize([elapsed for elapsed, _, _ in samples])
+        result['queries'] = max(queries for _, queries, _ in samples)
+        result['bytes'] = round(sum(size for _, _, size in samples) / len(samples))
+        result['requests_per_s'] = round(len(samples) / wall, 1) if wall else 0.0
+        return result
+
+    def report(self, name, result, baseline):
+        line = (
+            f'{name:<34}{result["p50_ms"]:>9.1f}{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}'
+            f'{result["queries"]:>9}{result["bytes"]:>11,}{result["requests_per_s"]:>8.1f}'
+        )
+        if baseline is None:
+            self.stdout.write(line)
+            return
+        if name not in baseline:
+            self.stdout.write(f'{line}   (new)')
+            return
+        rows = bench_utils.compare({name: result}, baseline, TOLERANCES)
+        p95 = next((row for row in rows if row['metric'] == 'p95_ms'), None)
+        if p95 is not None:
+            line += f'   p95 {p95["change"]:+.0%}'
+        regressed = [row for row in rows if row['regressed']]
+        if regressed:
+            details = ', '.join(f'{row["metric"]} {row["baseline"]} → {row["current"]}' for row in regressed)
+            self.stdout.write(self.style.ERROR(f'{line}   ✗ {details}'))
+        else:
+            self.stdout.write(line)
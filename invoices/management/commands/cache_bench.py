@@ -0,0 +1,151 @@
+"""
+Management command to benchmark cache backends against each other
+
+Each backend gets a fresh, empty location in a temporary directory and is
+measured in two ways:
+
+- latency of single operations (get hit/miss, set, add, incr, get_many,
+  delete) in this process;
+- what other processes see: whether a value set here is visible to a
+  forked worker, whether concurrent incr() calls from --processes workers
+  lose updates, and the combined get throughput of those workers.
+
+LocMemCache is fast but private to each process, and FileBasedCache is
+shared but increments with a read and a write. SQLiteCache should be
+shared and exact.
+"""
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from invoices import bench_utils
+from invoices.cache_backends import SQLiteCache
+
+
+BACKENDS = {
+    'locmem': lambda directory, params: LocMemCache('cache-bench', params),
+    'file': lambda directory, params: FileBasedCache(str(directory / 'file'), params),
+    'sqlite': lambda directory, params: SQLiteCache(str(directory / 'sqlite' / 'cache.sqlite3'), params),
+}
+
+
+def time_op(func, count):
+    """Durations in seconds of `count` calls of func(i)"""
+    durations = []
+    for i in range(count):
+        started = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def run_operations(cache, value, count):
+    """{operation: durations} for single operations on one backend"""
+    cache.set('hit', value)
+    cache.set('counter', 0)
+    keys = [f'many:{i}' for i in range(10)]
+    cache.set_many({key: value for key in keys})
+    return {
+        'set': time_op(lambda i: cache.set(f'set:{i}', value), count),
+        'get (hit)': time_op(lambda i: cache.get('hit'), count),
+        'get (miss)': time_op(lambda i: cache.get(f'missing:{i}'), count),
+        'add (exists)': time_op(lambda i: cache.add('hit', value), count),
+        'incr': time_op(lambda i: cache.incr('counter'), count),
+        'get_many (10)': time_op(lambda i: cache.get_many(keys), count),
+        'delete': time_op(lambda i: cache.delete(f'set:{i}'), count),
+    }
+
+
+def worker(cache, increments, reads, results):
+    """Runs in a forked process: report what it sees, then increment and read"""
+    visible = cache.get('probe') == 'from parent'
+    cache.set(f'probe:{multiprocessing.current_process().pid}', 'from child')
+    for _ in range(increments):
+        cache.incr('shared_counter')
+    started = time.perf_counter()
+    for _ in range(reads):
+        cache.get('probe')
+    results.put((visible, time.perf_counter() - started))
+
+
+def run_processes(cache, processes, increments, reads):
+    """(children saw parent's value, parent saw children's values, increments expected, counter value, reads/s)"""
+    context = multiprocessing.get_context('fork')
+    cache.set('probe', 'from parent')
+    cache.set('shared_counter', 0)
+    results = context.Queue()
+    children = [context.Process(target=worker, args=(cache, increments, reads, results)) for _ in range(processes)]
+    for child in children:
+        child.start()
+    outcomes = [results.get(timeout=600) for _ in children]
+    for child in children:
+        child.join()
+    seen_by_parent = all(cache.get(f'probe:{child.pid}') == 'from child' for child in children)
+    read_time = max(duration for _, duration in outcomes)
+    return (
+        all(visible for visible, _ in outcomes),
+        seen_by_parent,
+        processes * increments,
+        cache.get('shared_counter'),
+        processes * reads / read_time if read_time else 0.0,
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark LocMemCache, FileBasedCache and SQLiteCache: latency, cross-process visibility and incr'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000, help='Calls per operation (default: 2000)')
+        parser.add_argument('--items', type=int, default=20,
+                            help='Size of the cached value, as (pk, label) choices (default: 20)')
+        parser.add_argument('--processes', type=int, default=3, help='Forked worker processes (default: 3)')
+        parser.add_argument('--increments', type=int, default=500, help='incr() calls per worker (default: 500)')
+        parser.add_argument('--reads', type=int, default=2000, help='get() calls per worker (default: 2000)')
+        parser.add_argument('--backends', default=','.join(BACKENDS),
+                            help=f'Comma-separated backends to compare (default: {",".join(BACKENDS)})')
+
+    def handle(self, *args, **options):
+        names = options['backends'].split(',')
+        unknown = set(names) - set(BACKENDS)
+        if unknown:
+            raise CommandError(f'Unknown backend(s): {", ".join(sorted(unknown))}')
+        if options['ops'] < 1 or options['processes'] < 1:
+            raise CommandError('--ops and --processes must be at least 1')
+
+        value = [(pk, f'Unit of measure {pk}') for pk in range(1, options['items'] + 1)]
+        params = {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': max(options['ops'] * 2, 1000)}}
+
+        with tempfile.TemporaryDirectory(prefix='cache-bench-') as directory:
+            caches = {name: BACKENDS[name](Path(directory), params) for name in names}
+
+            self.stdout.write(f'{options["ops"]} calls per operation, value of {options["items"]} choices\n')
+            self.stdout.write(f'{"Backend":<10}{"Operation":<16}{"p50 µs":>10}{"p95 µs":>10}{"p99 µs":>10}{"ops/s":>12}')
+            for name, cache in caches.items():
+                for operation, durations in run_operations(cache, value, options['ops']).items():
+                    result = bench_utils.summarize(durations)
+                    self.stdout.write(
+                        f'{name:<10}{operation:<16}{result["p50_ms"] * 1000:>10.1f}{result["p95_ms"] * 1000:>10.1f}'
+                        f'{result["p99_ms"] * 1000:>10.1f}{len(durations) / sum(durations):>12,.0f}'
+                    )
+                self.stdout.write('')
+
+            self.stdout.write(
+                f'{options["processes"]} forked processes, {options["increments"]} incr() and '
+                f'{options["reads"]} get() calls each\n'
+            )
+            self.stdout.write(f'{"Backend":<10}{"Shared":>8}{"incr() total":>22}{"get/s (all)":>14}')
+            for name, cache in caches.items():
+                to_child, to_parent, expected, got, reads_per_second = run_processes(
+                    cache, options['processes'], options['increments'], options['reads'],
+                )
+                shared = to_child and to_parent
+                line = f'{name:<10}{"yes" if shared else "no":>8}{f"{got}/{expected}":>22}{reads_per_second:>14,.0f}'
+                if shared and got == expected:
+                    self.stdout.write(self.style.SUCCESS(f'{line}   ✓'))
+                elif not shared:
+                    self.stdout.write(f'{line}   (each process has its own cache)')
+                else:
+                    self.stdout.write(self.style.WARNING(f'{line}   ✗ {expected - got} increments lost'))
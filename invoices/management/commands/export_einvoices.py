@@ -0,0 +1,66 @@
+"""
+Management command to export e-invoice (INV-01) JSON for a company and period
+Writes invoice by invoice so memory stays flat for large periods
+"""
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from invoices.einvoice_utils import export_invoices_queryset, iter_einvoice_export
+from invoices.models import Company
+from invoices.validation_utils import preflight_report
+
+
+class Command(BaseCommand):
+    help = 'Export INV-01 e-invoice JSON (array) for a company and date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='Company ID')
+        parser.add_argument('--from', dest='date_from', required=True, help='Start date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', required=True, help='End date (YYYY-MM-DD), inclusive')
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='Output file (default: stdout)',
+        )
+        parser.add_argument(
+            '--validate',
+            action='store_true',
+            help='Run the validate_einvoices pre-flight checks first and stop if any invoice fails',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} not found")
+
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'])
+        if not date_from or not date_to or date_from > date_to:
+            raise CommandError('Provide a valid period with --from and --to (YYYY-MM-DD)')
+
+        invoices = export_invoices_queryset(company, date_from, date_to)
+        if options['validate']:
+            report = preflight_report(invoices)
+            if report['invalid']:
+                numbers = ', '.join(entry['invoice_number'] for entry in report['invoices'][:10])
+                raise CommandError(
+                    f"{report['invalid']} of {report['checked']} invoice(s) failed validation ({numbers}). "
+                    f"Run validate_einvoices for details."
+                )
+
+        output = options['output']
+
+        if output == '-':
+            for chunk in iter_einvoice_export(invoices):
+                sys.stdout.write(chunk)
+            sys.stdout.flush()
+            return
+
+        count = 0
+        with open(output, 'w', encoding='utf-8') as f:
+            for chunk in iter_einvoice_export(invoices):
+                f.write(chunk)
+                count += 1
+        # First and last chunks are the array brackets
+        self.stdout.write(self.style.SUCCESS(f'Exported {max(count - 2, 0)} invoice(s) to {output}'))
@@ -0,0 +1,248 @@
+"""
+Management command to micro-benchmark the hot model and utility functions
+
+Each function is called a few times to warm up, then timed call by call
+with the garbage collector paused, and finally called once more under
+tracemalloc for its peak memory. Results can be saved as a baseline JSON
+and compared with later runs, like the bench command.
+
+By default the functions run against a fixture of fixed size (--items,
+--history) created in a transaction that is rolled back, so the numbers
+only depend on the code and the machine. --invoice uses a real invoice
+instead; writes are rolled back as well.
+"""
+import gc
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from invoices import bench_utils
+from invoices.amount_utils import _amount_words, amount_in_words
+from invoices.einvoice_utils import build_einvoice_data, build_eway_bill_data, dumps_json
+from invoices.models import Client, Company, Invoice, InvoiceItem, POLineItem, PurchaseOrder, UOM
+from invoices.pdf_utils import generate_invoice_pdf
+
+User = get_user_model()
+
+MIN_SAMPLES = 5
+
+# metric: (relative, absolute) growth that counts as a regression
+TOLERANCES = {
+    'p50_ms': (0.2, 0.05),
+    'peak_kb': (0.2, 64),
+}
+
+
+def create_fixture(items, history):
+    """
+    An invoice with `items` items billing the lines of its PO, in a company
+    with `history` earlier invoices this year that also bill the first PO line
+    """
+    user = User.objects.create(username='_microbench', email='microbench@example.com')
+    company = Company.objects.create(
+        user=user, name='Microbench Engineering Pvt Ltd', gstin='24AAJCN3315P1Z7', pan='AAJCN3315P',
+        address='G-10, Mahalaxmi Shopping, Umara, Olpad, Surat, Gujarat - 394130', invoice_prefix='MB/',
+        is_default=True,
+    )
+    client = Client.objects.create(
+        name='Microbench Client Ltd', email='client@example.com', gstin='24AABCL2635C1Z3',
+        address='Gate no 6, Hazira Manufacturing Complex, Surat, Gujarat - 394270',
+    )
+    uom = UOM.objects.filter(code='NOS').first() or UOM.objects.create(code='NOS', name='Numbers')
+    purchase_order = PurchaseOrder.objects.create(
+        company=company, po_number='PO-MICROBENCH', main_line_number='01', main_line_description='Fabrication',
+    )
+    lines = POLineItem.objects.bulk_create([
+        POLineItem(
+            purchase_order=purchase_order, subline_number=f'{number * 10:04d}', uom=uom,
+            subline_description=f'Fabrication of structural steel, lot {number}',
+            quantity=Decimal(history + 100), price=Decimal('1234.50'),
+        )
+        for number in range(1, items + 1)
+    ])
+
+    today = date.today()
+    prefix = f'{company.invoice_prefix}{today.year}-'
+    earlier = Invoice.objects.bulk_create([
+        Invoice(
+            invoice_number=f'{prefix}{number:03d}', company=company, client=client, po_reference=purchase_order,
+            invoice_date=today, due_date=today + timedelta(days=30), status='PENDING', created_by=user,
+        )
+        for number in range(1, history + 1)
+    ])
+    InvoiceItem.objects.bulk_create([
+        InvoiceItem(invoice=invoice, po_line_item=lines[0], description=lines[0].subline_description,
+                    sac_code='998873', quantity=Decimal('1'), rate=lines[0].price, total=lines[0].price)
+        for invoice in earlier
+    ])
+
+    invoice = Invoice.objects.create(
+        invoice_number=f'{prefix}{history + 1:03d}', company=company, client=client, po_reference=purchase_order,
+        po_number=purchase_order.po_number, invoice_date=today, due_date=today + timedelta(days=30),
+        place_of_supply='Gujarat', state_code='24', status='PENDING', created_by=user,
+    )
+    InvoiceItem.objects.bulk_create([
+        InvoiceItem(invoice=invoice, po_line_item=line, description=line.subline_description, sac_code='998873',
+                    quantity=Decimal('2.5'), rate=line.price, total=Decimal('2.5') * line.price)
+        for line in lines
+    ])
+    invoice.calculate_totals()
+    return invoice
+
+
+def build_benchmarks(invoice):
+    """[(name, callable)]"""
+    company, client = invoice.company, invoice.client
+    items = list(invoice.items.all())
+    line = next((item.po_line_item for item in items if item.po_line_item_id), None)
+    einvoice = build_einvoice_data(invoice, items, company, client)
+    # Distinct amounts with the words cache cleared: the cost of a real conversion
+    amounts = [Decimal(number * 7919) / 100 for number in range(1, 101)]
+
+    def convert_amounts():
+        _amount_words.cache_clear()
+        for amount in amounts:
+            amount_in_words(amount)
+
+    benchmarks = [
+        ('Invoice.calculate_totals', invoice.calculate_totals),
+        ('Invoice.get_amount_in_words', invoice.get_amount_in_words),
+        ('amount_in_words x100 (uncached)', convert_amounts),
+        ('Company.get_next_invoice_number', company.get_next_invoice_number),
+        ('generate_invoice_pdf', lambda: generate_invoice_pdf(invoice, items, company, client)),
+        ('build_einvoice_data', lambda: build_einvoice_data(invoice, items, company, client)),
+        ('dumps_json (e-invoice)', lambda: dumps_json(einvoice)),
+        ('build_eway_bill_data', lambda: build_eway_bill_data(invoice, items, company, client)),
+    ]
+    if line is not None:
+        benchmarks.insert(3, ('POLineItem.get_available_quantity', line.get_available_quantity))
+    return benchmarks
+
+
+def time_calls(func, warmup, repeat, max_time):
+    """Durations in seconds of up to `repeat` calls (at least MIN_SAMPLES), stopping after max_time"""
+    for _ in range(warmup):
+        func()
+    durations = []
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = time.perf_counter() + max_time
+        while len(durations) < repeat and (len(durations) < MIN_SAMPLES or time.perf_counter() < deadline):
+            started = time.perf_counter()
+            func()
+            durations.append(time.perf_counter() - started)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return durations
+
+
+def trace_memory(func):
+    """(peak, retained) KiB allocated by one call"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round((peak - before) / 1024, 1), round((current - before) / 1024, 1)
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark hot model and utility functions: timings and tracemalloc memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, help='Benchmark with this invoice instead of a fixture')
+        parser.add_argument('--items', type=int, default=20, help='Fixture: items on the invoice (default: 20)')
+        parser.add_argument('--history', type=int, default=500,
+                            help='Fixture: earlier invoices in the company, all billing one PO line (default: 500)')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed calls first (default: 5)')
+        parser.add_argument('--repeat', type=int, default=200, help='Timed calls per function at most (default: 200)')
+        parser.add_argument('--max-time', type=float, default=2.0, help='Seconds per function at most (default: 2)')
+        parser.add_argument('--only', help='Comma-separated benchmark names to run')
+        parser.add_argument('--baseline', help='Compare with this baseline JSON and fail on regressions')
+        parser.add_argument('--save-baseline', help='Write the results to this baseline JSON')
+
+    def handle(self, *args, **options):
+        if options['items'] < 1:
+            raise CommandError('--items must be at least 1')
+        baseline = bench_utils.load_baseline(options['baseline']) if options['baseline'] else None
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING('DEBUG is on; query logging adds time and retained memory'))
+
+        with override_settings(METRICS_ENABLED=False), transaction.atomic():
+            if options['invoice']:
+                invoice = Invoice.objects.select_related('company', 'client').filter(pk=options['invoice']).first()
+                if invoice is None or invoice.company is None:
+                    raise CommandError(f"Invoice {options['invoice']} not found or has no company")
+                fixture = {'invoice': invoice.pk}
+            else:
+                invoice = create_fixture(options['items'], options['history'])
+                fixture = {'items': options['items'], 'history': options['history']}
+            self.stdout.write(f'{invoice.invoice_number}: {invoice.items.count()} items, {connection.vendor}\n')
+
+            benchmarks = build_benchmarks(invoice)
+            if options['only']:
+                wanted = set(options['only'].split(','))
+                unknown = wanted - {name for name, _ in benchmarks}
+                if unknown:
+                    raise CommandError(f'Unknown benchmark(s): {", ".join(sorted(unknown))}')
+                benchmarks = [(name, func) for name, func in benchmarks if name in wanted]
+
+            self.stdout.write(
+                f'{"Function":<36}{"n":>5}{"min ms":>10}{"p50 ms":>10}{"p95 ms":>10}{"mean ms":>10}{"stdev":>9}'
+                f'{"ops/s":>10}{"peak KiB":>10}{"kept KiB":>10}'
+            )
+            results = {}
+            for name, func in benchmarks:
+                durations = time_calls(func, options['warmup'], options['repeat'], options['max_time'])
+                result = bench_utils.summarize(durations)
+                result['ops_per_s'] = round(len(durations) / sum(durations), 1) if sum(durations) else 0.0
+                result['peak_kb'], result['retained_kb'] = trace_memory(func)
+                results[name] = result
+                self.report(name, result, baseline['results'] if baseline else None)
+            transaction.set_rollback(True)
+        self.stdout.write('')
+
+        if options['save_baseline']:
+            bench_utils.save_baseline(options['save_baseline'], results, fixture=fixture)
+            self.stdout.write(self.style.SUCCESS(f"✓ Baseline written to {options['save_baseline']}"))
+        if baseline:
+            if baseline.get('fixture') != fixture:
+                self.stdout.write(self.style.WARNING(
+                    f"The baseline was measured with {baseline.get('fixture')}; differences may not be regressions"
+                ))
+            regressions = [row for row in bench_utils.compare(results, baseline['results'], TOLERANCES) if row['regressed']]
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'✓ No regressions against {options["baseline"]}'))
+
+    def report(self, name, result, baseline):
+        line = (
+            f'{name:<36}{result["n"]:>5}{result["min_ms"]:>10.4f}{result["p50_ms"]:>10.4f}{result["p95_ms"]:>10.4f}'
+            f'{result["mean_ms"]:>10.4f}{result["stdev_ms"]:>9.4f}{result["ops_per_s"]:>10,.0f}'
+            f'{result["peak_kb"]:>10,.1f}{result["retained_kb"]:>10,.1f}'
+        )
+        if baseline is None or name not in baseline:
+            self.stdout.write(line)
+            return
+        rows = bench_utils.compare({name: result}, baseline, TOLERANCES)
+        p50 = next((row for row in rows if row['metric'] == 'p50_ms'), None)
+        if p50 is not None:
+            line += f'   p50 {p50["change"]:+.0%}'
+        regressed = [row for row in rows if row['regressed']]
+        if regressed:
+            details = ', '.join(f'{row["metric"]} {row["baseline"]} → {row["current"]}' for row in regressed)
+            self.stdout.write(self.style.ERROR(f'{line}   ✗ {details}'))
+        else:
+            self.stdout.write(line)
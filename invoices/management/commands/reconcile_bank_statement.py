@@ -0,0 +1,65 @@
+"""
+Management command to reconcile a bank statement CSV against open invoices
+Proposes a payment per credit row and optionally books the confident matches
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from invoices.models import Company
+from invoices.reconcile_utils import CONFIDENT_MATCHES, MATCH_AMOUNT, apply_matches, parse_bank_statement, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Match bank statement credits (NEFT/RTGS/UPI) to open invoices and record payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='Company ID')
+        parser.add_argument('--file', required=True, help='Bank statement CSV')
+        parser.add_argument('--bank', help='Bank name stored on the payments')
+        parser.add_argument(
+            '--apply',
+            action='store_true',
+            help='Record payments for reference and amount+client matches',
+        )
+        parser.add_argument(
+            '--include-amount-only',
+            action='store_true',
+            help='With --apply, also record matches made on amount alone',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} not found")
+
+        try:
+            with open(options['file'], 'rb') as statement:
+                rows = parse_bank_statement(statement.read())
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {options['file']}: {e}")
+
+        started = time.monotonic()
+        result = reconcile(company, rows)
+        elapsed = time.monotonic() - started
+
+        matches = result['matches']
+        for match in matches:
+            self.stdout.write(
+                f"  line {match['line']}: ₹{match['amount']:,.2f} {match['reference'] or '-'} "
+                f"-> {match['invoice_number']} ({match['match']})"
+            )
+        for row in result['unmatched']:
+            self.stdout.write(self.style.WARNING(f"✗ line {row['line']}: ₹{row['amount']:,.2f} {row['narration'][:60]}"))
+
+        self.stdout.write(
+            f"{len(rows)} credit(s) in {elapsed * 1000:.0f} ms: {len(matches)} matched, "
+            f"{len(result['unmatched'])} unmatched, {len(result['duplicates'])} already recorded"
+        )
+        if not options['apply']:
+            return
+
+        kinds = CONFIDENT_MATCHES + ((MATCH_AMOUNT,) if options['include_amount_only'] else ())
+        payments, skipped = apply_matches([match for match in matches if match['match'] in kinds], bank_name=options['bank'])
+        for match in skipped:
+            self.stdout.write(self.style.WARNING(f"✗ line {match['line']}: {match['reason']}"))
+        self.stdout.write(self.style.SUCCESS(f'✓ Recorded {len(payments)} payment(s)'))
@@ -0,0 +1,99 @@
+"""
+Management command to run background jobs (PDFs, exports, emails)
+Run this as a long-lived process (systemd/supervisor) next to gunicorn
+"""
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from invoices.jobs import claim_job, run_job, worker_id
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs with per-queue concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue',
+            action='append',
+            dest='queues',
+            help='Only run this queue (repeatable, default: all queues in JOB_QUEUES)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when a queue is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the currently due jobs and exit',
+        )
+
+    def handle(self, *args, **options):
+        configured = getattr(settings, 'JOB_QUEUES', {'default': 1})
+        queues = options['queues'] or list(configured)
+        unknown = [queue for queue in queues if queue not in configured]
+        if unknown:
+            raise CommandError(f'Unknown queue(s): {", ".join(unknown)}')
+
+        self.poll_interval = options['poll_interval']
+        self.once = options['once']
+        self.stop = threading.Event()
+        self.output_lock = threading.Lock()
+
+        # One thread per concurrency slot, so each queue never runs more than
+        # JOB_QUEUES[queue] jobs at a time in this process.
+        threads = []
+        for queue in queues:
+            for _ in range(max(configured[queue], 1)):
+                thread = threading.Thread(target=self.worker_loop, args=(queue,), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        self.stdout.write(f'Running {len(threads)} worker thread(s) for queue(s): {", ".join(queues)}')
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrupted, waiting for running jobs to finish...'))
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(self.style.SUCCESS('Job worker stopped.'))
+
+    def worker_loop(self, queue):
+        locked_by = worker_id()
+        try:
+            while not self.stop.is_set():
+                try:
+                    job = claim_job(queue, locked_by=locked_by)
+                    if job is None:
+                        if self.once:
+                            break
+                        self.stop.wait(self.poll_interval)
+                        continue
+                    ok = run_job(job)
+                except DatabaseError as e:
+                    # Lost connection or lock timeout - a claimed job is
+                    # picked up again once JOB_LOCK_TIMEOUT has passed
+                    with self.output_lock:
+                        self.stdout.write(self.style.ERROR(f'✗ [{queue}] Database error: {str(e)}'))
+                    connection.close()
+                    self.stop.wait(self.poll_interval)
+                    continue
+
+                with self.output_lock:
+                    if ok:
+                        self.stdout.write(self.style.SUCCESS(f'✓ [{queue}] {job.name} #{job.pk} done'))
+                    else:
+                        self.stdout.write(
+                            self.style.ERROR(f'✗ [{queue}] {job.name} #{job.pk} {job.status.lower()}: {job.last_error}')
+                        )
+        finally:
+            # Each thread has its own database connection
+            connection.close()
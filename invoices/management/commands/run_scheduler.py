@@ -0,0 +1,92 @@
+"""
+Management command to run scheduled tasks (replaces cron entries)
+Run it on every app server; only the elected leader executes tasks
+"""
+import time
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.db.models import Avg, Count, Max
+from invoices import scheduler
+from invoices.models import ScheduledRun
+
+
+class Command(BaseCommand):
+    help = 'Run tasks from SCHEDULER_TASKS, with one leader across all nodes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=30.0,
+            help='Seconds between schedule checks (default: 30)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run one tick (if leader) and exit',
+        )
+        parser.add_argument(
+            '--status',
+            action='store_true',
+            help='Show run counts and durations per task and exit',
+        )
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.show_status()
+            return
+
+        tick_seconds = options['tick']
+        is_leader = False
+
+        try:
+            while True:
+                try:
+                    leader_now = scheduler.try_acquire_leadership()
+                    if leader_now != is_leader:
+                        is_leader = leader_now
+                        state = 'Became scheduler leader' if is_leader else 'Standing by (another node is leader)'
+                        self.stdout.write(self.style.SUCCESS(state) if is_leader else state)
+
+                    if is_leader:
+                        for run in scheduler.tick():
+                            style = self.style.SUCCESS if run.success else self.style.ERROR
+                            mark = '✓' if run.success else '✗'
+                            self.stdout.write(style(f'{mark} {run.name} finished in {run.duration_ms} ms'))
+                except DatabaseError as e:
+                    # The advisory lock died with the connection; re-elect next tick
+                    self.stdout.write(self.style.ERROR(f'✗ Database error: {str(e)}'))
+                    is_leader = False
+                    connection.close()
+
+                if options['once']:
+                    break
+                time.sleep(tick_seconds)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Interrupted, stopping scheduler.'))
+        finally:
+            if is_leader:
+                try:
+                    scheduler.release_leadership()
+                except DatabaseError:
+                    pass
+
+    def show_status(self):
+        stats = {
+            row['name']: row for row in ScheduledRun.objects.values('name').annotate(
+                runs=Count('id'),
+                last=Max('started_at'),
+                avg_ms=Avg('duration_ms'),
+                max_ms=Max('duration_ms'),
+            )
+        }
+        for task in scheduler.get_tasks():
+            row = stats.get(task['name'])
+            schedule = f"every {task['every']}s" if 'every' in task else f"daily at {task['at']}"
+            if not row:
+                self.stdout.write(f"{task['name']:<24} {schedule:<18} never run")
+                continue
+            self.stdout.write(
+                f"{task['name']:<24} {schedule:<18} runs={row['runs']} last={row['last']:%Y-%m-%d %H:%M} "
+                f"avg={row['avg_ms'] or 0:.0f}ms max={row['max_ms'] or 0}ms"
+            )
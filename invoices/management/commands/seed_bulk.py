@@ -0,0 +1,415 @@
+"""
+Management command to generate a large synthetic dataset for load tests and benchmarks
+
+Rows are written with bulk_create in batches inside short transactions, so
+millions of rows take minutes on PostgreSQL or SQLite. All values come from
+one seeded random generator: the same options and --seed on an empty
+database give the same data.
+
+bulk_create skips Model.save() and signals, so the derived fields that
+save() normally fills (item and invoice totals, amount in words, payment net
+amounts, structured addresses) are computed here.
+
+Seeded users and clients have @bulk.example email addresses; --flush
+deletes them with everything that belongs to them before seeding again.
+"""
+import random
+import time
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import accumulate
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from invoices.amount_utils import amount_in_words
+from invoices.models import (
+    Client, Company, Invoice, InvoiceItem, Payment, POLineItem, PurchaseOrder, StatementCheckpoint, UOM,
+)
+from invoices.validation_utils import STATE_CODES, gstin_check_digit
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'bulk.example'
+MONEY = Decimal('0.01')
+LETTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Companies are in HOME_STATE. Invoices only carry CGST/SGST, so clients in
+# other states make (a few) invoices the e-invoice pre-flight rejects.
+HOME_STATE = '24'
+# State code: (client weight, cities)
+STATES = {
+    '24': (85, ['Ahmedabad', 'Surat', 'Vadodara', 'Rajkot']),
+    '27': (5, ['Mumbai', 'Pune', 'Nagpur']),
+    '29': (3, ['Bengaluru', 'Mysuru']),
+    '33': (2, ['Chennai', 'Coimbatore']),
+    '07': (2, ['New Delhi']),
+    '36': (2, ['Hyderabad']),
+    '19': (1, ['Kolkata']),
+}
+UOMS = [('NOS', 'Numbers'), ('HRS', 'Hours'), ('KG', 'Kilograms'), ('MTR', 'Metres'), ('SET', 'Sets')]
+WORK = [
+    ('Fabrication of structural steel', '998873'), ('Erection and commissioning', '995461'),
+    ('Piping and insulation work', '995465'), ('Electrical installation', '995461'),
+    ('Painting and surface treatment', '995473'), ('Inspection and testing', '998346'),
+    ('Engineering design services', '998331'), ('Manpower supply', '998519'),
+    ('Equipment hire', '997313'), ('Annual maintenance contract', '998717'),
+]
+NAME_PARTS = (
+    ['Shree', 'Om', 'Sai', 'Apex', 'Prime', 'Vertex', 'National', 'United', 'Global', 'Bharat', 'Sunrise', 'Star'],
+    ['Engineering', 'Power', 'Infra', 'Steel', 'Projects', 'Industries', 'Energy', 'Fabricators', 'Technocrats'],
+    ['Pvt Ltd', 'Limited', 'LLP', '& Co'],
+)
+SAC_CODES = dict(WORK)
+PAYMENT_METHODS = ['NEFT', 'RTGS', 'BANK_TRANSFER', 'UPI', 'CHEQUE']
+PAYMENT_METHOD_WEIGHTS = [45, 25, 15, 10, 5]
+
+
+def money(value):
+    return Decimal(value).quantize(MONEY, rounding=ROUND_HALF_UP)
+
+
+def skewed_weights(count, exponent):
+    """Cumulative Zipf weights: item n is drawn about n**exponent times less often than the first"""
+    return list(accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def spread(rng, count, buckets, exponent):
+    """Split `count` rows over `buckets` owners with a skewed distribution; {bucket index: rows}"""
+    if not buckets:
+        return Counter()
+    return Counter(rng.choices(range(buckets), cum_weights=skewed_weights(buckets, exponent), k=count))
+
+
+def around(rng, mean):
+    """Positive integer with the given mean, geometrically distributed (most small, a few large)"""
+    count = 1
+    if mean > 1:
+        extend = 1 - 1 / mean
+        while count < mean * 10 and rng.random() < extend:
+            count += 1
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic dataset with bulk inserts (for load tests and benchmarks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Users owning the companies (default: 5)')
+        parser.add_argument('--companies', type=int, default=10, help='Companies, spread over the users (default: 10)')
+        parser.add_argument('--clients', type=int, default=500, help='Clients, shared by all companies (default: 500)')
+        parser.add_argument('--pos', type=int, default=2000, help='Purchase orders (default: 2000)')
+        parser.add_argument('--lines', type=float, default=5, help='Average line items per purchase order (default: 5)')
+        parser.add_argument('--invoices', type=int, default=20000, help='Invoices (default: 20000)')
+        parser.add_argument('--items', type=float, default=4, help='Average items per invoice (default: 4)')
+        parser.add_argument('--payments', type=float, default=1.5,
+                            help='Average payments per paid or part-paid invoice (default: 1.5)')
+        parser.add_argument('--days', type=int, default=730, help='Invoice dates span this many days up to today (default: 730)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT batch (default: 2000)')
+        parser.add_argument('--password', default='bulk-password', help='Password of the seeded users')
+        parser.add_argument('--flush', action='store_true', help='Delete previously seeded data first')
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['companies'], options['clients']) < 1:
+            raise CommandError('--users, --companies and --clients must be at least 1')
+        if options['flush']:
+            self.flush()
+        elif User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise CommandError('Seeded data already exists; rerun with --flush to replace it')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+        self.counts = Counter()
+        started = time.monotonic()
+
+        with transaction.atomic():
+            users = self.create_users(options['users'], options['password'])
+            uoms = self.get_uoms()
+            clients = self.create_clients(options['clients'])
+            companies = self.create_companies(users, options['companies'])
+
+        # Bigger companies get more POs and invoices; bigger clients get more invoices
+        pos_per_company = spread(self.rng, options['pos'], len(companies), 0.8)
+        invoices_per_company = spread(self.rng, options['invoices'], len(companies), 0.8)
+        client_weights = skewed_weights(len(clients), 1.1)
+        for index, company in enumerate(companies):
+            lines = self.create_purchase_orders(company, pos_per_company[index], options['lines'], uoms)
+            self.create_invoices(
+                company, invoices_per_company[index], lines, clients, client_weights,
+                options['items'], options['payments'], options['days'],
+            )
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'  {company.name}: {pos_per_company[index]} POs, {invoices_per_company[index]} invoices')
+
+        self.analyze()
+        elapsed = time.monotonic() - started
+        for label, count in self.counts.items():
+            self.stdout.write(self.style.SUCCESS(f'✓ {label}: {count:,}'))
+        total = sum(self.counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'\nSeeded {total:,} rows in {elapsed:.1f}s ({total / max(elapsed, 0.001):,.0f} rows/s)'
+        ))
+        self.stdout.write(f'Log in as {users[0].username} / {options["password"]}')
+
+    # ==================== MASTERS ====================
+
+    def pick_state(self):
+        return self.rng.choices(list(STATES), weights=[weight for weight, _ in STATES.values()])[0]
+
+    def party_details(self, state):
+        """GSTIN, PAN and structured address fields of a business in `state`"""
+        rng = self.rng
+        pan = (''.join(rng.choices(LETTERS, k=3)) + 'C' + rng.choice(LETTERS)
+               + f'{rng.randrange(10000):04d}' + rng.choice(LETTERS))
+        body = f'{state}{pan}1Z'
+        city = rng.choice(STATES[state][1])
+        pin = str(rng.randint(110001, 859999))
+        line1 = f'Plot {rng.randint(1, 400)}, {rng.choice(["GIDC", "MIDC", "Industrial Estate", "Phase II"])}'
+        return {
+            'gstin': body + gstin_check_digit(body),
+            'pan': pan,
+            'address': f'{line1}, {city}, {STATE_CODES[state]} - {pin}',
+            'address_line1': line1,
+            'city': city,
+            'pin': pin,
+            'state_code': state,
+        }
+
+    def business_name(self, number):
+        first, second, suffix = NAME_PARTS
+        return f'{self.rng.choice(first)} {self.rng.choice(second)} {self.rng.choice(suffix)} {number}'
+
+    def create_users(self, count, password):
+        password = make_password(password)
+        users = [
+            User(
+                username=f'bulk_user_{number:03d}', email=f'user{number}@{EMAIL_DOMAIN}', password=password,
+                first_name='Bulk', last_name=f'User {number}', is_staff=number == 1,
+            )
+            for number in range(1, count + 1)
+        ]
+        users = User.objects.bulk_create(users, batch_size=self.batch_size)
+        self.counts['Users'] += len(users)
+        return users
+
+    def get_uoms(self):
+        uoms = []
+        for code, name in UOMS:
+            uom = UOM.objects.filter(code=code).first() or UOM.objects.filter(name=name).first()
+            if not uom:
+                uom = UOM.objects.create(code=code, name=name, description=name, is_active=True)
+            uoms.append(uom)
+        return uoms
+
+    def create_clients(self, count):
+        clients = []
+        for number in range(1, count + 1):
+            clients.append(Client(
+                name=self.business_name(number), email=f'accounts{number}@{EMAIL_DOMAIN}',
+                phone=f'+91 {self.rng.randint(7000000000, 9999999999)}',
+                **{key: value for key, value in self.party_details(self.pick_state()).items() if key != 'pan'},
+            ))
+        clients = Client.objects.bulk_create(clients, batch_size=self.batch_size)
+        self.counts['Clients'] += len(clients)
+        return clients
+
+    def create_companies(self, users, count):
+        companies = []
+        for number in range(1, count + 1):
+            user = users[(number - 1) % len(users)]
+            companies.append(Company(
+                user=user, name=self.business_name(number), email=f'billing{number}@{EMAIL_DOMAIN}',
+                phone=f'+91 {self.rng.randint(7000000000, 9999999999)}',
+                invoice_prefix=f'B{number:02d}/', default_due_days=self.rng.choice([15, 30, 30, 45, 60]),
+                bank_name='State Bank of India', account_number=str(self.rng.randrange(10 ** 11, 10 ** 12)),
+                ifsc_code=f'SBIN0{self.rng.randrange(100000):06d}', branch='Main Branch',
+                is_default=number <= len(users),
+                **self.party_details(HOME_STATE),
+            ))
+        companies = Company.objects.bulk_create(companies, batch_size=self.batch_size)
+        self.counts['Companies'] += len(companies)
+        return companies
+
+    # ==================== PURCHASE ORDERS ====================
+
+    def create_purchase_orders(self, company, count, lines_per_po, uoms):
+        """Create the company's POs and their lines; returns {PO: [open line dicts]}"""
+        rng = self.rng
+        open_lines = {}
+        for start in range(0, count, self.batch_size):
+            orders = [
+                PurchaseOrder(
+                    company=company, po_number=f'PO-{number:06d}', main_line_number=f'{rng.randint(1, 99):02d}',
+                    main_line_description=rng.choice(WORK)[0],
+                )
+                for number in range(start + 1, min(start + self.batch_size, count) + 1)
+            ]
+            lines = []
+            with transaction.atomic():
+                orders = PurchaseOrder.objects.bulk_create(orders)
+                for order in orders:
+                    for subline in range(1, around(rng, lines_per_po) + 1):
+                        description, sac_code = rng.choice(WORK)
+                        lines.append(POLineItem(
+                            purchase_order=order, subline_number=f'{subline * 10:04d}',
+                            subline_description=description, uom=rng.choice(uoms),
+                            quantity=Decimal(max(1, round(rng.lognormvariate(3, 1)))),
+                            price=money(rng.lognormvariate(7, 1)),
+                        ))
+                lines = POLineItem.objects.bulk_create(lines, batch_size=self.batch_size)
+            for line in lines:
+                open_lines.setdefault(line.purchase_order, []).append(
+                    {'line': line, 'remaining': line.quantity, 'sac_code': SAC_CODES[line.subline_description]}
+                )
+            self.counts['Purchase orders'] += len(orders)
+            self.counts['PO line items'] += len(lines)
+        return open_lines
+
+    # ==================== INVOICES ====================
+
+    def invoice_status(self, invoice_date, due_date):
+        roll = self.rng.random()
+        if (self.today - invoice_date).days < 30 and roll < 0.15:
+            return 'DRAFT'
+        if due_date < self.today:
+            return 'PAID' if roll < 0.75 else 'OVERDUE'
+        return 'PAID' if roll < 0.25 else 'PENDING'
+
+    def invoice_items(self, purchase_order, open_lines, items_per_invoice):
+        """Unsaved items for one invoice, drawing down the PO's open quantities"""
+        rng = self.rng
+        wanted = around(rng, items_per_invoice)
+        items = []
+        if purchase_order is not None:
+            candidates = [entry for entry in open_lines[purchase_order] if entry['remaining'] > 0]
+            for entry in rng.sample(candidates, min(wanted, len(candidates))):
+                line = entry['line']
+                # Bill the whole line or a share of it, never more than is open
+                quantity = min(entry['remaining'], max(Decimal(1), (line.quantity * Decimal(rng.choice(['0.25', '0.5', '1']))).quantize(MONEY)))
+                entry['remaining'] -= quantity
+                items.append(InvoiceItem(
+                    po_line_item=line, description=line.subline_description, sac_code=entry['sac_code'],
+                    quantity=quantity, rate=line.price, total=money(quantity * line.price),
+                ))
+        if not items:
+            for _ in range(wanted):
+                description, sac_code = rng.choice(WORK)
+                quantity = Decimal(max(1, round(rng.lognormvariate(2, 1))))
+                rate = money(rng.lognormvariate(7, 1))
+                items.append(InvoiceItem(
+                    description=description, sac_code=sac_code, quantity=quantity, rate=rate, total=money(quantity * rate),
+                ))
+        return items
+
+    def invoice_payments(self, invoice, payments_per_invoice):
+        """Unsaved payments: paid invoices are settled in full, about a third of open ones in part"""
+        rng = self.rng
+        if invoice.status == 'PAID':
+            due = invoice.total
+        elif invoice.status in ('PENDING', 'OVERDUE') and rng.random() < 0.35:
+            due = money(invoice.total * Decimal(rng.uniform(0.2, 0.8)))
+        else:
+            return []
+        count = around(rng, payments_per_invoice)
+        latest = min(self.today, invoice.due_date + timedelta(days=30))
+        span = max((latest - invoice.invoice_date).days, 0)
+        payments = []
+        remaining = due
+        for number in range(count, 0, -1):
+            amount = remaining if number == 1 else money(remaining * Decimal(rng.uniform(0.3, 0.7)))
+            remaining -= amount
+            # TDS only on part payments, so paid invoices stay settled in full
+            tds = money(amount * Decimal('0.02')) if invoice.status != 'PAID' and rng.random() < 0.2 else Decimal('0.00')
+            status = 'ON_HOLD' if invoice.status != 'PAID' and rng.random() < 0.05 else 'RECEIVED'
+            payments.append(Payment(
+                invoice=invoice, payment_date=invoice.invoice_date + timedelta(days=rng.randint(0, span)),
+                amount=amount, tds_amount=tds, tds_percentage=Decimal('2.00') if tds else Decimal('0.00'),
+                net_amount=amount - tds,
+                payment_method=rng.choices(PAYMENT_METHODS, weights=PAYMENT_METHOD_WEIGHTS)[0],
+                reference_number=f'UTR{rng.randrange(10 ** 11):011d}', bank_name='State Bank of India',
+                status=status, is_on_hold=status == 'ON_HOLD', created_by_id=invoice.created_by_id,
+            ))
+        return payments
+
+    def create_invoices(self, company, count, open_lines, clients, client_weights, items_per_invoice,
+                        payments_per_invoice, days):
+        rng = self.rng
+        orders = list(open_lines)
+        first_day = self.today - timedelta(days=days)
+        dates = sorted(first_day + timedelta(days=rng.randint(0, days)) for _ in range(count))
+        sequence = Counter()
+        for start in range(0, count, self.batch_size):
+            invoices, items, payments = [], [], []
+            for invoice_date in dates[start:start + self.batch_size]:
+                client = rng.choices(clients, cum_weights=client_weights)[0]
+                purchase_order = rng.choice(orders) if orders and rng.random() < 0.7 else None
+                due_date = invoice_date + timedelta(days=company.default_due_days)
+                sequence[invoice_date.year] += 1
+                invoice = Invoice(
+                    invoice_number=f'{company.invoice_prefix}{invoice_date.year}-{sequence[invoice_date.year]:03d}',
+                    company=company, client=client, po_reference=purchase_order,
+                    po_number=purchase_order.po_number if purchase_order else None,
+                    po_date=invoice_date - timedelta(days=rng.randint(10, 90)) if purchase_order else None,
+                    vendor_code=f'V{client.pk:06d}', invoice_date=invoice_date, due_date=due_date,
+                    place_of_supply=STATE_CODES[client.state_code], state_code=client.state_code,
+                    status=self.invoice_status(invoice_date, due_date), created_by_id=company.user_id,
+                )
+                invoice_items = self.invoice_items(purchase_order, open_lines, items_per_invoice)
+                # What calculate_totals() would store
+                invoice.subtotal = sum(item.total for item in invoice_items)
+                if rng.random() < 0.05:
+                    invoice.discount = money(invoice.subtotal * Decimal(rng.choice(['0.01', '0.02', '0.05'])))
+                taxable = invoice.subtotal - invoice.discount
+                invoice.cgst_amount = money(taxable * invoice.cgst_rate / 100)
+                invoice.sgst_amount = money(taxable * invoice.sgst_rate / 100)
+                invoice.tax_amount = invoice.cgst_amount + invoice.sgst_amount
+                invoice.total = taxable + invoice.tax_amount
+                invoice.amount_in_words = amount_in_words(invoice.total)
+                invoices.append((invoice, invoice_items))
+
+            with transaction.atomic():
+                Invoice.objects.bulk_create([invoice for invoice, _ in invoices])
+                for invoice, invoice_items in invoices:
+                    for item in invoice_items:
+                        item.invoice = invoice
+                    items.extend(invoice_items)
+                    payments.extend(self.invoice_payments(invoice, payments_per_invoice))
+                InvoiceItem.objects.bulk_create(items, batch_size=self.batch_size)
+                Payment.objects.bulk_create(payments, batch_size=self.batch_size)
+            self.counts['Invoices'] += len(invoices)
+            self.counts['Invoice items'] += len(items)
+            self.counts['Payments'] += len(payments)
+
+    # ==================== HOUSEKEEPING ====================
+
+    def analyze(self):
+        """Refresh planner statistics so the first benchmark sees the new row counts"""
+        models = [User, Client, Company, PurchaseOrder, POLineItem, Invoice, InvoiceItem, Payment]
+        with connection.cursor() as cursor:
+            for model in models:
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+    def flush(self):
+        users = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        companies = Company.objects.filter(user__in=users)
+        clients = Client.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}')
+        invoices = Invoice.objects.filter(company__in=companies)
+        with transaction.atomic():
+            # Invoice and Payment have per-row delete signals; a plain DELETE
+            # avoids loading millions of rows to send them
+            for queryset in (
+                Payment.objects.filter(invoice__in=invoices),
+                InvoiceItem.objects.filter(invoice__in=invoices),
+                invoices,
+                POLineItem.objects.filter(purchase_order__company__in=companies),
+                PurchaseOrder.objects.filter(company__in=companies),
+                StatementCheckpoint.objects.filter(company__in=companies),
+            ):
+                deleted = queryset._raw_delete(queryset.db)
+                self.stdout.write(f'Deleted {deleted:,} {queryset.model._meta.verbose_name_plural}')
+            companies.delete()
+            clients.delete()
+            users.delete()
@@ -1,14 +1,21 @@
 """
 Management command to send reminder emails for invoices with approaching due dates
-Run this command daily via cron job or scheduled task
+Scheduled daily by run_scheduler (see SCHEDULER_TASKS), or run it via cron
+
+Overdue reminders only go out for invoices that fell overdue within the last
+--overdue-window days (REMINDER_OVERDUE_WINDOW_DAYS), so the first run does
+not email about every invoice that has been overdue for months. Pass
+--overdue-window 0 to send those as a deliberate backfill.
 """
 import sys
 from django.core.management.base import BaseCommand
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
+from django.db.models import F
 from django.utils import timezone
 from django.conf import settings
 from datetime import date, timedelta
+from invoices import metrics
 from invoices.models import Invoice, Company
 
 class Command(BaseCommand):
@@ -27,6 +34,13 @@ class Command(BaseCommand):
             default=0,
             help='Number of days after due date to send reminder for overdue invoices (default: 0)',
         )
+        parser.add_argument(
+            '--overdue-window',
+            type=int,
+            default=getattr(settings, 'REMINDER_OVERDUE_WINDOW_DAYS', 7),
+            help='Only remind about invoices that became overdue in the last N days, 0 for all '
+                 '(default: REMINDER_OVERDUE_WINDOW_DAYS)',
+        )
         parser.add_argument(
             '--dry-run',
             action='store_true',
@@ -36,6 +50,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         days_before = options['days_before']
         days_after = options['days_after']
+        overdue_window = options['overdue_window']
         dry_run = options['dry_run']
         
         today = date.today()
@@ -54,14 +69,21 @@ class Command(BaseCommand):
         ).select_related('company', 'client', 'company__user')
         
         # 2. Overdue invoices (due date passed, not paid)
+        # OVERDUE is included because the scheduled overdue sweep may flip the
+        # status before the first overdue reminder goes out.
         overdue_invoices = Invoice.objects.filter(
             due_date__lte=overdue_date,
-            status='PENDING',
+            status__in=['PENDING', 'OVERDUE'],
             company__isnull=False,
         ).exclude(
             # Exclude if reminder was sent in last 24 hours
             reminder_sent_at__gte=timezone.now() - timedelta(hours=24)
+        ).exclude(
+            # Exclude if the overdue reminder was already sent
+            reminder_sent_at__date__gt=F('due_date')
         ).select_related('company', 'client', 'company__user')
+        if overdue_window > 0:
+            overdue_invoices = overdue_invoices.filter(due_date__gt=overdue_date - timedelta(days=overdue_window))
         
         all_invoices = list(upcoming_invoices) + list(overdue_invoices)
         
@@ -173,6 +195,10 @@ InvoicePro System
                     import traceback
                     self.stdout.write(traceback.format_exc())
         
+        if not dry_run:
+            metrics.inc('invoices_reminders_total', sent_count, result='sent')
+            metrics.inc('invoices_reminders_total', error_count, result='error')
+
         if dry_run:
             self.stdout.write(self.style.WARNING(f'\n[DRY RUN] Would send {sent_count} reminder(s), {error_count} error(s)'))
         else:
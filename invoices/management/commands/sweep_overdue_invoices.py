@@ -0,0 +1,18 @@
+"""
+Management command to mark unpaid invoices past their due date as OVERDUE
+Scheduled by run_scheduler; safe to run at any time
+"""
+from datetime import date
+from django.core.management.base import BaseCommand
+from invoices.models import Invoice
+
+
+class Command(BaseCommand):
+    help = 'Mark PENDING invoices past their due date as OVERDUE'
+
+    def handle(self, *args, **options):
+        updated = Invoice.objects.filter(
+            status='PENDING',
+            due_date__lt=date.today(),
+        ).update(status='OVERDUE')
+        self.stdout.write(self.style.SUCCESS(f'Marked {updated} invoice(s) as overdue.'))
@@ -0,0 +1,59 @@
+"""
+Management command to pre-flight check e-invoice and e-way bill JSON
+Reports every field the GST portals would reject before anything is uploaded
+"""
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from invoices.einvoice_utils import export_invoices_queryset
+from invoices.models import Company
+from invoices.validation_utils import preflight_report
+
+
+class Command(BaseCommand):
+    help = 'Validate INV-01 and e-way bill payloads for a company and date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, required=True, help='Company ID')
+        parser.add_argument('--from', dest='date_from', required=True, help='Start date (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', required=True, help='End date (YYYY-MM-DD), inclusive')
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the full report as JSON',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.get(pk=options['company'])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company']} not found")
+
+        date_from = parse_date(options['date_from'])
+        date_to = parse_date(options['date_to'])
+        if not date_from or not date_to or date_from > date_to:
+            raise CommandError('Provide a valid period with --from and --to (YYYY-MM-DD)')
+
+        started = time.monotonic()
+        report = preflight_report(export_invoices_queryset(company, date_from, date_to))
+        elapsed = time.monotonic() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for entry in report['invoices']:
+            self.stdout.write(self.style.ERROR(f"✗ {entry['invoice_number']}"))
+            for error in entry['errors']:
+                self.stdout.write(f"    [{error['document']}] {error['field']}: {error['message']}")
+
+        rate = report['checked'] / elapsed if elapsed else 0
+        summary = (
+            f"Checked {report['checked']} invoice(s) in {elapsed * 1000:.0f} ms ({rate:.0f}/s): "
+            f"{report['valid']} valid, {report['invalid']} with errors"
+        )
+        if report['invalid']:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {summary}'))
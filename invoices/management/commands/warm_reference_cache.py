@@ -0,0 +1,25 @@
+"""
+Management command to fill the reference cache before users ask for it
+Scheduled by run_scheduler, so entries that expired or were invalidated are
+rebuilt here instead of in the first request that needs them
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from invoices import reference_cache
+
+
+class Command(BaseCommand):
+    help = 'Cache UOMs and the companies and PO choices of recently active users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Warm users who logged in during the last N days (default: 7)',
+        )
+
+    def handle(self, *args, **options):
+        warmed = reference_cache.warm(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Warmed reference data for {warmed} user(s).'))
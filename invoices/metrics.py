@@ -0,0 +1,349 @@
+"""
+Prometheus metrics shared by all worker processes
+
+Each process (every gunicorn worker, the scheduler, the job runner) counts
+into its own memory-mapped file in METRICS_DIR, so recording a value is a
+dict lookup and an 8-byte write with no locking between processes. /metrics
+reads every file and adds them up, which gives one consistent view of all
+workers without an external service.
+
+Files of processes that have exited are folded into one archive file on the
+next scrape, so counters keep their totals across worker restarts.
+
+Only counters and histograms are stored; gauges such as the outbox depth are
+read from the database when /metrics is scraped.
+"""
+import fcntl
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+
+
+REQUEST_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PDF_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'invoices_http_request_duration_seconds': ('histogram', 'Request latency by URL name', REQUEST_BUCKETS),
+    'invoices_http_requests_total': ('counter', 'Requests by URL name, method and status class', None),
+    'invoices_db_queries_total': ('counter', 'SQL queries run by requests, by URL name', None),
+    'invoices_db_query_seconds_total': ('counter', 'Time requests spent in SQL, by URL name', None),
+    'invoices_pdf_render_seconds': ('histogram', 'PDF build time by document type', PDF_BUCKETS),
+    'invoices_cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss)', None),
+    'invoices_reminders_total': ('counter', 'Invoice reminder emails by result', None),
+}
+
+ARCHIVE_NAME = 'metrics_archive.db'
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct('<I4x')  # bytes used
+KEY_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def metrics_dir():
+    path = Path(getattr(settings, 'METRICS_DIR', settings.BASE_DIR / 'metrics'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class MmapValues:
+    """
+    Float values by key in a memory-mapped file. Entries are
+    [key length][key][padding to 8 bytes][float64] and never move, so other
+    processes can read the file while this one writes to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(INITIAL_SIZE)
+        self.capacity = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        self.used = HEADER.unpack_from(self.map, 0)[0] or HEADER.size
+        self.offsets = {key: offset for key, _, offset in read_entries(self.map, self.used)}
+
+    def _add_entry(self, key):
+        encoded = key.encode('utf-8')
+        padded = KEY_LENGTH.size + len(encoded)
+        padded += -padded % 8
+        size = padded + VALUE.size
+        if self.used + size > self.capacity:
+            self.capacity = max(self.capacity * 2, self.used + size)
+            self.map.close()
+            self.file.truncate(self.capacity)
+            self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        KEY_LENGTH.pack_into(self.map, self.used, len(encoded))
+        self.map[self.used + KEY_LENGTH.size:self.used + KEY_LENGTH.size + len(encoded)] = encoded
+        offset = self.used + padded
+        VALUE.pack_into(self.map, offset, 0.0)
+        self.used += size
+        # Publish the entry only once it is complete
+        HEADER.pack_into(self.map, 0, self.used)
+        self.offsets[key] = offset
+        return offset
+
+    def inc(self, key, amount):
+        with self.lock:
+            offset = self.offsets.get(key)
+            if offset is None:
+                offset = self._add_entry(key)
+            VALUE.pack_into(self.map, offset, VALUE.unpack_from(self.map, offset)[0] + amount)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def read_entries(buffer, used=None):
+    """Yield (key, value, value offset) from a MmapValues buffer"""
+    if used is None:
+        used = HEADER.unpack_from(buffer, 0)[0]
+    position = HEADER.size
+    while position < used:
+        length = KEY_LENGTH.unpack_from(buffer, position)[0]
+        key = bytes(buffer[position + KEY_LENGTH.size:position + KEY_LENGTH.size + length]).decode('utf-8')
+        padded = KEY_LENGTH.size + length
+        padded += -padded % 8
+        offset = position + padded
+        yield key, VALUE.unpack_from(buffer, offset)[0], offset
+        position = offset + VALUE.size
+
+
+def read_file(path):
+    """{key: value} of a metrics file"""
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    if len(data) < HEADER.size:
+        return {}
+    return {key: value for key, value, _ in read_entries(data)}
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def _process_store():
+    """This process's MmapValues, reopened after a fork"""
+    global _store, _store_pid
+    pid = os.getpid()
+    if _store_pid != pid:
+        with _store_lock:
+            if _store_pid != pid:
+                _store = MmapValues(metrics_dir() / f'metrics_{pid}.db')
+                _store_pid = pid
+    return _store
+
+
+def _key(name, suffix, labels):
+    return json.dumps([name, suffix, sorted(labels.items())], separators=(',', ':'))
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    if metrics_enabled():
+        _process_store().inc(_key(name, '', labels), amount)
+
+
+def observe(name, value, **labels):
+    """Record one observation of a histogram"""
+    if not metrics_enabled():
+        return
+    buckets = METRICS[name][2]
+    bound = next((str(bucket) for bucket in buckets if value <= bucket), '+Inf')
+    store = _process_store()
+    store.inc(_key(name, 'bucket', {**labels, 'le': bound}), 1)
+    store.inc(_key(name, 'sum', labels), value)
+    store.inc(_key(name, 'count', labels), 1)
+
+
+@contextmanager
+def timed(name, **labels):
+    """Observe the duration of the block in a histogram"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def record_cache(cache, hit):
+    inc('invoices_cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+# ==================== COLLECTION ====================
+
+# nginx runs on the same host and proxies from loopback
+TRUSTED_PROXIES = ('127.0.0.1', '::1')
+
+
+def client_address(request):
+    """
+    The address a request came from. Behind nginx REMOTE_ADDR is always the
+    proxy's 127.0.0.1, so for proxied requests this is the address nginx saw:
+    X-Real-IP, else the last X-Forwarded-For hop (earlier hops are whatever
+    the client sent).
+    """
+    remote = request.META.get('REMOTE_ADDR')
+    if remote not in TRUSTED_PROXIES:
+        return remote
+    real_ip = request.META.get('HTTP_X_REAL_IP', '').strip()
+    if real_ip:
+        return real_ip
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    return hops[-1] if hops else remote
+
+
+def scrape_allowed(request):
+    """METRICS_TOKEN as a bearer token when set, else a client_address() in METRICS_ALLOWED_IPS"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').encode()
+        return hmac.compare_digest(supplied, f'Bearer {token}'.encode())
+    return client_address(request) in getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@contextmanager
+def _directory_lock(directory):
+    # Held while compacting and reading so a scrape never sees a dead
+    # process's values both in its own file and in the archive
+    with open(directory / 'metrics.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def compact_dead_processes(directory):
+    """Fold the files of exited processes into the archive file; call with the directory lock held"""
+    dead = []
+    for path in directory.glob('metrics_*.db'):
+        pid = path.stem.split('_', 1)[1]
+        if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+            dead.append(path)
+    if not dead:
+        return 0
+    archive = MmapValues(directory / ARCHIVE_NAME)
+    try:
+        for path in dead:
+            for key, value in read_file(path).items():
+                archive.inc(key, value)
+            path.unlink()
+    finally:
+        archive.close()
+    return len(dead)
+
+
+def collect(directory=None):
+    """{key: value} summed over every process file"""
+    directory = directory or metrics_dir()
+    totals = {}
+    with _directory_lock(directory):
+        compact_dead_processes(directory)
+        for path in directory.glob('metrics_*.db'):
+            for key, value in read_file(path).items():
+                totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _gauges():
+    """[(name, help, [(labels, value)])] read from the database at scrape time"""
+    from django.db.models import Count
+    from accounts.models import EmailOutbox
+    from .models import Job
+    outbox = dict(EmailOutbox.objects.exclude(status='SENT').values('status').annotate(n=Count('id')).values_list('status', 'n'))
+    jobs = dict(Job.objects.filter(status__in=['QUEUED', 'RUNNING']).values('queue').annotate(n=Count('id')).values_list('queue', 'n'))
+    return [
+        ('invoices_email_outbox_depth', 'Undelivered emails in the outbox by status',
+         [([('status', status)], outbox.get(status, 0)) for status in ('PENDING', 'FAILED', 'EXPIRED')]),
+        ('invoices_job_queue_depth', 'Queued or running background jobs by queue',
+         [([('queue', queue)], jobs.get(queue, 0)) for queue in sorted(set(getattr(settings, 'JOB_QUEUES', {})) | set(jobs))]),
+    ]
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    samples = {}
+    for key, value in collect().items():
+        name, suffix, labels = json.loads(key)
+        samples.setdefault(name, []).append((suffix, [tuple(label) for label in labels], value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        entries = samples.get(name, [])
+        if kind == 'counter':
+            for _, labels, value in sorted(entries):
+                lines.append(f'{name}{_labels_text(labels)} {_number(value)}')
+            continue
+
+        # Histogram buckets are stored per bucket and reported cumulatively
+        series = {}
+        for suffix, labels, value in entries:
+            base = tuple(label for label in labels if label[0] != 'le')
+            entry = series.setdefault(base, {'buckets': {}, 'sum': 0.0, 'count': 0.0})
+            if suffix == 'bucket':
+                entry['buckets'][dict(labels)['le']] = value
+            else:
+                entry[suffix] = value
+        for base, entry in sorted(series.items()):
+            cumulative = 0.0
+            for bound in [str(bucket) for bucket in buckets] + ['+Inf']:
+                cumulative += entry['buckets'].get(bound, 0.0)
+                lines.append(f'{name}_bucket{_labels_text(list(base) + [("le", bound)])} {_number(cumulative)}')
+            lines.append(f'{name}_sum{_labels_text(base)} {_number(entry["sum"])}')
+            lines.append(f'{name}_count{_labels_text(base)} {_number(entry["count"])}')
+
+    # Hit ratio per cache, derived from the lookup counters
+    lookups = {}
+    for _, labels, value in samples.get('invoices_cache_requests_total', []):
+        labels = dict(labels)
+        hits, total = lookups.get(labels['cache'], (0.0, 0.0))
+        lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0.0), total + value)
+    lines.append('# HELP invoices_cache_hit_ratio Share of cache lookups that were hits')
+    lines.append('# TYPE invoices_cache_hit_ratio gauge')
+    for cache, (hits, total) in sorted(lookups.items()):
+        lines.append(f'invoices_cache_hit_ratio{_labels_text([("cache", cache)])} {_number(round(hits / total, 4) if total else 0)}')
+
+    for name, help_text, values in _gauges():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in values:
+            lines.append(f'{name}{_labels_text(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,283 @@
+"""
+Per-request performance instrumentation
+
+QueryInstrumentationMiddleware wraps every database connection with
+connection.execute_wrapper() for the duration of a request and records the
+query count, time spent in the database, repeated query shapes (the usual
+sign of an N+1 loop) and template rendering time. The numbers go out in a
+Server-Timing header, which browsers show in the network panel, to staff
+users (or to everyone with SERVER_TIMING_HEADER, on by default only with
+DEBUG), and requests slower than SLOW_REQUEST_MS are logged as one JSON line. With
+SLOW_QUERY_CAPTURE on, slow queries are also queued for EXPLAIN (see
+invoices.slow_queries).
+
+Timings cover the work done until the view returns; rows a
+StreamingHttpResponse fetches while it is being sent are not included.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('invoices.performance')
+
+# Stats of the request being handled in this thread/task
+current_request_stats = ContextVar('current_request_stats', default=None)
+
+# Placeholder lists of any length reduce to one shape: IN (%s, %s, %s) -> IN (...)
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Query shape without parameter values, for spotting repeated queries"""
+    return PLACEHOLDER_LIST_RE.sub('(...)', WHITESPACE_RE.sub(' ', sql).strip())
+
+
+class RequestStats:
+    """Query and template timings of one request"""
+
+    def __init__(self, slow_query_ms=None):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.fingerprints = Counter()
+        # Capture SELECTs at least this slow, with their parameters; None to not capture
+        self.slow_query_ms = slow_query_ms
+        self.slow_queries = {}
+
+    def record_query(self, sql, duration, params=None, using='default'):
+        shape = fingerprint(sql)
+        self.query_count += 1
+        self.db_time += duration
+        self.fingerprints[shape] += 1
+        if self.slow_query_ms is not None and duration * 1000 >= self.slow_query_ms:
+            self.capture_slow_query(shape, sql, duration, params, using)
+
+    def capture_slow_query(self, shape, sql, duration, params, using):
+        """Keep the slowest execution of each query shape"""
+        from .slow_queries import is_explainable, jsonable
+
+        previous = self.slow_queries.get(shape)
+        if not is_explainable(sql) or (previous is not None and previous['duration_ms'] >= duration * 1000):
+            return
+        self.slow_queries[shape] = {
+            'sql': sql,
+            'params': jsonable(params),
+            'duration_ms': round(duration * 1000, 1),
+            'using': using,
+        }
+
+    def duplicates(self, limit=5):
+        """[(fingerprint, count)] of query shapes run more than once, most repeated first"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common(limit) if count > 1]
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+class QueryRecorder:
+    """execute_wrapper callable adding each query's duration to a RequestStats"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            if many:
+                self.stats.record_query(sql, duration)
+            else:
+                self.stats.record_query(sql, duration, params, context['connection'].alias)
+
+
+_template_timer_installed = False
+
+
+def install_template_timer():
+    """
+    Time top-level template renders (render(), render_to_string()) into the
+    current request's stats. {% include %} renders nested templates inside
+    the outer one, so only the outermost render is counted.
+    """
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def timed_render(self, context=None, request=None):
+        stats = current_request_stats.get()
+        if stats is None:
+            return original_render(self, context, request)
+        stats.template_depth += 1
+        started = time.perf_counter()
+        db_time_before = stats.db_time
+        try:
+            return original_render(self, context, request)
+        finally:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                # Querysets evaluated by the template count as db time, not template time
+                stats.template_time += time.perf_counter() - started - (stats.db_time - db_time_before)
+
+    Template.render = timed_render
+    _template_timer_installed = True
+
+
+def server_timing(stats, total):
+    """Server-Timing header value; durations in milliseconds"""
+    view_time = max(total - stats.db_time - stats.template_time, 0)
+    return ', '.join([
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"',
+        f'tpl;dur={stats.template_time * 1000:.1f};desc="Templates"',
+        f'view;dur={view_time * 1000:.1f};desc="View"',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+def staff_request(request):
+    """
+    Whether the request's user is staff, as far as the view already loaded it:
+    this runs outside AuthenticationMiddleware, and loading the user here
+    would add a session and user query to every anonymous request.
+    """
+    user = getattr(request, '_cached_user', None)
+    return user is not None and user.is_staff
+
+
+class QueryInstrumentationMiddleware:
+    """Record SQL and template time per request; see the module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SQL_INSTRUMENTATION', True)
+        self.slow_request_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+        self.server_timing = getattr(settings, 'SERVER_TIMING_HEADER', settings.DEBUG)
+        self.slow_query_ms = getattr(settings, 'SLOW_QUERY_MS', 100)
+        if self.enabled:
+            install_template_timer()
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        from .slow_queries import capture_enabled, queue_captures
+
+        stats = RequestStats(self.slow_query_ms if capture_enabled() else None)
+        token = current_request_stats.set(stats)
+        recorder = QueryRecorder(stats)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            current_request_stats.reset(token)
+
+        total = stats.total_time
+        request.performance_stats = stats
+        if self.server_timing or staff_request(request):
+            response['Server-Timing'] = server_timing(stats, total)
+        if total * 1000 >= self.slow_request_ms:
+            self.log_slow_request(request, response, stats, total)
+        if stats.slow_queries:
+            queue_captures(request, stats)
+        return response
+
+    def log_slow_request(self, request, response, stats, total):
+        user = getattr(request, 'user', None)
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'user_id': user.pk if user is not None and user.is_authenticated else None,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(stats.db_time * 1000, 1),
+            'template_ms': round(stats.template_time * 1000, 1),
+            'queries': stats.query_count,
+            'duplicates': [{'sql': sql[:300], 'count': count} for sql, count in stats.duplicates()],
+        }))
+
+
+class MetricsMiddleware:
+    """
+    Count requests and their latency and SQL per URL name into
+    invoices.metrics. Goes before QueryInstrumentationMiddleware so the
+    request's query stats are available when the response comes back.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        from . import metrics
+
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.view_name if match is not None else 'unmatched'
+        metrics.observe('invoices_http_request_duration_seconds', time.perf_counter() - started, url_name=url_name)
+        metrics.inc(
+            'invoices_http_requests_total',
+            url_name=url_name, method=request.method, status=f'{response.status_code // 100}xx',
+        )
+        stats = getattr(request, 'performance_stats', None)
+        if stats is not None:
+            metrics.inc('invoices_db_queries_total', stats.query_count, url_name=url_name)
+            metrics.inc('invoices_db_query_seconds_total', stats.db_time, url_name=url_name)
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Run a request under cProfile when a staff user asks for it with
+    ?_profile=1 or an X-Profile: 1 header (see invoices.profiling). Must come
+    after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', True)
+
+    def wants_profile(self, request):
+        if not self.enabled:
+            return False
+        requested = request.GET.get('_profile') == '1' or request.headers.get('X-Profile') == '1'
+        return requested and getattr(request, 'user', None) is not None and request.user.is_staff
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        import cProfile
+        from .profiling import save_profile
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        name = save_profile(profiler, request, response, time.perf_counter() - started)
+        response['X-Profile-Name'] = name
+        return response
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0013_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('success', models.BooleanField(default=False)),
+                ('output', models.TextField(blank=True, null=True)),
+                ('host', models.CharField(blank=True, help_text='Scheduler leader that ran the task', max_length=100, null=True)),
+            ],
+            options={
+                'db_table': 'scheduled_runs',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['name', '-started_at'], name='scheduled_r_name_df17ed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:12
+
+from decimal import Decimal, ROUND_HALF_EVEN
+from django.db import migrations, models
+
+
+# A frozen copy of invoices.amount_utils as of this migration, so later
+# changes to the live converter do not change what the migration writes
+ONES = [
+    '', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine',
+    'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen',
+    'Seventeen', 'Eighteen', 'Nineteen',
+]
+TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+SCALES = [(10 ** 7, 'Crore'), (10 ** 5, 'Lakh'), (10 ** 3, 'Thousand'), (10 ** 2, 'Hundred')]
+
+
+def integer_to_words(n):
+    if n == 0:
+        return 'Zero'
+    words = []
+    for divisor, name in SCALES:
+        if n >= divisor:
+            count, n = divmod(n, divisor)
+            words.append(f"{integer_to_words(count)} {name}")
+    if n:
+        words.append(ONES[n] if n < 20 else f"{TENS[n // 10]} {ONES[n % 10]}".strip())
+    return ' '.join(words)
+
+
+def amount_in_words(amount):
+    amount = Decimal('0') if amount is None else Decimal(str(amount))
+    amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN)
+    rupees, paise = divmod(int(abs(amount) * 100), 100)
+    words = f"Rupees {integer_to_words(rupees)}"
+    if paise:
+        words += f" and {integer_to_words(paise)} Paise"
+    words = f"{words} Only"
+    return f"Minus {words}" if amount < 0 else words
+
+
+def fill_amount_in_words(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')
+    batch = []
+    for invoice in Invoice.objects.only('id', 'total').iterator(chunk_size=2000):
+        invoice.amount_in_words = amount_in_words(invoice.total)
+        batch.append(invoice)
+        if len(batch) >= 2000:
+            Invoice.objects.bulk_update(batch, ['amount_in_words'])
+            batch = []
+    if batch:
+        Invoice.objects.bulk_update(batch, ['amount_in_words'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0014_scheduledrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_in_words',
+            field=models.CharField(blank=True, default='', help_text='Total in words, refreshed by calculate_totals', max_length=255),
+        ),
+        migrations.RunPython(fill_amount_in_words, migrations.RunPython.noop),
+    ]
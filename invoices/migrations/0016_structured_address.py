@@ -0,0 +1,172 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:18
+
+import re
+from django.db import migrations, models
+
+
+# A frozen copy of invoices.address_utils as of this migration, so later
+# changes to the live parser do not change what the migration writes
+ADDRESS_FIELDS = ('address_line1', 'address_line2', 'city', 'pin', 'state_code')
+LINE_MAX_LENGTH = 100
+
+STATE_CODES = {
+    '01': 'Jammu and Kashmir', '02': 'Himachal Pradesh', '03': 'Punjab', '04': 'Chandigarh',
+    '05': 'Uttarakhand', '06': 'Haryana', '07': 'Delhi', '08': 'Rajasthan', '09': 'Uttar Pradesh',
+    '10': 'Bihar', '11': 'Sikkim', '12': 'Arunachal Pradesh', '13': 'Nagaland', '14': 'Manipur',
+    '15': 'Mizoram', '16': 'Tripura', '17': 'Meghalaya', '18': 'Assam', '19': 'West Bengal',
+    '20': 'Jharkhand', '21': 'Odisha', '22': 'Chhattisgarh', '23': 'Madhya Pradesh', '24': 'Gujarat',
+    '26': 'Dadra and Nagar Haveli and Daman and Diu', '27': 'Maharashtra', '29': 'Karnataka',
+    '30': 'Goa', '31': 'Lakshadweep', '32': 'Kerala', '33': 'Tamil Nadu', '34': 'Puducherry',
+    '35': 'Andaman and Nicobar Islands', '36': 'Telangana', '37': 'Andhra Pradesh', '38': 'Ladakh',
+    '97': 'Other Territory', '96': 'Other Country',
+}
+CITY_STATES = {'04', '07'}
+STATE_NAMES = {
+    **{name.lower(): code for code, name in STATE_CODES.items() if code not in ('96', '97')},
+    'new delhi': '07', 'nct of delhi': '07', 'orissa': '21', 'pondicherry': '34',
+    'daman and diu': '26', 'dadra and nagar haveli': '26', 'j&k': '01',
+    'andaman & nicobar': '35', 'jammu & kashmir': '01', 'uttaranchal': '05',
+}
+STATE_NAME_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(name) for name in sorted(STATE_NAMES, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE,
+)
+PIN_RE = re.compile(r'(?:\b(?:pin(?:\s*code)?|pincode)\b\W*)?\b([1-9]\d{2}\s?\d{3})\b', re.IGNORECASE)
+COUNTRY_RE = re.compile(r'\bindia\b', re.IGNORECASE)
+LEFTOVER_RE = re.compile(r'^[\s\-–:()/.]+|[\s\-–:()/.]+$')
+
+
+def pack_lines(parts):
+    line1, line2 = '', ''
+    for part in parts:
+        if not line2 and len(line1) + len(part) + 2 <= LINE_MAX_LENGTH:
+            line1 = f'{line1}, {part}' if line1 else part
+        else:
+            line2 = f'{line2}, {part}' if line2 else part
+    return line1[:LINE_MAX_LENGTH], line2[:LINE_MAX_LENGTH]
+
+
+def parse_address(address, gstin=None):
+    parts = [part.strip() for part in re.split(r'[,\n]', (address or '').replace('\r\n', '\n'))]
+    parts = [part for part in parts if part]
+
+    pin = ''
+    state_code = ''
+    state_name = ''
+    city = ''
+    while parts:
+        part = parts[-1]
+        pin_match = PIN_RE.search(part)
+        if pin_match:
+            pin = pin or pin_match.group(1).replace(' ', '')
+            part = part[:pin_match.start()] + ' ' + part[pin_match.end():]
+        state_match = STATE_NAME_RE.search(part)
+        if state_match:
+            state_name = state_name or state_match.group(1)
+            state_code = state_code or STATE_NAMES[state_name.lower()]
+            part = part[:state_match.start()] + ' ' + part[state_match.end():]
+        part = LEFTOVER_RE.sub('', COUNTRY_RE.sub(' ', part))
+        if not part:
+            parts.pop()
+            if (state_match and STATE_NAMES[state_match.group(1).lower()] in CITY_STATES
+                    and not (parts and STATE_NAME_RE.fullmatch(parts[-1]))):
+                city = state_match.group(1)
+                break
+            continue
+        if len(parts) > 1:
+            city = part
+            parts.pop()
+        else:
+            parts[-1] = part
+        break
+
+    if not city:
+        city = state_name
+
+    if gstin and gstin[:2] in STATE_CODES:
+        state_code = gstin[:2]
+
+    line1, line2 = pack_lines(parts)
+    return {
+        'address_line1': line1,
+        'address_line2': line2,
+        'city': city[:50],
+        'pin': pin,
+        'state_code': state_code,
+    }
+
+
+def parse_existing_addresses(apps, schema_editor):
+    for model_name in ('Company', 'Client'):
+        Model = apps.get_model('invoices', model_name)
+        batch = []
+        for obj in Model.objects.only('id', 'address', 'gstin').iterator(chunk_size=2000):
+            for field, value in parse_address(obj.address, obj.gstin).items():
+                setattr(obj, field, value)
+            batch.append(obj)
+            if len(batch) >= 2000:
+                Model.objects.bulk_update(batch, ADDRESS_FIELDS)
+                batch = []
+        if batch:
+            Model.objects.bulk_update(batch, ADDRESS_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0015_invoice_amount_in_words'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='address_line1',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='address_line2',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='city',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='pin',
+            field=models.CharField(blank=True, help_text='6-digit PIN code', max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='state_code',
+            field=models.CharField(blank=True, help_text='GST State Code (e.g., 24 for Gujarat)', max_length=2, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='address_line1',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='address_line2',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='city',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='pin',
+            field=models.CharField(blank=True, help_text='6-digit PIN code', max_length=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='state_code',
+            field=models.CharField(blank=True, help_text='GST State Code (e.g., 24 for Gujarat)', max_length=2, null=True),
+        ),
+        migrations.RunPython(parse_existing_addresses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0016_structured_address'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'invoice_date'], name='invoices_company_c4d98c_idx'),
+        ),
+    ]
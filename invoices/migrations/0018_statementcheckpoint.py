@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:23
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0017_invoice_company_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('invoiced', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('received', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('closing_balance', models.DecimalField(decimal_places=2, help_text='Balance at month end', max_digits=14)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statement_checkpoints', to='invoices.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='statement_checkpoints', to='invoices.company')),
+            ],
+            options={
+                'db_table': 'statement_checkpoints',
+                'ordering': ['company', 'client', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('company', 'client', 'month'), name='unique_statement_checkpoint')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0018_statementcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint_hash', models.CharField(max_length=40, unique=True)),
+                ('fingerprint', models.TextField(help_text='Query shape without parameter values')),
+                ('sample_sql', models.TextField()),
+                ('sample_params', models.JSONField(blank=True, default=list)),
+                ('database', models.CharField(default='default', max_length=50)),
+                ('view_name', models.CharField(blank=True, default='', max_length=200)),
+                ('method', models.CharField(blank=True, default='', max_length=10)),
+                ('path', models.CharField(blank=True, default='', max_length=500)),
+                ('calls', models.PositiveIntegerField(default=0, help_text='Slow executions captured')),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('plan', models.TextField(blank=True, default='')),
+                ('plan_error', models.TextField(blank=True, default='')),
+                ('explained_at', models.DateTimeField(blank=True, null=True)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'db_table': 'slow_queries',
+                'ordering': ['-total_ms'],
+                'indexes': [models.Index(fields=['-last_seen'], name='slow_querie_last_se_e82ce0_idx')],
+            },
+        ),
+    ]
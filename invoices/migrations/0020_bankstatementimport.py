@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0019_slowquery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatementImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bank_name', models.CharField(blank=True, default='', max_length=200)),
+                ('matches', models.JSONField(default=list, help_text='Proposed matches (reconcile_utils.serialize_matches)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bank_statement_imports', to='invoices.company')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bank_statement_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'bank_statement_imports',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -1,18 +1,67 @@
 from django.db import models
+from django.db.models import DEFERRED
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+from .address_utils import ADDRESS_FIELDS, fill_address_fields
+from .amount_utils import amount_in_words
 
 User = get_user_model()
 
 
-class Client(models.Model):
+class StructuredAddressMixin:
+    """
+    Fill blank structured address fields from the free-text address on save.
+    When address or GSTIN changed since the object was loaded, fields still
+    holding their loaded value are parsed again too, so the old city, PIN and
+    state code do not outlive the address they came from; fields set by hand
+    in the same change are kept. Otherwise nothing is parsed, so a field the
+    user cleared is not filled in again on every save.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_address = instance._address_source()
+        return instance
+
+    def _address_source(self):
+        return tuple(self.__dict__.get(field, DEFERRED) for field in ('address', 'gstin') + ADDRESS_FIELDS)
+
+    def _address_changed(self):
+        return any(
+            before is not DEFERRED and before != after
+            for before, after in zip(self._loaded_address[:2], self._address_source())
+        )
+
+    def _unedited_address_fields(self):
+        """Structured fields not changed since the object was loaded"""
+        loaded = dict(zip(ADDRESS_FIELDS, self._loaded_address[2:]))
+        return {field for field in ADDRESS_FIELDS if self.__dict__.get(field, DEFERRED) == loaded[field]}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or getattr(self, '_loaded_address', None) is None:
+            fill_address_fields(self)
+        elif self._address_changed():
+            fill_address_fields(self, replace=self._unedited_address_fields())
+        super().save(*args, **kwargs)
+        self._loaded_address = self._address_source()
+
+
+class Client(StructuredAddressMixin, models.Model):
     """Client/Customer model"""
     name = models.CharField(max_length=200)
     email = models.EmailField()
     phone = models.CharField(max_length=20, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     gstin = models.CharField(max_length=15, blank=True, null=True, help_text="GSTIN (15 characters)")
+    # Parsed from address when it is set or changed (see address_utils)
+    address_line1 = models.CharField(max_length=100, blank=True, null=True)
+    address_line2 = models.CharField(max_length=100, blank=True, null=True)
+    city = models.CharField(max_length=50, blank=True, null=True)
+    pin = models.CharField(max_length=6, blank=True, null=True, help_text="6-digit PIN code")
+    state_code = models.CharField(max_length=2, blank=True, null=True, help_text="GST State Code (e.g., 24 for Gujarat)")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -162,6 +211,7 @@ class Invoice(models.Model):
     
     discount = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    amount_in_words = models.CharField(max_length=255, blank=True, default='', help_text="Total in words, refreshed by calculate_totals")
     
     # Place of supply
     place_of_supply = models.CharField(max_length=200, blank=True, null=True)
@@ -190,6 +240,8 @@ class Invoice(models.Model):
             models.Index(fields=['invoice_number']),
             models.Index(fields=['status']),
             models.Index(fields=['invoice_date']),
+            # Per-company period reports (GSTR-1, exports)
+            models.Index(fields=['company', 'invoice_date']),
         ]
     
     def __str__(self):
@@ -207,18 +259,14 @@ class Invoice(models.Model):
         self.tax_amount = self.cgst_amount + self.sgst_amount
         
         self.total = taxable_amount + self.tax_amount
+        self.amount_in_words = amount_in_words(self.total)
         self.save()
     
     def get_amount_in_words(self):
-        """Convert total amount to words"""
-        try:
-            from num2words import num2words
-            amount = float(self.total)
-            words = num2words(amount, lang='en_IN', to='currency', currency='INR')
-            return words.replace('euro', 'rupees').replace('cents', 'paisa').title()
-        except (ImportError, Exception):
-            # Fallback if num2words not installed or error
-            return f"Rupees {self.total:,.2f} Only"
+        """Total amount in words (stored by calculate_totals)"""
+        if self.amount_in_words:
+            return self.amount_in_words
+        return amount_in_words(self.total)
     
     def get_status_class(self):
         """Get CSS class for status badge"""
@@ -296,16 +344,16 @@ class InvoiceItem(models.Model):
     def __str__(self):
         return f"{self.invoice.invoice_number} - {self.description}"
     
-    def save(self, *args, **kwargs):
-        """Calculate total before saving"""
+    def save(self, *args, recalculate=True, **kwargs):
+        """Calculate total before saving; recalculate=False leaves the invoice totals to the caller"""
         self.total = self.quantity * self.rate
         super().save(*args, **kwargs)
         # Recalculate invoice totals
-        if self.invoice:
+        if recalculate and self.invoice:
             self.invoice.calculate_totals()
 
 
-class Company(models.Model):
+class Company(StructuredAddressMixin, models.Model):
     """Multiple companies per user"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='companies')
     name = models.CharField(max_length=200)
@@ -315,6 +363,12 @@ class Company(models.Model):
     address = models.TextField()
     email = models.EmailField(blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
+    # Parsed from address when it is set or changed (see address_utils)
+    address_line1 = models.CharField(max_length=100, blank=True, null=True)
+    address_line2 = models.CharField(max_length=100, blank=True, null=True)
+    city = models.CharField(max_length=50, blank=True, null=True)
+    pin = models.CharField(max_length=6, blank=True, null=True, help_text="6-digit PIN code")
+    state_code = models.CharField(max_length=2, blank=True, null=True, help_text="GST State Code (e.g., 24 for Gujarat)")
     
     # Invoice settings
     invoice_prefix = models.CharField(max_length=20, default='INV-')
@@ -353,11 +407,9 @@ class Company(models.Model):
     
     @classmethod
     def get_default(cls, user):
-        """Get default company for user"""
-        company = cls.objects.filter(user=user, is_default=True).first()
-        if not company:
-            company = cls.objects.filter(user=user, is_active=True).first()
-        return company
+        """Get default company for user: the default one, else the first active one (from the reference cache)"""
+        from .reference_cache import default_company
+        return default_company(user.pk)
     
     def get_next_invoice_number(self):
         """Generate next sequential invoice number for this company"""
@@ -491,6 +543,43 @@ class Payment(models.Model):
         return status_classes.get(self.status, 'pending')
 
 
+class StatementCheckpoint(models.Model):
+    """Closing balance of a client's account with a company at the end of a month"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='statement_checkpoints')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='statement_checkpoints')
+    month = models.DateField(help_text="First day of the month")
+    invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    received = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    closing_balance = models.DecimalField(max_digits=14, decimal_places=2, help_text="Balance at month end")
+    computed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'statement_checkpoints'
+        ordering = ['company', 'client', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'client', 'month'], name='unique_statement_checkpoint'),
+        ]
+    
+    def __str__(self):
+        return f"{self.client} @ {self.company} {self.month:%b %Y}: {self.closing_balance}"
+
+
+class BankStatementImport(models.Model):
+    """Payment proposals from an uploaded bank statement, kept until they are confirmed"""
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='bank_statement_imports')
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bank_statement_imports')
+    bank_name = models.CharField(max_length=200, blank=True, default='')
+    matches = models.JSONField(default=list, help_text="Proposed matches (reconcile_utils.serialize_matches)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'bank_statement_imports'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.company} statement of {self.created_at:%Y-%m-%d %H:%M} ({len(self.matches)} matches)"
+
+
 class CompanySettings(models.Model):
     """Legacy company settings - kept for backward compatibility"""
     company_name = models.CharField(max_length=200, default='ABC Technologies Pvt. Ltd.')
@@ -532,3 +621,137 @@ class CompanySettings(models.Model):
         """Get or create company settings"""
         obj, created = cls.objects.get_or_create(pk=1)
         return obj
+
+
+class Job(models.Model):
+    """Background job executed by the run_jobs command"""
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100, help_text="Registered job handler name")
+    queue = models.CharField(max_length=50, default='default')
+    priority = models.SmallIntegerField(default=100, help_text="Lower numbers run first")
+    payload = models.JSONField(default=dict, blank=True)
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(upload_to='jobs/', blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['queue', 'status', 'priority', 'run_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+    
+    def _finish(self, **fields):
+        """
+        Write a run's outcome only while this worker still holds the job: one
+        that stalled past JOB_LOCK_TIMEOUT must not overwrite the run of the
+        worker that claimed it again. Returns False (and leaves the instance
+        as it was) when the job is no longer ours.
+        """
+        owned = Job.objects.filter(pk=self.pk, status='RUNNING', locked_by=self.locked_by).update(**fields) == 1
+        if owned:
+            for name, value in fields.items():
+                setattr(self, name, value)
+        return owned
+    
+    def mark_done(self, result=None):
+        """Record a successful run; False if another worker has claimed the job since"""
+        return self._finish(
+            status='DONE', result=result, result_file=self.result_file.name or '', last_error=None,
+            locked_at=None, finished_at=timezone.now(),
+        )
+    
+    def mark_failed(self, error, retry=True):
+        """Record a failed run and requeue it with exponential backoff; False if the job is no longer ours"""
+        from django.conf import settings
+        backoff_seconds = getattr(settings, 'JOB_RETRY_BACKOFF_SECONDS', 30)
+        
+        fields = {'last_error': str(error), 'locked_at': None}
+        if retry and self.attempts < self.max_attempts:
+            delay = min(backoff_seconds * (2 ** max(self.attempts - 1, 0)), 3600)
+            fields.update(status='QUEUED', run_at=timezone.now() + timezone.timedelta(seconds=delay))
+        else:
+            fields.update(status='FAILED', finished_at=timezone.now())
+        return self._finish(**fields)
+
+
+class ScheduledRun(models.Model):
+    """One execution of a run_scheduler task, kept to spot slow tasks"""
+    name = models.CharField(max_length=100)
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+    success = models.BooleanField(default=False)
+    output = models.TextField(blank=True, null=True)
+    host = models.CharField(max_length=100, blank=True, null=True, help_text="Scheduler leader that ran the task")
+    
+    class Meta:
+        db_table = 'scheduled_runs'
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['name', '-started_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} at {self.started_at:%Y-%m-%d %H:%M} ({self.duration_ms} ms)"
+
+
+class SlowQuery(models.Model):
+    """A query shape that ran slower than SLOW_QUERY_MS, with its latest plan (see invoices.slow_queries)"""
+    fingerprint_hash = models.CharField(max_length=40, unique=True)
+    fingerprint = models.TextField(help_text="Query shape without parameter values")
+    sample_sql = models.TextField()
+    sample_params = models.JSONField(default=list, blank=True)
+    database = models.CharField(max_length=50, default='default')
+    
+    # Where the slowest sample came from
+    view_name = models.CharField(max_length=200, blank=True, default='')
+    method = models.CharField(max_length=10, blank=True, default='')
+    path = models.CharField(max_length=500, blank=True, default='')
+    
+    calls = models.PositiveIntegerField(default=0, help_text="Slow executions captured")
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    
+    plan = models.TextField(blank=True, default='')
+    plan_error = models.TextField(blank=True, default='')
+    explained_at = models.DateTimeField(null=True, blank=True)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'slow_queries'
+        ordering = ['-total_ms']
+        verbose_name_plural = 'slow queries'
+        indexes = [
+            models.Index(fields=['-last_seen']),
+        ]
+    
+    def __str__(self):
+        return f"{self.fingerprint[:80]} ({self.calls} x, max {self.max_ms:.0f} ms)"
+    
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
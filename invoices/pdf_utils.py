@@ -10,10 +10,38 @@ from reportlab.lib.enums import TA_LEFT, TA_CENTER, TA_RIGHT
 from io import BytesIO
 from decimal import Decimal
 import os
+from .validation_utils import STATE_CODES
+from . import metrics
+
+
+def _address_html(party):
+    """Company/client address from the structured fields, falling back to the free text"""
+    if not party.address_line1:
+        return (party.address or '').replace('\r\n', '<br/>').replace('\n', '<br/>')
+    lines = [party.address_line1]
+    if party.address_line2:
+        lines.append(party.address_line2)
+    place = party.city or ''
+    if party.pin:
+        place = f"{place}, Pin - {party.pin}" if place else f"Pin - {party.pin}"
+    if party.state_code in STATE_CODES:
+        place += f" ( {STATE_CODES[party.state_code]} , INDIA )"
+    if place:
+        lines.append(place)
+    return '<br/>'.join(lines)
 
 
 def generate_invoice_pdf(invoice, items, company, client):
-    """Generate PDF for tax invoice using ReportLab - matching exact format from image"""
+    """Generate PDF for tax invoice as a downloadable HttpResponse"""
+    pdf_bytes = build_invoice_pdf(invoice, items, company, client)
+    response = HttpResponse(pdf_bytes, content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="Invoice_{invoice.invoice_number}.pdf"'
+    return response
+
+
+@metrics.timed('invoices_pdf_render_seconds', document='invoice')
+def build_invoice_pdf(invoice, items, company, client):
+    """Build PDF bytes for tax invoice using ReportLab - matching exact format from image"""
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, 
                            rightMargin=10*mm, leftMargin=10*mm,
@@ -128,18 +156,17 @@ def generate_invoice_pdf(invoice, items, company, client):
     # ==================== CLIENT AND INVOICE DETAILS (TWO COLUMNS) ====================
     # Left Column: Client (Recipient) Details
     client_text = f"<b>{client.name}</b><br/>"
-    if client.address:
-        # Clean up address formatting
-        addr_lines = client.address.replace('\r\n', '<br/>').replace('\n', '<br/>')
-        client_text += addr_lines
+    client_text += _address_html(client)
+    if client.gstin:
+        client_text += f"<br/><b>GSTIN :</b> {client.gstin}"
+    if client.state_code:
+        client_text += f"<br/><b>State Code -</b> {client.state_code}"
     
     # Right Column: Billing Address + Invoice Details
     right_text = f"<b>Billing Address ({company.name}):</b><br/>"
-    if company.address:
-        right_text += f"{company.address}<br/>"
-    # Add state/pin if in place of supply
-    if invoice.place_of_supply:
-        right_text += f"Surat, Pin - 394130 ( Gujarat , INDIA )<br/>"
+    company_address = _address_html(company)
+    if company_address:
+        right_text += f"{company_address}<br/>"
     if invoice.vendor_code:
         right_text += f"<b>Vendor Code :</b> {invoice.vendor_code}<br/>"
     if company.gstin:
@@ -253,7 +280,7 @@ def generate_invoice_pdf(invoice, items, company, client):
     
     # ==================== AMOUNT IN WORDS ====================
     amount_words = invoice.get_amount_in_words()
-    words_data = [[Paragraph(f"<b>Rupees -</b> {amount_words.upper()}", normal_style)]]
+    words_data = [[Paragraph(f"<b>Amount in Words :</b> {amount_words.upper()}", normal_style)]]
     words_table = Table(words_data, colWidths=[190*mm])
     words_table.setStyle(TableStyle([
         ('BOX', (0, 0), (-1, -1), 1, colors.black),
@@ -308,8 +335,117 @@ def generate_invoice_pdf(invoice, items, company, client):
     
     # Build PDF
     doc.build(elements)
-    buffer.seek(0)
+    return buffer.getvalue()
+
+
+@metrics.timed('invoices_pdf_render_seconds', document='statement')
+def build_statement_pdf(statement):
+    """Build PDF bytes for a client statement of account (see receivables_utils.build_client_statement)"""
+    company = statement['company']
+    client = statement['client']
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4,
+                           rightMargin=10*mm, leftMargin=10*mm,
+                           topMargin=10*mm, bottomMargin=10*mm,
+                           title=f"Statement - {client.name}")
     
-    response = HttpResponse(buffer.read(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Invoice_{invoice.invoice_number}.pdf"'
-    return response
+    elements = []
+    styles = getSampleStyleSheet()
+    
+    company_title_style = ParagraphStyle(
+        'CompanyTitle',
+        parent=styles['Heading1'],
+        fontSize=14,
+        alignment=TA_CENTER,
+        spaceAfter=2,
+        fontName='Helvetica-Bold',
+    )
+    company_detail_style = ParagraphStyle(
+        'CompanyDetail',
+        parent=styles['Normal'],
+        fontSize=9,
+        alignment=TA_CENTER,
+        spaceAfter=1,
+    )
+    title_style = ParagraphStyle(
+        'StatementTitle',
+        parent=styles['Heading1'],
+        fontSize=12,
+        alignment=TA_CENTER,
+        spaceBefore=4,
+        spaceAfter=4,
+        fontName='Helvetica-Bold',
+    )
+    normal_style = ParagraphStyle(
+        'Normal',
+        parent=styles['Normal'],
+        fontSize=8,
+        leading=10,
+    )
+    
+    # ==================== HEADER ====================
+    elements.append(Paragraph(f"<b>{company.name}</b>", company_title_style))
+    company_address = _address_html(company)
+    if company_address:
+        elements.append(Paragraph(company_address, company_detail_style))
+    if company.gstin:
+        elements.append(Paragraph(f"GSTIN : {company.gstin}", company_detail_style))
+    elements.append(Paragraph("STATEMENT OF ACCOUNT", title_style))
+    
+    client_text = f"<b>{client.name}</b><br/>{_address_html(client)}"
+    if client.gstin:
+        client_text += f"<br/><b>GSTIN :</b> {client.gstin}"
+    period_text = (
+        f"<b>Period:</b> {statement['date_from'].strftime('%d/%m/%Y')} to {statement['date_to'].strftime('%d/%m/%Y')}<br/>"
+        f"<b>Opening Balance:</b> {statement['opening_balance']:,.2f}<br/>"
+        f"<b>Closing Balance:</b> {statement['closing_balance']:,.2f}"
+    )
+    header_table = Table([[Paragraph(client_text, normal_style), Paragraph(period_text, normal_style)]],
+                         colWidths=[95*mm, 95*mm])
+    header_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+    ]))
+    elements.append(header_table)
+    elements.append(Spacer(1, 3*mm))
+    
+    # ==================== ENTRIES ====================
+    rows = [['Date', 'Type', 'Reference', 'Particulars', 'Debit', 'Credit', 'Balance']]
+    rows.append([statement['date_from'].strftime('%d/%m/%Y'), '', '', 'Opening Balance', '', '',
+                 f"{statement['opening_balance']:,.2f}"])
+    for entry in statement['entries']:
+        rows.append([
+            entry['date'].strftime('%d/%m/%Y'),
+            entry['type'].title(),
+            entry['reference'],
+            Paragraph(entry['description'], normal_style),
+            f"{entry['debit']:,.2f}" if entry['debit'] else '',
+            f"{entry['credit']:,.2f}" if entry['credit'] else '',
+            f"{entry['balance']:,.2f}",
+        ])
+    rows.append(['', '', '', 'Closing Balance', f"{statement['total_debit']:,.2f}",
+                 f"{statement['total_credit']:,.2f}", f"{statement['closing_balance']:,.2f}"])
+    
+    entries_table = Table(rows, colWidths=[20*mm, 18*mm, 32*mm, 45*mm, 25*mm, 25*mm, 25*mm], repeatRows=1)
+    entries_table.setStyle(TableStyle([
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.85, 0.85, 0.85)),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (4, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('LEFTPADDING', (0, 0), (-1, -1), 3),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+        ('TOPPADDING', (0, 0), (-1, -1), 3),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+    ]))
+    elements.append(entries_table)
+    
+    doc.build(elements)
+    return buffer.getvalue()
@@ -0,0 +1,106 @@
+"""
+On-demand request profiles
+
+A staff user adds ?_profile=1 (or the X-Profile: 1 header) to any URL and
+ProfilerMiddleware runs that request under cProfile. Each profile is kept as
+two files in PROFILE_DIR:
+
+- <name>.prof: raw pstats data; open it with snakeviz or turn it into a call
+  graph with gprof2dot
+- <name>.txt: the top functions by cumulative and by own time
+
+Only the newest PROFILE_MAX_COUNT profiles are kept.
+"""
+import io
+import json
+import pstats
+import re
+import time
+from pathlib import Path
+from django.conf import settings
+
+
+PROFILE_NAME_RE = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[A-Za-z0-9_.-]{1,80}$')
+TOP_FUNCTIONS = 40
+
+
+def profile_dir():
+    path = Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _slug(path):
+    return re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_')[:60] or 'root'
+
+
+def profile_report(profiler, limit=TOP_FUNCTIONS):
+    """Text listing of the top functions by cumulative and by own time"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.strip_dirs()
+    stats.sort_stats('cumulative').print_stats(limit)
+    stats.sort_stats('tottime').print_stats(limit)
+    return output.getvalue()
+
+
+def save_profile(profiler, request, response, elapsed):
+    """Write the .prof and .txt files for a profiled request and rotate old ones; returns the profile name"""
+    now = time.time()
+    name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1e6) % 1000000:06d}-{_slug(request.path)}"
+    directory = profile_dir()
+    profiler.dump_stats(str(directory / f'{name}.prof'))
+
+    header = {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'user': request.user.get_username(),
+        'elapsed_ms': round(elapsed * 1000, 1),
+    }
+    (directory / f'{name}.txt').write_text(json.dumps(header) + '\n\n' + profile_report(profiler))
+    rotate_profiles(directory)
+    return name
+
+
+def rotate_profiles(directory=None):
+    """Delete all but the newest PROFILE_MAX_COUNT profiles"""
+    directory = directory or profile_dir()
+    keep = getattr(settings, 'PROFILE_MAX_COUNT', 50)
+    reports = sorted(directory.glob('*.txt'), reverse=True)
+    for report in reports[keep:]:
+        for path in (report, report.with_suffix('.prof')):
+            # Another worker may be rotating at the same time
+            path.unlink(missing_ok=True)
+
+
+def list_profiles():
+    """Newest first: dicts with name, method, path, status, user, elapsed_ms and size"""
+    profiles = []
+    for report in sorted(profile_dir().glob('*.txt'), reverse=True):
+        try:
+            with report.open() as handle:
+                header = json.loads(handle.readline())
+        except (OSError, ValueError):
+            continue
+        prof = report.with_suffix('.prof')
+        profiles.append({
+            'name': report.stem,
+            'size': prof.stat().st_size if prof.exists() else 0,
+            **header,
+        })
+    return profiles
+
+
+def read_profile(path):
+    """(request header dict, report text) of a stored .txt profile"""
+    header, _, report = path.read_text().partition('\n\n')
+    return json.loads(header), report
+
+
+def profile_path(name, suffix):
+    """Path of a stored profile file, or None for names that are not ours"""
+    if not PROFILE_NAME_RE.match(name or ''):
+        return None
+    path = profile_dir() / f'{name}{suffix}'
+    return path if path.exists() else None
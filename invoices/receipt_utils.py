@@ -0,0 +1,153 @@
+"""
+Customer receipts settling many invoices at once
+
+One remittance (amount received, less TDS and fine) is spread over a
+client's open invoices, oldest due date first or as split by hand, and booked
+as one Payment per invoice through bulk_record_payments(), which bank
+reconciliation uses as well.
+
+Recording locks the client's open invoices before allocating, so two
+receipts posted at once are allocated one after the other and cannot both
+settle the same balance.
+"""
+from decimal import Decimal
+from django.db import transaction
+from .einvoice_utils import ZERO, money
+from .receivables_utils import invalidate_payment_checkpoints, open_invoices, refresh_invoice_statuses
+
+
+def client_open_invoices(company, client):
+    """Open invoices of a client with a company, oldest due first, as dicts with `outstanding`"""
+    from .models import Invoice
+    rows = open_invoices(Invoice.objects.filter(company=company, client=client)).values(
+        'id', 'invoice_number', 'invoice_date', 'due_date', 'total', 'outstanding',
+    ).order_by('due_date', 'invoice_date', 'id')
+    return [{**row, 'outstanding': money(row['outstanding'])} for row in rows]
+
+
+def allocate_fifo(net_amount, invoices):
+    """{invoice id: amount} settling `invoices` in order until `net_amount` runs out"""
+    allocations = {}
+    remaining = net_amount
+    for invoice in invoices:
+        if remaining <= 0:
+            break
+        allocated = min(remaining, invoice['outstanding'])
+        allocations[invoice['id']] = allocated
+        remaining -= allocated
+    if remaining > 0:
+        raise ValueError(f'₹{remaining:,.2f} is more than the client owes on open invoices.')
+    return allocations
+
+
+def check_allocations(allocations, net_amount, invoices):
+    """Validate a manual split: known open invoices, within outstanding, adding up to the net amount"""
+    outstanding = {invoice['id']: invoice for invoice in invoices}
+    for invoice_id, amount in allocations.items():
+        if invoice_id not in outstanding:
+            raise ValueError(f'Invoice {invoice_id} is not an open invoice of this client.')
+        if amount < 0:
+            raise ValueError(f"Allocation to {outstanding[invoice_id]['invoice_number']} cannot be negative.")
+        if amount > outstanding[invoice_id]['outstanding']:
+            raise ValueError(
+                f"₹{amount:,.2f} is more than the ₹{outstanding[invoice_id]['outstanding']:,.2f} "
+                f"outstanding on {outstanding[invoice_id]['invoice_number']}."
+            )
+    allocated = sum(allocations.values(), ZERO)
+    if allocated != net_amount:
+        raise ValueError(f'Allocations add up to ₹{allocated:,.2f}, not the net receipt of ₹{net_amount:,.2f}.')
+    return {invoice_id: amount for invoice_id, amount in allocations.items() if amount > 0}
+
+
+def _share(value, part, whole):
+    return money(value * part / whole) if whole else ZERO
+
+
+def build_receipt_payments(receipt, allocations, user=None):
+    """
+    Unsaved Payment objects, one per allocation. TDS and fine are split in
+    proportion to each invoice's share; the last invoice takes the rounding
+    difference, so the rows add up to the receipt exactly.
+    """
+    from .models import Payment
+    net_amount = sum(allocations.values(), ZERO)
+    tds_left = receipt['tds_amount']
+    fine_left = receipt['fine_amount']
+    payments = []
+    for position, (invoice_id, net) in enumerate(allocations.items(), 1):
+        if position == len(allocations):
+            tds, fine = tds_left, fine_left
+        else:
+            tds = _share(receipt['tds_amount'], net, net_amount)
+            fine = _share(receipt['fine_amount'], net, net_amount)
+        tds_left -= tds
+        fine_left -= fine
+        payments.append(Payment(
+            invoice_id=invoice_id,
+            payment_date=receipt['payment_date'],
+            amount=net + tds + fine,
+            tds_amount=tds,
+            tds_percentage=receipt.get('tds_percentage') or ZERO,
+            fine_amount=fine,
+            net_amount=net,
+            payment_method=receipt['payment_method'],
+            reference_number=receipt.get('reference_number') or None,
+            bank_name=receipt.get('bank_name') or None,
+            remarks=receipt.get('remarks') or None,
+            status='RECEIVED',
+            is_on_hold=False,
+            created_by=user,
+        ))
+    return payments
+
+
+def receipt_allocations(company, client, receipt, manual=None):
+    """
+    (open invoices, {invoice id: net amount}) for a receipt: `manual` is a
+    {invoice id: amount} split, otherwise the net amount is allocated FIFO.
+    Raises ValueError when the receipt cannot be allocated.
+    """
+    invoices = client_open_invoices(company, client)
+    net_amount = receipt['amount'] - receipt['tds_amount'] - receipt['fine_amount']
+    if manual:
+        allocations = check_allocations({key: money(Decimal(value)) for key, value in manual.items()}, net_amount, invoices)
+    else:
+        allocations = allocate_fifo(net_amount, invoices)
+    return invoices, allocations
+
+
+def lock_open_invoices(company, client):
+    """Lock a client's issued, unpaid invoices with a company until the transaction ends"""
+    from .models import Invoice
+    return list(
+        Invoice.objects.select_for_update().filter(company=company, client=client)
+        .exclude(status__in=['DRAFT', 'PAID']).values_list('pk', flat=True)
+    )
+
+
+def record_receipt(company, client, receipt, manual=None, user=None):
+    """
+    Allocate a receipt as receipt_allocations() does and book it, in one
+    transaction with the client's open invoices locked. Returns
+    (allocations, payments); raises ValueError when it cannot be allocated.
+    """
+    with transaction.atomic():
+        lock_open_invoices(company, client)
+        _, allocations = receipt_allocations(company, client, receipt, manual=manual)
+        if not allocations:
+            return allocations, []
+        return allocations, bulk_record_payments(build_receipt_payments(receipt, allocations, user))
+
+
+def bulk_record_payments(payments):
+    """
+    Insert unsaved Payment objects with one bulk_create, then do once for the
+    batch what Payment.save() and the signals do per row: refresh invoice
+    statuses and drop stale statement checkpoints. net_amount must be set.
+    """
+    from .models import Payment
+    with transaction.atomic():
+        Payment.objects.bulk_create(payments, batch_size=1000)
+        refresh_invoice_statuses({payment.invoice_id for payment in payments})
+        invalidate_payment_checkpoints(payments)
+    return payments
@@ -0,0 +1,355 @@
+"""
+Receivables reports computed in the database
+
+Outstanding balances follow Invoice.get_outstanding_amount(): invoice total
+minus RECEIVED payments that are not on hold (net of TDS/fine/adjustments).
+Here the payment sum is a correlated subquery, so a whole report is a single
+grouped query instead of one get_outstanding_amount() call per invoice.
+"""
+import csv
+import io
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from .einvoice_utils import ZERO, money
+
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+# (key, label, min days overdue, max days overdue)
+AGING_BUCKETS = [
+    ('current', 'Current', None, 0),
+    ('days_1_30', '1-30 Days', 1, 30),
+    ('days_31_60', '31-60 Days', 31, 60),
+    ('days_61_90', '61-90 Days', 61, 90),
+    ('days_90_plus', '90+ Days', 91, None),
+]
+
+
+def paid_amount_subquery():
+    """Sum of an invoice's received, not-on-hold payments (0 when there are none)"""
+    from .models import Payment
+    paid = Payment.objects.filter(
+        invoice=OuterRef('pk'), status='RECEIVED', is_on_hold=False,
+    ).values('invoice').annotate(paid=Sum('net_amount')).values('paid')
+    return Coalesce(Subquery(paid, output_field=AMOUNT), Value(ZERO), output_field=AMOUNT)
+
+
+def open_invoices(invoices):
+    """Issued, unpaid invoices annotated with `outstanding` (> 0)"""
+    return invoices.exclude(status__in=['DRAFT', 'PAID']).annotate(
+        outstanding=ExpressionWrapper(F('total') - paid_amount_subquery(), output_field=AMOUNT),
+    ).filter(outstanding__gt=0)
+
+
+def _bucket_sums(as_of):
+    """Sum(outstanding) per aging bucket, bucketed on due_date relative to `as_of`"""
+    sums = {}
+    for key, label, min_days, max_days in AGING_BUCKETS:
+        condition = {}
+        if min_days is not None:
+            condition['due_date__lte'] = as_of - timedelta(days=min_days)
+        if max_days is not None:
+            condition['due_date__gte'] = as_of - timedelta(days=max_days)
+        sums[key] = Sum(Case(When(then=F('outstanding'), **condition), default=Value(ZERO), output_field=AMOUNT))
+    return sums
+
+
+def aging_totals(invoices, as_of=None):
+    """Bucket totals across `invoices` in one query (dashboard widget)"""
+    as_of = as_of or date.today()
+    totals = open_invoices(invoices).aggregate(
+        total=Sum('outstanding'), invoice_count=Count('id'), **_bucket_sums(as_of),
+    )
+    return {key: (value if value is not None else ZERO) for key, value in totals.items()}
+
+
+def aging_report(invoices, as_of=None):
+    """
+    Outstanding per company and client split into AGING_BUCKETS.
+
+    Returns {'as_of', 'buckets', 'rows', 'totals'}; rows are ordered by total
+    outstanding, largest first.
+    """
+    as_of = as_of or date.today()
+    rows = list(open_invoices(invoices).values(
+        'company_id', 'company__name', 'client_id', 'client__name',
+    ).annotate(
+        total=Sum('outstanding'), invoice_count=Count('id'), **_bucket_sums(as_of),
+    ).order_by('-total', 'client__name'))
+
+    bucket_keys = [key for key, _, _, _ in AGING_BUCKETS]
+    for row in rows:
+        for key in bucket_keys + ['total']:
+            row[key] = money(row[key])
+    totals = {key: sum((row[key] for row in rows), ZERO) for key in bucket_keys + ['total']}
+    totals['invoice_count'] = sum(row['invoice_count'] for row in rows)
+    # Bucket amounts in column order, for templates
+    for entry in rows + [totals]:
+        entry['amounts'] = [entry[key] for key in bucket_keys]
+    return {
+        'as_of': as_of,
+        'buckets': [(key, label) for key, label, _, _ in AGING_BUCKETS],
+        'rows': rows,
+        'totals': totals,
+    }
+
+
+def aging_csv(report):
+    """CSV text of an aging_report()"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Company', 'Client', 'Invoices'] + [label for _, label in report['buckets']] + ['Total Outstanding'])
+    for row in report['rows']:
+        writer.writerow(
+            [row['company__name'], row['client__name'], row['invoice_count']]
+            + [row[key] for key, _ in report['buckets']] + [row['total']]
+        )
+    totals = report['totals']
+    writer.writerow(['Total', '', totals['invoice_count']] + [totals[key] for key, _ in report['buckets']] + [totals['total']])
+    return output.getvalue()
+
+
+# ==================== CLIENT STATEMENT ====================
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _to_decimal(value):
+    # SQLite hands back floats for computed columns
+    if value is None:
+        return ZERO
+    return money(value if isinstance(value, Decimal) else Decimal(str(value)))
+
+
+def _ledger_filters(company, client):
+    from .models import Invoice, Payment
+    invoices = Invoice.objects.filter(company=company, client=client).exclude(status='DRAFT')
+    payments = Payment.objects.filter(
+        invoice__company=company, invoice__client=client, status='RECEIVED', is_on_hold=False,
+    ).exclude(invoice__status='DRAFT')
+    return invoices, payments
+
+
+def _movement(company, client, date_from, date_to):
+    """(invoiced, received) between two dates inclusive"""
+    invoices, payments = _ledger_filters(company, client)
+    invoiced = invoices.filter(invoice_date__gte=date_from, invoice_date__lte=date_to).aggregate(total=Sum('total'))['total']
+    received = payments.filter(payment_date__gte=date_from, payment_date__lte=date_to).aggregate(total=Sum('net_amount'))['total']
+    return _to_decimal(invoiced), _to_decimal(received)
+
+
+def lock_ledger(client_id):
+    """
+    Lock a client's row until the transaction ends. Checkpoint builds and
+    invalidations both take it, so a build either finishes before a change
+    commits (and the change's invalidation deletes what it stored) or starts
+    after it and reads the committed change; it never stores a balance from
+    before a change that has already invalidated.
+    """
+    from .models import Client
+    list(Client.objects.select_for_update().filter(pk=client_id).values_list('pk', flat=True))
+
+
+def ensure_checkpoints(company, client, through_month):
+    """
+    Make sure StatementCheckpoint rows exist for every month up to
+    `through_month` (first day of a completed month) and return the latest one.
+
+    Only months after the newest stored checkpoint are computed, with one
+    grouped query each for invoices and payments, under lock_ledger().
+    """
+    from .models import StatementCheckpoint
+
+    checkpoints = StatementCheckpoint.objects.filter(company=company, client=client)
+    latest = checkpoints.filter(month__lte=through_month).order_by('-month').first()
+    if latest and latest.month == through_month:
+        return latest
+
+    with transaction.atomic(savepoint=False):
+        lock_ledger(client.pk)
+        # Read again under the lock: another request may have built or dropped some
+        latest = checkpoints.filter(month__lte=through_month).order_by('-month').first()
+        if latest and latest.month == through_month:
+            return latest
+        return _build_checkpoints(company, client, latest, through_month)
+
+
+def _build_checkpoints(company, client, latest, through_month):
+    from django.db.models.functions import TruncMonth
+    from .models import StatementCheckpoint
+
+    invoices, payments = _ledger_filters(company, client)
+    start = _next_month(latest.month) if latest else None
+    if start:
+        invoices = invoices.filter(invoice_date__gte=start)
+        payments = payments.filter(payment_date__gte=start)
+    end = _next_month(through_month)
+    invoiced = dict(
+        invoices.filter(invoice_date__lt=end).annotate(m=TruncMonth('invoice_date'))
+        .values('m').annotate(total=Sum('total')).values_list('m', 'total')
+    )
+    received = dict(
+        payments.filter(payment_date__lt=end).annotate(m=TruncMonth('payment_date'))
+        .values('m').annotate(total=Sum('net_amount')).values_list('m', 'total')
+    )
+    months = set(invoiced) | set(received)
+    if not months and latest is None:
+        return None
+
+    month = start or min(months)
+    balance = latest.closing_balance if latest else ZERO
+    new_checkpoints = []
+    while month <= through_month:
+        month_invoiced = _to_decimal(invoiced.get(month))
+        month_received = _to_decimal(received.get(month))
+        balance += month_invoiced - month_received
+        new_checkpoints.append(StatementCheckpoint(
+            company=company, client=client, month=month,
+            invoiced=month_invoiced, received=month_received, closing_balance=balance,
+        ))
+        month = _next_month(month)
+    # SQLite has no row locks: another process may have filled the same months
+    StatementCheckpoint.objects.bulk_create(new_checkpoints, ignore_conflicts=True)
+    return new_checkpoints[-1] if new_checkpoints else latest
+
+
+def opening_balance(company, client, date_from):
+    """Balance before `date_from`: nearest month-end checkpoint plus the days since"""
+    first_of_month = month_start(date_from)
+    checkpoint = ensure_checkpoints(company, client, month_start(first_of_month - timedelta(days=1)))
+    balance = checkpoint.closing_balance if checkpoint else ZERO
+    if date_from > first_of_month:
+        invoiced, received = _movement(company, client, first_of_month, date_from - timedelta(days=1))
+        balance += invoiced - received
+    return balance
+
+
+STATEMENT_SQL = """
+    SELECT entry_date, entry_type, reference, description, debit, credit,
+           SUM(debit - credit) OVER (ORDER BY entry_date, sort_order, entry_id ROWS UNBOUNDED PRECEDING) AS movement
+    FROM (
+        SELECT i.invoice_date AS entry_date, 'INVOICE' AS entry_type, 0 AS sort_order, i.id AS entry_id,
+               i.invoice_number AS reference, i.po_number AS description, i.total AS debit, 0 AS credit
+        FROM {invoices} i
+        WHERE i.company_id = %s AND i.client_id = %s AND i.status <> 'DRAFT'
+          AND i.invoice_date >= %s AND i.invoice_date <= %s
+        UNION ALL
+        SELECT p.payment_date, 'PAYMENT', 1, p.id,
+               i.invoice_number, p.reference_number, 0, p.net_amount
+        FROM {payments} p
+        JOIN {invoices} i ON i.id = p.invoice_id
+        WHERE i.company_id = %s AND i.client_id = %s AND i.status <> 'DRAFT'
+          AND p.status = 'RECEIVED' AND p.is_on_hold = %s
+          AND p.payment_date >= %s AND p.payment_date <= %s
+    ) entries
+    ORDER BY entry_date, sort_order, entry_id
+"""
+
+
+def build_client_statement(company, client, date_from, date_to):
+    """
+    Invoices and payments of a client with a company in date order, each with
+    the running balance. The running sum is a SQL window function over the
+    period; the opening balance comes from the nearest monthly checkpoint.
+    """
+    from django.db import connection
+    from .models import Invoice, Payment
+
+    opening = opening_balance(company, client, date_from)
+    sql = STATEMENT_SQL.format(invoices=Invoice._meta.db_table, payments=Payment._meta.db_table)
+    params = [company.pk, client.pk, date_from, date_to, company.pk, client.pk, False, date_from, date_to]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    entries = []
+    for entry_date, entry_type, reference, description, debit, credit, movement in rows:
+        entries.append({
+            'date': entry_date if isinstance(entry_date, date) else date.fromisoformat(entry_date),
+            'type': entry_type,
+            'reference': reference,
+            'description': description or '',
+            'debit': _to_decimal(debit),
+            'credit': _to_decimal(credit),
+            'balance': opening + _to_decimal(movement),
+        })
+
+    total_debit = sum((entry['debit'] for entry in entries), ZERO)
+    total_credit = sum((entry['credit'] for entry in entries), ZERO)
+    return {
+        'company': company,
+        'client': client,
+        'date_from': date_from,
+        'date_to': date_to,
+        'opening_balance': opening,
+        'entries': entries,
+        'total_debit': total_debit,
+        'total_credit': total_credit,
+        'closing_balance': opening + total_debit - total_credit,
+    }
+
+
+def invalidate_checkpoints(company_id, client_id, since):
+    """Drop checkpoints from the month of `since` on; they are rebuilt on the next statement"""
+    from .models import StatementCheckpoint
+    if company_id and client_id and since:
+        with transaction.atomic(savepoint=False):
+            lock_ledger(client_id)
+            StatementCheckpoint.objects.filter(
+                company_id=company_id, client_id=client_id, month__gte=month_start(since),
+            ).delete()
+
+
+def invalidate_payment_checkpoints(payments):
+    """Drop statement checkpoints from each client's earliest new payment on"""
+    from .models import Invoice
+    earliest = {}
+    for payment in payments:
+        if payment.invoice_id not in earliest or payment.payment_date < earliest[payment.invoice_id]:
+            earliest[payment.invoice_id] = payment.payment_date
+    since = {}
+    for invoice_id, company_id, client_id in Invoice.objects.filter(pk__in=earliest).values_list('id', 'company_id', 'client_id'):
+        key = (company_id, client_id)
+        if key not in since or earliest[invoice_id] < since[key]:
+            since[key] = earliest[invoice_id]
+    # Always lock clients in the same order, so two batches cannot deadlock
+    for (company_id, client_id), day in sorted(since.items()):
+        invalidate_checkpoints(company_id, client_id, day)
+
+
+def statement_csv(statement):
+    """CSV text of a build_client_statement()"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Date', 'Type', 'Reference', 'Description', 'Debit', 'Credit', 'Balance'])
+    writer.writerow([statement['date_from'], 'OPENING', '', 'Opening balance', '', '', statement['opening_balance']])
+    for entry in statement['entries']:
+        writer.writerow([
+            entry['date'], entry['type'], entry['reference'], entry['description'],
+            entry['debit'] or '', entry['credit'] or '', entry['balance'],
+        ])
+    writer.writerow([
+        statement['date_to'], 'CLOSING', '', 'Closing balance',
+        statement['total_debit'], statement['total_credit'], statement['closing_balance'],
+    ])
+    return output.getvalue()
+
+
+def refresh_invoice_statuses(invoice_ids):
+    """
+    Mark PAID every invoice in `invoice_ids` whose received payments now cover
+    its total, in one UPDATE (the set-based form of update_status_from_payments).
+    """
+    from .models import Invoice
+    settled = Invoice.objects.filter(pk__in=invoice_ids).exclude(status='PAID').annotate(
+        paid=paid_amount_subquery(),
+    ).filter(paid__gte=F('total')).values('pk')
+    return Invoice.objects.filter(pk__in=settled).update(status='PAID')
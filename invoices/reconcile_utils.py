@@ -0,0 +1,407 @@
+"""
+Bank statement import and payment reconciliation
+
+A statement CSV (NEFT/RTGS/UPI/IMPS credits) is matched against a company's
+open invoices through dict indexes built once per run:
+
+- invoice number -> invoice, looked up with every token of the narration
+- (client, outstanding amount) and outstanding amount -> open invoices
+- client name word -> clients, to tell which client a narration names
+
+Each row is a handful of dict lookups, so reconciling is linear in the size
+of the statement plus the number of open invoices. Proposals wait in a
+BankStatementImport row until they are confirmed; confirmed matches are
+checked again under a lock and become Payment rows through one bulk_create.
+"""
+import csv
+import io
+import re
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
+from .einvoice_utils import ZERO, money
+from .receipt_utils import bulk_record_payments
+from .receivables_utils import open_invoices
+
+
+# Header spellings used by Indian banks' statement downloads
+COLUMN_ALIASES = {
+    'date': ('txn date', 'transaction date', 'date', 'value date', 'tran date', 'posting date'),
+    'narration': ('narration', 'description', 'particulars', 'remarks', 'transaction remarks', 'details'),
+    'reference': ('ref no./cheque no.', 'chq./ref.no.', 'cheque no.', 'ref no', 'reference', 'reference no',
+                  'utr', 'utr no', 'chq/ref number', 'cheque/reference no'),
+    'credit': ('credit', 'deposit amt.', 'deposit', 'deposits', 'credit amount', 'cr amount', 'amount (cr)'),
+    'debit': ('debit', 'withdrawal amt.', 'withdrawal', 'withdrawals', 'debit amount', 'dr amount', 'amount (dr)'),
+}
+DATE_FORMATS = ('%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%Y-%m-%d', '%d-%b-%Y', '%d %b %Y', '%d-%b-%y')
+
+MODE_RE = re.compile(r'\b(NEFT|RTGS|IMPS|UPI)\b', re.IGNORECASE)
+# UTR / RRN: a long run of letters and digits with at least 6 digits
+UTR_RE = re.compile(r'\b(?=[A-Z0-9]*\d{6})[A-Z0-9]{10,22}\b', re.IGNORECASE)
+TOKEN_SPLIT_RE = re.compile(r'[\s/,:;|()]+')
+NON_ALNUM_RE = re.compile(r'[^A-Z0-9]')
+
+METHODS = {'NEFT': 'NEFT', 'RTGS': 'RTGS', 'UPI': 'UPI', 'IMPS': 'BANK_TRANSFER'}
+# Words that say nothing about which client paid
+NAME_STOPWORDS = {
+    'PVT', 'PRIVATE', 'LTD', 'LIMITED', 'LLP', 'THE', 'AND', 'CO', 'COMPANY', 'INDIA', 'INC', 'CORP',
+    'NEFT', 'RTGS', 'IMPS', 'UPI', 'BANK', 'TRANSFER', 'PAYMENT',
+}
+
+# Match confidence, strongest first; the first two are applied unless skipped
+MATCH_REFERENCE = 'reference'
+MATCH_AMOUNT_CLIENT = 'amount+client'
+MATCH_AMOUNT = 'amount'
+CONFIDENT_MATCHES = (MATCH_REFERENCE, MATCH_AMOUNT_CLIENT)
+
+
+def _normalize(text):
+    return NON_ALNUM_RE.sub('', (text or '').upper())
+
+
+def _parse_amount(value):
+    value = (value or '').replace(',', '').replace('₹', '').strip()
+    if not value or value == '-':
+        return ZERO
+    try:
+        return money(Decimal(value))
+    except InvalidOperation:
+        return ZERO
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _find_columns(header):
+    normalized = [cell.strip().lower() for cell in header]
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in normalized:
+                columns[key] = normalized.index(alias)
+                break
+    return columns
+
+
+def parse_bank_statement(content):
+    """
+    Credit rows of a bank statement CSV as dicts with line, date, amount,
+    narration, reference and payment_method.
+
+    Lines before the header row (account details most banks print first) are
+    skipped; debits, opening/closing balance lines and rows without a date
+    are ignored.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig', errors='replace')
+    reader = csv.reader(io.StringIO(content))
+
+    columns = None
+    rows = []
+    for line_number, cells in enumerate(reader, 1):
+        if columns is None:
+            found = _find_columns(cells)
+            if {'date', 'narration', 'credit'} <= set(found):
+                columns = found
+            continue
+        if len(cells) <= max(columns.values()):
+            continue
+        entry_date = _parse_date(cells[columns['date']])
+        amount = _parse_amount(cells[columns['credit']])
+        if entry_date is None or amount <= 0:
+            continue
+
+        narration = ' '.join(cells[columns['narration']].split())
+        reference = cells[columns['reference']].strip() if 'reference' in columns else ''
+        if not reference or set(reference) <= {'0'}:
+            utr = UTR_RE.search(narration)
+            reference = utr.group(0) if utr else ''
+        mode = MODE_RE.search(narration)
+        rows.append({
+            'line': line_number,
+            'date': entry_date,
+            'amount': amount,
+            'narration': narration,
+            'reference': reference.upper(),
+            'payment_method': METHODS[mode.group(1).upper()] if mode else 'BANK_TRANSFER',
+        })
+
+    if columns is None:
+        raise ValueError('No header row with date, narration and credit columns found')
+    return rows
+
+
+def _name_words(name):
+    return {word for word in NON_ALNUM_RE.split((name or '').upper()) if len(word) >= 3} - NAME_STOPWORDS
+
+
+def _narration_tokens(narration):
+    """Normalized narration tokens, plus every hyphen-suffix: NEFT-NRK-INV-7 also yields NRKINV7"""
+    tokens = set()
+    for token in TOKEN_SPLIT_RE.split(narration.upper()):
+        pieces = token.split('-')
+        for start in range(len(pieces)):
+            normalized = _normalize(''.join(pieces[start:]))
+            if normalized:
+                tokens.add(normalized)
+        tokens.update(_normalize(piece) for piece in pieces if piece)
+    return tokens
+
+
+class MatchIndex:
+    """Hash indexes over a company's open invoices, built with one query"""
+
+    def __init__(self, company):
+        from .models import Invoice, Payment
+        invoices = open_invoices(Invoice.objects.filter(company=company)).values(
+            'id', 'invoice_number', 'client_id', 'client__name', 'due_date', 'outstanding',
+        ).order_by('due_date', 'invoice_date', 'id')
+
+        self.invoices = {}
+        self.by_number = {}
+        self.by_client_amount = defaultdict(deque)
+        self.by_amount = defaultdict(deque)
+        self.open_count = defaultdict(int)
+        self.client_words = defaultdict(set)
+        for invoice in invoices:
+            invoice['outstanding'] = money(invoice['outstanding'])
+            self.invoices[invoice['id']] = invoice
+            self.by_number[_normalize(invoice['invoice_number'])] = invoice['id']
+            self.by_client_amount[(invoice['client_id'], invoice['outstanding'])].append(invoice['id'])
+            self.by_amount[invoice['outstanding']].append(invoice['id'])
+            self.open_count[invoice['outstanding']] += 1
+            for word in _name_words(invoice['client__name']):
+                self.client_words[word].add(invoice['client_id'])
+
+        # Transaction references already booked, to catch re-imported statements
+        self.known_references = {
+            reference.upper() for reference in Payment.objects.filter(invoice__company=company).exclude(
+                reference_number__isnull=True,
+            ).exclude(reference_number='').values_list('reference_number', flat=True)
+        }
+        self.remaining = {invoice_id: invoice['outstanding'] for invoice_id, invoice in self.invoices.items()}
+
+    def _take(self, candidates):
+        """First invoice in a candidate queue that is still open; settled ones are dropped for good"""
+        while candidates and self.remaining[candidates[0]] <= 0:
+            candidates.popleft()
+        return candidates[0] if candidates else None
+
+    def consume(self, invoice_id, amount):
+        """Book `amount` against an invoice for the rest of the run; returns what was outstanding"""
+        outstanding = self.remaining[invoice_id]
+        self.remaining[invoice_id] = outstanding - amount
+        if outstanding > 0 >= self.remaining[invoice_id]:
+            self.open_count[self.invoices[invoice_id]['outstanding']] -= 1
+        return outstanding
+
+    def _named_client(self, tokens):
+        """The client whose name words appear most often in the narration"""
+        hits = defaultdict(int)
+        for token in tokens:
+            for client_id in self.client_words.get(token, ()):
+                hits[client_id] += 1
+        if not hits:
+            return None
+        ranked = sorted(hits.items(), key=lambda item: item[1], reverse=True)
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            return None
+        return ranked[0][0]
+
+    def match_reference(self, tokens):
+        """Open invoice whose number appears in the narration or reference"""
+        for token in tokens:
+            invoice_id = self.by_number.get(token)
+            if invoice_id is not None and self.remaining[invoice_id] > 0:
+                return invoice_id
+        return None
+
+    def match_amount(self, row, tokens):
+        """(invoice id or None, match kind or None) by amount, narrowed to the named client"""
+        client_id = self._named_client(tokens)
+        if client_id is not None:
+            invoice_id = self._take(self.by_client_amount.get((client_id, row['amount']), deque()))
+            if invoice_id is not None:
+                return invoice_id, MATCH_AMOUNT_CLIENT
+
+        # Amount alone only identifies an invoice when no other open one has it
+        if self.open_count.get(row['amount']) == 1:
+            return self._take(self.by_amount[row['amount']]), MATCH_AMOUNT
+        return None, None
+
+
+def _row_tokens(row):
+    tokens = _narration_tokens(row['narration'])
+    if row['reference']:
+        tokens.add(_normalize(row['reference']))
+    return tokens
+
+
+def reconcile(company, rows):
+    """
+    Propose an invoice for every statement row.
+
+    Rows quoting an invoice number are matched first, so that amount matches
+    cannot take an invoice a later row names explicitly. Returns
+    {'matches', 'unmatched', 'duplicates'}; each match is the row plus
+    invoice_id, invoice_number, client, outstanding and the match kind.
+    """
+    index = MatchIndex(company)
+    duplicates = []
+    pending = []
+    seen_references = set()
+    for row in rows:
+        reference = row['reference']
+        if reference and (reference in index.known_references or reference in seen_references):
+            duplicates.append(row)
+            continue
+        if reference:
+            seen_references.add(reference)
+        pending.append((row, _row_tokens(row)))
+
+    found = {}
+    for row, tokens in pending:
+        invoice_id = index.match_reference(tokens)
+        if invoice_id is not None:
+            found[row['line']] = (invoice_id, MATCH_REFERENCE, index.consume(invoice_id, row['amount']))
+    for row, tokens in pending:
+        if row['line'] not in found:
+            invoice_id, kind = index.match_amount(row, tokens)
+            if invoice_id is not None:
+                found[row['line']] = (invoice_id, kind, index.consume(invoice_id, row['amount']))
+
+    matches, unmatched = [], []
+    for row, _ in pending:
+        if row['line'] not in found:
+            unmatched.append(row)
+            continue
+        invoice_id, kind, outstanding = found[row['line']]
+        invoice = index.invoices[invoice_id]
+        matches.append({
+            **row,
+            'invoice_id': invoice_id,
+            'invoice_number': invoice['invoice_number'],
+            'client': invoice['client__name'],
+            'outstanding': outstanding,
+            'match': kind,
+        })
+    return {'matches': matches, 'unmatched': unmatched, 'duplicates': duplicates}
+
+
+def apply_matches(matches, user=None, bank_name=None):
+    """
+    Book matched rows as RECEIVED payments in one transaction; returns
+    (payments, skipped).
+
+    Proposals can be stale by the time they are confirmed, so the matched
+    invoices are locked and every row is checked again: its invoice must
+    still be open with at least the row's amount outstanding (after the
+    earlier rows of the batch), and its reference must not have been booked
+    for the company since. Rows that fail come back in `skipped` with a
+    `reason`. bulk_create skips Payment.save(), so net_amount is set here;
+    see bulk_record_payments().
+    """
+    from .models import Invoice, Payment
+    if not matches:
+        return [], []
+    with transaction.atomic():
+        invoice_ids = {match['invoice_id'] for match in matches}
+        company_ids = set(
+            Invoice.objects.select_for_update().filter(pk__in=invoice_ids).values_list('company_id', flat=True)
+        )
+        remaining = {
+            invoice_id: money(outstanding) for invoice_id, outstanding in
+            open_invoices(Invoice.objects.filter(pk__in=invoice_ids)).values_list('pk', 'outstanding')
+        }
+        references = {match['reference'][:100] for match in matches if match['reference']}
+        booked = set(
+            Payment.objects.filter(invoice__company_id__in=company_ids).annotate(reference=Upper('reference_number'))
+            .filter(reference__in=references).values_list('reference', flat=True)
+        ) if references else set()
+
+        payments, skipped = [], []
+        for match in matches:
+            reference = match['reference'][:100]
+            if reference and reference in booked:
+                skipped.append({**match, 'reason': f'{reference} is already recorded'})
+                continue
+            if match['amount'] > remaining.get(match['invoice_id'], ZERO):
+                skipped.append({**match, 'reason': f"{match['invoice_number']} no longer has ₹{match['amount']:,.2f} outstanding"})
+                continue
+            remaining[match['invoice_id']] -= match['amount']
+            if reference:
+                booked.add(reference)
+            payments.append(Payment(
+                invoice_id=match['invoice_id'],
+                payment_date=match['date'],
+                amount=match['amount'],
+                net_amount=match['amount'],
+                payment_method=match['payment_method'],
+                reference_number=reference or None,
+                bank_name=bank_name or None,
+                remarks=match['narration'],
+                status='RECEIVED',
+                is_on_hold=False,
+                created_by=user,
+            ))
+        if payments:
+            bulk_record_payments(payments)
+    return payments, skipped
+
+
+# ==================== STORED PROPOSALS ====================
+# Proposals wait in a BankStatementImport row between the upload and the confirmation
+
+# Unconfirmed imports older than this are deleted when the next statement is uploaded
+IMPORT_MAX_AGE = timedelta(days=1)
+
+
+def serialize_matches(matches):
+    return [{
+        **match,
+        'date': match['date'].isoformat(),
+        'amount': str(match['amount']),
+        'outstanding': str(match['outstanding']),
+    } for match in matches]
+
+
+def deserialize_matches(data):
+    return [{
+        **match,
+        'date': datetime.strptime(match['date'], '%Y-%m-%d').date(),
+        'amount': Decimal(match['amount']),
+        'outstanding': Decimal(match['outstanding']),
+    } for match in data]
+
+
+def save_proposals(company, user, matches, bank_name=''):
+    """Store the matches of an upload for confirmation; returns the BankStatementImport"""
+    from .models import BankStatementImport
+    BankStatementImport.objects.filter(created_at__lt=timezone.now() - IMPORT_MAX_AGE).delete()
+    return BankStatementImport.objects.create(
+        company=company, created_by=user, bank_name=bank_name, matches=serialize_matches(matches),
+    )
+
+
+def take_proposals(import_id, user):
+    """
+    Claim a stored import for booking, or None when it is gone: the row is
+    locked and deleted in the caller's transaction, so a second confirmation
+    of the same upload (double click, second tab) waits and then finds
+    nothing.
+    """
+    from .models import BankStatementImport
+    statement_import = BankStatementImport.objects.select_for_update().filter(pk=import_id, created_by=user).first()
+    if statement_import is not None:
+        statement_import.delete()
+    return statement_import
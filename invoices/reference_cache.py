@@ -0,0 +1,226 @@
+"""
+Two-tier cache for reference data
+
+Small tables that nearly every form and page reads are cached in two tiers.
+They are the active UOMs, each user's companies and default company, and
+each company's purchase orders.
+
+1. An in-process LRU of REFERENCE_CACHE_SIZE entries, so a hit is a dict
+   lookup with no unpickling.
+2. The shared Django cache REFERENCE_CACHE_ALIAS, where values live for
+   REFERENCE_CACHE_TIMEOUT seconds, so a value one worker built is there for
+   the others.
+
+Every namespace, e.g. "uoms" or "companies:<user id>", has a version number
+in the shared cache, and the version is part of each key. The signal
+handlers in signals.py bump it when a row is saved or deleted, so every
+worker stops seeing the old entries at once; they age out of both tiers.
+A lookup costs one shared-cache read for the version.
+
+Cached values are shared between requests; treat them as read-only. Bulk
+writes (bulk_create, update(), raw SQL) send no signals, so call
+invalidate() after them.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from . import metrics
+
+
+KEY_PREFIX = 'refcache'
+MISSING = object()
+
+# Namespaces this process has looked up, for clear()
+_namespaces = set()
+
+
+class LRUCache:
+    """Thread-safe mapping that drops the least recently used keys beyond max_size"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+_local = None
+
+
+def local_cache():
+    global _local
+    if _local is None:
+        _local = LRUCache(getattr(settings, 'REFERENCE_CACHE_SIZE', 1024))
+    return _local
+
+
+def shared_cache():
+    return caches[getattr(settings, 'REFERENCE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def _new_version():
+    # Not 1: after the shared cache is cleared or restarted, entries still in
+    # a worker's LRU under the old versions must not become reachable again
+    return time.time_ns() // 1000
+
+
+def version(namespace):
+    """Current version of a namespace, or None when the shared cache cannot hold one"""
+    shared = shared_cache()
+    key = _version_key(namespace)
+    current = shared.get(key)
+    if current is None:
+        shared.add(key, _new_version(), timeout=None)
+        current = shared.get(key)
+    return current
+
+
+def invalidate(namespace):
+    """Make the cached values of a namespace unreachable in every worker"""
+    shared = shared_cache()
+    key = _version_key(namespace)
+    try:
+        shared.incr(key)
+    except ValueError:
+        # No version yet (or it was evicted): the next lookup starts a new one
+        shared.add(key, _new_version(), timeout=None)
+
+
+def invalidate_on_commit(namespace):
+    """
+    Invalidate now and again on commit: a worker reading between the two
+    would otherwise cache rows from before this transaction under the new
+    version.
+    """
+    invalidate(namespace)
+    transaction.on_commit(lambda: invalidate(namespace))
+
+
+def clear():
+    """Invalidate every namespace this process has used and empty its LRU"""
+    for namespace in list(_namespaces):
+        invalidate(namespace)
+    local_cache().clear()
+
+
+def get(namespace, key, builder):
+    """Value of `key` in `namespace` from the LRU, the shared cache or builder()"""
+    _namespaces.add(namespace)
+    current = version(namespace)
+    if current is None:
+        return builder()
+    kind = namespace.split(':', 1)[0]
+    full_key = f'{KEY_PREFIX}:{namespace}:{current}:{key}'
+
+    value = local_cache().get(full_key, MISSING)
+    metrics.record_cache(kind, value is not MISSING)
+    if value is not MISSING:
+        return value
+
+    shared = shared_cache()
+    value = shared.get(full_key, MISSING)
+    metrics.record_cache(f'{kind}_shared', value is not MISSING)
+    if value is MISSING:
+        value = builder()
+        shared.set(full_key, value, getattr(settings, 'REFERENCE_CACHE_TIMEOUT', 3600))
+    local_cache().set(full_key, value)
+    return value
+
+
+# ==================== REFERENCE DATA ====================
+
+def all_uoms():
+    """Every UOM by name"""
+    from .models import UOM
+    return get('uoms', 'all', lambda: list(UOM.objects.order_by('name')))
+
+
+def uom_choices():
+    """(pk, label) of the active UOMs by name"""
+    from .models import UOM
+    return get('uoms', 'active_choices', lambda: [
+        (uom.pk, str(uom)) for uom in UOM.objects.filter(is_active=True).order_by('name')
+    ])
+
+
+def user_companies(user_id):
+    """All of a user's companies, active or not, in Company ordering (default first)"""
+    from .models import Company
+    return get(f'companies:{user_id}', 'all', lambda: list(Company.objects.filter(user_id=user_id)))
+
+
+def active_companies(user_id):
+    return [company for company in user_companies(user_id) if company.is_active]
+
+
+def company_choices(user_id):
+    """(pk, label) of a user's active companies"""
+    return [(company.pk, str(company)) for company in active_companies(user_id)]
+
+
+def default_company(user_id):
+    """Copy of the user's default company, else their first active one (as Company.get_default)"""
+    companies = user_companies(user_id)
+    company = next((company for company in companies if company.is_default), None)
+    if company is None:
+        company = next(iter(active_companies(user_id)), None)
+    return copy.copy(company)
+
+
+def company_pos(company_id):
+    """(pk, po_number, main_line_description) of a company's purchase orders, newest first"""
+    from .models import PurchaseOrder
+    return get(f'pos:{company_id}', 'all', lambda: list(
+        PurchaseOrder.objects.filter(company_id=company_id).order_by('-created_at')
+        .values_list('pk', 'po_number', 'main_line_description')
+    ))
+
+
+def po_choices(company_id):
+    """(pk, label) of a company's purchase orders, labelled as PurchaseOrder.__str__"""
+    return [(pk, f'{po_number} - {description}') for pk, po_number, description in company_pos(company_id)]
+
+
+def warm(active_since):
+    """
+    Fill the shared tier ahead of requests: UOMs, and the companies and PO
+    choices of users who logged in since `active_since`. Entries already
+    cached are left alone. Returns the number of users warmed.
+    """
+    from django.contrib.auth import get_user_model
+    uom_choices()
+    user_ids = list(
+        get_user_model().objects.filter(is_active=True, last_login__gte=active_since).values_list('pk', flat=True)
+    )
+    for user_id in user_ids:
+        for company in active_companies(user_id):
+            company_pos(company.pk)
+    return len(user_ids)
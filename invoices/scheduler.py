@@ -0,0 +1,124 @@
+"""
+In-process task scheduler used by the run_scheduler command
+
+Tasks are declared in settings.SCHEDULER_TASKS. Every node may run the
+scheduler; a PostgreSQL advisory lock elects one leader, and only the leader
+executes due tasks. Last run times are read from ScheduledRun, so a new
+leader picks up where the previous one stopped.
+"""
+import socket
+import time
+from datetime import timedelta
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from .models import ScheduledRun
+
+
+# Two-key advisory lock id: (application, purpose)
+LEADER_LOCK_KEYS = (0x1A4C, 1)
+
+
+def get_tasks():
+    """Return the declared tasks from settings.SCHEDULER_TASKS"""
+    return getattr(settings, 'SCHEDULER_TASKS', [])
+
+
+def is_due(task, last_started_at, now=None):
+    """
+    Whether a task should run now.
+
+    `every`: seconds between runs.
+    `at`: daily local time as "HH:MM".
+    """
+    now = now or timezone.now()
+    if 'every' in task:
+        return last_started_at is None or now >= last_started_at + timedelta(seconds=task['every'])
+    if 'at' in task:
+        hour, minute = (int(part) for part in task['at'].split(':'))
+        local_now = timezone.localtime(now)
+        slot = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if local_now < slot:
+            return False
+        return last_started_at is None or last_started_at < slot
+    raise ValueError(f"Task {task['name']} needs 'every' or 'at'")
+
+
+def last_runs():
+    """Latest start time per task name"""
+    from django.db.models import Max
+    return dict(
+        ScheduledRun.objects.values('name').annotate(last=Max('started_at')).values_list('name', 'last')
+    )
+
+
+def run_task(task):
+    """Execute one task and record a ScheduledRun with its duration"""
+    started = time.monotonic()
+    run = ScheduledRun.objects.create(
+        name=task['name'],
+        started_at=timezone.now(),
+        host=socket.gethostname(),
+    )
+    output = StringIO()
+    try:
+        if 'command' in task:
+            call_command(task['command'], *task.get('args', []), stdout=output, **task.get('options', {}))
+        elif 'job' in task:
+            from .jobs import enqueue
+            job = enqueue(task['job'], task.get('payload'))
+            output.write(f'Enqueued job #{job.pk}')
+        else:
+            raise ValueError(f"Task {task['name']} needs 'command' or 'job'")
+        run.success = True
+    except Exception as e:
+        output.write(f'\n{type(e).__name__}: {e}')
+        run.success = False
+
+    run.finished_at = timezone.now()
+    run.duration_ms = int((time.monotonic() - started) * 1000)
+    run.output = output.getvalue()[-4000:]
+    run.save(update_fields=['finished_at', 'duration_ms', 'success', 'output'])
+    return run
+
+
+def try_acquire_leadership():
+    """
+    Try to become (or confirm we still are) the scheduler leader.
+
+    The advisory lock belongs to this process' database session, so it is
+    released automatically if the process dies or the connection drops.
+    """
+    if connection.vendor != 'postgresql':
+        # Single-node development database: this process is always the leader
+        return True
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' "
+            "AND classid = %s AND objid = %s AND objsubid = 2 AND pid = pg_backend_pid() AND granted)",
+            LEADER_LOCK_KEYS,
+        )
+        if cursor.fetchone()[0]:
+            return True
+        cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', LEADER_LOCK_KEYS)
+        return cursor.fetchone()[0]
+
+
+def release_leadership():
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_unlock(%s, %s)', LEADER_LOCK_KEYS)
+
+
+def tick(now=None):
+    """Run every due task once. Returns the ScheduledRun rows created."""
+    runs = []
+    last = last_runs()
+    for task in get_tasks():
+        if is_due(task, last.get(task['name']), now=now):
+            runs.append(run_task(task))
+    return runs
@@ -0,0 +1,125 @@
+"""
+Model signal handlers
+
+Statement checkpoints (see receivables_utils) are month-end balances; a
+change to an invoice's place in the ledger (company, client, date, total,
+draft or not) or to any payment drops the checkpoints from the affected month
+on. The values an instance was loaded with are kept so that moving an invoice
+to another date or client also invalidates the old position, and saves that
+only touch other fields (reminders, status flips) cost nothing. Fields left
+out by .only()/.defer() are read from __dict__ as DEFERRED (reading them would
+refresh_from_db(), whose new instance fires post_init again) and count as
+unknown: the whole ledger is invalidated.
+
+UOM, company and purchase order changes invalidate their namespaces in the
+reference cache (see reference_cache).
+"""
+from datetime import date
+from django.db.models import DEFERRED, Min
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import UOM, Company, Invoice, Payment, PurchaseOrder
+from .receivables_utils import invalidate_checkpoints
+from .reference_cache import invalidate_on_commit
+
+
+# Fields that place an invoice or payment in a client's ledger
+LEDGER_FIELDS = {
+    Invoice: ('company_id', 'client_id', 'invoice_date', 'total', 'status'),
+    Payment: ('invoice_id', 'payment_date'),
+}
+
+
+def _loaded(instance, fields):
+    return tuple(instance.__dict__.get(field, DEFERRED) for field in fields)
+
+
+def _invoice_ledger_entry(invoice):
+    *entry, status = _loaded(invoice, LEDGER_FIELDS[Invoice])
+    return (*entry, status if status is DEFERRED else status == 'DRAFT')
+
+
+@receiver(post_init, sender=Invoice)
+def remember_invoice_origin(sender, instance, **kwargs):
+    instance._statement_origin = _invoice_ledger_entry(instance)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_origin(sender, instance, **kwargs):
+    instance._statement_origin = _loaded(instance, LEDGER_FIELDS[Payment])
+
+
+@receiver(pre_delete, sender=Invoice)
+@receiver(pre_delete, sender=Payment)
+def load_ledger_fields(sender, instance, **kwargs):
+    """post_delete needs the owner and dates, which can no longer be read once the row is gone"""
+    deferred = instance.get_deferred_fields() & set(LEDGER_FIELDS[sender])
+    if deferred:
+        instance.refresh_from_db(fields=deferred)
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def invoice_changed(sender, instance, created=False, **kwargs):
+    origin, current = instance._statement_origin, _invoice_ledger_entry(instance)
+    instance._statement_origin = current
+    updated = kwargs['signal'] is post_save and not created
+    if updated and origin == current:
+        return
+    company_id, client_id, invoice_date, _, was_draft = origin
+    if DEFERRED in origin:
+        since = date.min
+    else:
+        dates = [day for day in (invoice_date, instance.invoice_date) if day]
+        if updated and ((company_id, client_id) != (instance.company_id, instance.client_id)
+                        or was_draft != (instance.status == 'DRAFT')):
+            # Its payments join or leave the client's ledger with it
+            dates.append(instance.payments.aggregate(first=Min('payment_date'))['first'])
+        since = min((day for day in dates if day), default=None)
+    invalidate_checkpoints(instance.company_id, instance.client_id, since)
+    if DEFERRED not in (company_id, client_id) and (company_id, client_id) != (instance.company_id, instance.client_id):
+        invalidate_checkpoints(company_id, client_id, since)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def payment_changed(sender, instance, **kwargs):
+    invoice_id, payment_date = instance._statement_origin
+    if DEFERRED in instance._statement_origin:
+        since = date.min
+    else:
+        since = min((day for day in (payment_date, instance.payment_date) if day), default=None)
+    owners = Invoice.objects.filter(pk__in={invoice_id, instance.invoice_id} - {None, DEFERRED}).values_list('company_id', 'client_id')
+    for company_id, client_id in set(owners):
+        invalidate_checkpoints(company_id, client_id, since)
+    instance._statement_origin = _loaded(instance, LEDGER_FIELDS[Payment])
+
+
+@receiver([post_save, post_delete], sender=UOM)
+def uom_changed(sender, instance, **kwargs):
+    invalidate_on_commit('uoms')
+
+
+@receiver([post_save, post_delete], sender=Company)
+def company_changed(sender, instance, **kwargs):
+    invalidate_on_commit(f'companies:{instance.user_id}')
+
+
+@receiver(post_init, sender=PurchaseOrder)
+def remember_purchase_order_company(sender, instance, **kwargs):
+    instance._reference_origin = instance.__dict__.get('company_id', DEFERRED)
+
+
+@receiver([pre_save, pre_delete], sender=PurchaseOrder)
+def load_purchase_order_company(sender, instance, **kwargs):
+    """The company of a PO loaded without it, read before the save or delete"""
+    if instance._reference_origin is DEFERRED and instance.pk:
+        instance._reference_origin = (
+            PurchaseOrder.objects.filter(pk=instance.pk).values_list('company_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=PurchaseOrder)
+def purchase_order_changed(sender, instance, **kwargs):
+    current = instance.__dict__.get('company_id', DEFERRED)
+    for company_id in {instance._reference_origin, current} - {None, DEFERRED}:
+        invalidate_on_commit(f'pos:{company_id}')
+    instance._reference_origin = current
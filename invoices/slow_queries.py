@@ -0,0 +1,155 @@
+"""
+Slow query capture with EXPLAIN plans
+
+With SLOW_QUERY_CAPTURE on, QueryInstrumentationMiddleware keeps the SELECTs
+that took longer than SLOW_QUERY_MS in a sampled share of requests
+(SLOW_QUERY_SAMPLE_RATE) and, once the response is ready, queues them as an
+explain_slow_queries job. The job runs EXPLAIN outside the request:
+
+- PostgreSQL: EXPLAIN (ANALYZE, BUFFERS), in a transaction that is rolled
+  back, under SLOW_QUERY_EXPLAIN_TIMEOUT_MS
+- SQLite: EXPLAIN QUERY PLAN
+
+Captures are grouped by query fingerprint into SlowQuery rows holding the
+call count, total and worst time, the view and path of the worst sample and
+the latest plan. A fingerprint is explained again at most once per
+SLOW_QUERY_EXPLAIN_INTERVAL seconds, and only the SLOW_QUERY_MAX_ROWS most
+recently seen fingerprints are kept. The admin lists them worst first.
+"""
+import hashlib
+import logging
+import random
+from datetime import date, datetime, time
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from .middleware import fingerprint
+
+
+logger = logging.getLogger('invoices.performance')
+
+# Distinct query shapes queued per request at most; the slowest are kept
+MAX_PER_REQUEST = 5
+
+
+def capture_enabled():
+    """Whether to capture slow queries in this request: diagnostic mode, sampled"""
+    if not getattr(settings, 'SLOW_QUERY_CAPTURE', False):
+        return False
+    return random.random() < getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0)
+
+
+def is_explainable(sql):
+    """Plain SELECTs only: EXPLAIN ANALYZE executes the statement, and must not write or lock rows"""
+    statement = sql.lstrip().upper()
+    return statement.startswith('SELECT') and 'FOR UPDATE' not in statement and 'FOR SHARE' not in statement
+
+
+def jsonable(value):
+    """Query parameters as JSON values; dates and decimals become strings the database casts back"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return str(value)
+
+
+def fingerprint_hash(shape):
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()
+
+
+def queue_captures(request, stats):
+    """Queue the request's slow queries for explaining; never fails the request"""
+    from .jobs import enqueue
+
+    queries = sorted(stats.slow_queries.values(), key=lambda query: query['duration_ms'], reverse=True)
+    match = getattr(request, 'resolver_match', None)
+    try:
+        enqueue('explain_slow_queries', {
+            'queries': queries[:MAX_PER_REQUEST],
+            'view_name': match.view_name if match is not None else '',
+            'method': request.method,
+            'path': request.path[:500],
+        })
+    except Exception:
+        logger.exception('Could not queue slow queries for %s', request.path)
+
+
+def explain(sql, params, using='default'):
+    """Plan of a query as text"""
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                timeout = int(getattr(settings, 'SLOW_QUERY_EXPLAIN_TIMEOUT_MS', 10000))
+                cursor.execute(f'SET LOCAL statement_timeout = {timeout}')
+                cursor.execute(connection.ops.explain_query_prefix(analyze=True, buffers=True) + ' ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            elif connection.vendor == 'sqlite':
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql, params)
+                plan = sqlite_plan(cursor.fetchall())
+            else:
+                cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql, params)
+                plan = '\n'.join(' '.join(str(value) for value in row) for row in cursor.fetchall())
+        # EXPLAIN ANALYZE ran the query; leave nothing behind
+        transaction.set_rollback(True, using=using)
+    return plan
+
+
+def sqlite_plan(rows):
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree"""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def record(queries, view_name='', method='', path=''):
+    """Fold captured queries into SlowQuery rows, explaining shapes without a recent plan"""
+    from .models import SlowQuery
+
+    interval = getattr(settings, 'SLOW_QUERY_EXPLAIN_INTERVAL', 3600)
+    now = timezone.now()
+    explained = 0
+    for query in queries:
+        shape = fingerprint(query['sql'])
+        with transaction.atomic():
+            slow_query, _ = SlowQuery.objects.select_for_update().get_or_create(
+                fingerprint_hash=fingerprint_hash(shape),
+                defaults={'fingerprint': shape, 'sample_sql': query['sql']},
+            )
+            slow_query.calls += 1
+            slow_query.total_ms += query['duration_ms']
+            slow_query.last_seen = now
+            if query['duration_ms'] >= slow_query.max_ms:
+                slow_query.max_ms = query['duration_ms']
+                slow_query.sample_sql = query['sql']
+                slow_query.sample_params = query['params']
+                slow_query.database = query.get('using', 'default')
+                slow_query.view_name, slow_query.method, slow_query.path = view_name, method, path
+            slow_query.save()
+
+        if slow_query.explained_at and (now - slow_query.explained_at).total_seconds() < interval:
+            continue
+        try:
+            plan, error = explain(slow_query.sample_sql, slow_query.sample_params, slow_query.database), ''
+        except Exception as e:
+            plan, error = '', f'{type(e).__name__}: {e}'
+        SlowQuery.objects.filter(pk=slow_query.pk).update(plan=plan, plan_error=error, explained_at=now)
+        explained += 1
+    prune()
+    return explained
+
+
+def prune():
+    """Delete all but the SLOW_QUERY_MAX_ROWS most recently seen fingerprints"""
+    from .models import SlowQuery
+
+    keep = getattr(settings, 'SLOW_QUERY_MAX_ROWS', 200)
+    stale = list(SlowQuery.objects.order_by('-last_seen', '-pk').values_list('pk', flat=True)[keep:])
+    if stale:
+        SlowQuery.objects.filter(pk__in=stale).delete()
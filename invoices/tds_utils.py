@@ -0,0 +1,161 @@
+"""
+TDS receivable summary for Form 26AS reconciliation
+
+TDS deducted by clients is recorded on Payment.tds_amount. Form 26AS lists it
+per deductor and quarter of the financial year (April-March), so the summary
+groups received payments by client PAN, quarter and rate in one aggregate
+query. A client's PAN is characters 3-12 of their GSTIN.
+"""
+import csv
+import io
+from datetime import date
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, Round, Substr
+from .einvoice_utils import ZERO, money
+
+
+RATE = DecimalField(max_digits=5, decimal_places=2)
+
+# Quarters of the financial year: (number, label, months)
+QUARTERS = [
+    (1, 'Q1 (Apr-Jun)', (4, 5, 6)),
+    (2, 'Q2 (Jul-Sep)', (7, 8, 9)),
+    (3, 'Q3 (Oct-Dec)', (10, 11, 12)),
+    (4, 'Q4 (Jan-Mar)', (1, 2, 3)),
+]
+
+
+# Earliest financial year the reports accept
+FIRST_FY = 2000
+
+
+def financial_year(day):
+    """Starting year of the financial year `day` falls in (2025 for 2025-26)"""
+    return day.year if day.month >= 4 else day.year - 1
+
+
+def fy_period(year):
+    return date(year, 4, 1), date(year + 1, 3, 31)
+
+
+def fy_label(year):
+    return f'{year}-{(year + 1) % 100:02d}'
+
+
+def _quarter():
+    return Case(
+        *[When(payment_date__month__in=months, then=Value(number)) for number, _, months in QUARTERS],
+        output_field=IntegerField(),
+    )
+
+
+def _rate():
+    # Recorded TDS %, else the effective rate on the amount received
+    return Case(
+        When(tds_percentage__gt=0, then=F('tds_percentage')),
+        When(amount__gt=0, then=Round(F('tds_amount') * 100 / F('amount'), 2)),
+        default=Value(ZERO),
+        output_field=RATE,
+    )
+
+
+def tds_payments(company, year, quarter=None, client=None):
+    """Received payments with TDS of a company in a financial year, annotated with quarter, rate and pan"""
+    from .models import Payment
+    date_from, date_to = fy_period(year)
+    payments = Payment.objects.filter(
+        invoice__company=company,
+        status='RECEIVED',
+        is_on_hold=False,
+        tds_amount__gt=0,
+        payment_date__gte=date_from,
+        payment_date__lte=date_to,
+    )
+    if client is not None:
+        payments = payments.filter(invoice__client=client)
+    payments = payments.annotate(
+        quarter=_quarter(),
+        rate=_rate(),
+        pan=Coalesce(Substr('invoice__client__gstin', 3, 10), Value('')),
+    )
+    if quarter:
+        payments = payments.filter(quarter=quarter)
+    return payments
+
+
+def tds_summary(company, year, quarter=None):
+    """
+    TDS per client PAN, quarter and rate for a financial year.
+
+    Returns {'year', 'label', 'quarter', 'rows', 'totals'}; rows are ordered by
+    client and quarter.
+    """
+    rows = list(tds_payments(company, year, quarter).values(
+        'pan', 'quarter', 'rate',
+        client_id=F('invoice__client_id'),
+        client_name=F('invoice__client__name'),
+        gstin=F('invoice__client__gstin'),
+    ).annotate(
+        payment_count=Count('id'),
+        amount=Sum('amount'),
+        tds=Sum('tds_amount'),
+    ).order_by('client_name', 'quarter', 'rate'))
+
+    quarter_labels = {number: label for number, label, _ in QUARTERS}
+    for row in rows:
+        row['amount'] = money(row['amount'])
+        row['tds'] = money(row['tds'])
+        row['rate'] = money(row['rate'])
+        row['quarter_label'] = quarter_labels.get(row['quarter'], '')
+
+    by_quarter = {number: ZERO for number, _, _ in QUARTERS}
+    for row in rows:
+        by_quarter[row['quarter']] += row['tds']
+    return {
+        'year': year,
+        'label': fy_label(year),
+        'quarter': quarter,
+        'rows': rows,
+        'totals': {
+            'payment_count': sum(row['payment_count'] for row in rows),
+            'amount': sum((row['amount'] for row in rows), ZERO),
+            'tds': sum((row['tds'] for row in rows), ZERO),
+            'quarters': [(quarter_labels[number], total) for number, total in by_quarter.items()],
+        },
+    }
+
+
+def client_tds_payments(company, client, year, quarter=None):
+    """A client's TDS payments in a financial year, oldest first, for the drilldown"""
+    return tds_payments(company, year, quarter, client=client).select_related('invoice').order_by(
+        'payment_date', 'id',
+    )
+
+
+def tds_summary_csv(summary):
+    """CSV text of a tds_summary()"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Client', 'GSTIN', 'PAN', 'Financial Year', 'Quarter', 'Rate %', 'Payments', 'Amount Received', 'TDS'])
+    for row in summary['rows']:
+        writer.writerow([
+            row['client_name'], row['gstin'] or '', row['pan'], summary['label'], row['quarter_label'],
+            row['rate'], row['payment_count'], row['amount'], row['tds'],
+        ])
+    totals = summary['totals']
+    writer.writerow(['Total', '', '', summary['label'], '', '', totals['payment_count'], totals['amount'], totals['tds']])
+    return output.getvalue()
+
+
+def client_tds_csv(payments):
+    """CSV text of a client's TDS payments"""
+    quarter_labels = {number: label for number, label, _ in QUARTERS}
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['Date', 'Invoice', 'Quarter', 'Reference', 'Amount Received', 'Rate %', 'TDS', 'Net Amount'])
+    for payment in payments:
+        writer.writerow([
+            payment.payment_date, payment.invoice.invoice_number, quarter_labels.get(payment.quarter, ''),
+            payment.reference_number or '', payment.amount, money(payment.rate), payment.tds_amount, payment.net_amount,
+        ])
+    return output.getvalue()
@@ -1,3 +1,1199 @@
-from django.test import TestCase
+"""
+Query budgets for every invoices URL
 
-# Create your tests here.
+Each view gets a fixed number of SQL queries (QUERY_BUDGETS) that must not
+depend on how much data there is. The same tests run against a company with
+1 row of everything and one with 500 rows, so a view that queries per row
+(an N+1 loop in the view or its template) fails the 500-row run.
+
+The user owns two companies and another user owns a third, so views that
+forget to scope by company also show up as extra rows, not just extra
+queries.
+
+Behaviour tests on small hand-made ledgers (receipts and the other
+receivables features, e-invoice exports, background jobs, scheduled tasks),
+who gets Server-Timing, access to /metrics and the SQLiteCache backend behind
+CACHES follow.
+"""
+import json
+import math
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from .address_utils import parse_address
+from .amount_utils import amount_in_words
+from .cache_backends import SQLiteCache
+from .einvoice_utils import EXPORT_CHUNK_SIZE, dumps_json
+from .forms import InvoiceItemFormSet
+from .metrics import scrape_allowed
+from .models import (
+    UOM, BankStatementImport, Client, Company, CompanySettings, Invoice, InvoiceItem, Job, Payment, POLineItem, Product,
+    PurchaseOrder, ScheduledRun, StatementCheckpoint
+)
+from .receivables_utils import build_client_statement
+from .tds_utils import financial_year
+from . import jobs, reference_cache, scheduler, views
+from . import urls as invoice_urls
+
+
+User = get_user_model()
+
+# All seeded invoices fall in June 2025 (FY 2025-26) so that every report
+# below covers the same rows whatever the date the tests run on.
+INVOICE_DATE = date(2025, 6, 10)
+PAYMENT_DATE = date(2025, 6, 20)
+STATUSES = ['PENDING', 'OVERDUE', 'PAID', 'DRAFT']
+
+# url name: queries for one request, at any data size. Logged-in requests
+# include the session user lookup (the session itself is read from the cache).
+# The reference cache (UOMs, companies, PO choices) is cold for every request.
+# The streaming exports also prefetch items once per EXPORT_CHUNK_SIZE
+# invoices; that is added on top of their budget here.
+QUERY_BUDGETS = {
+    'invoices:dashboard': 19,
+    'invoices:uom_list': 2,
+    'invoices:create_uom': 1,
+    'invoices:edit_uom': 2,
+    'invoices:delete_uom': 2,
+    'invoices:manage_po': 6,
+    'invoices:create_po': 3,
+    'invoices:edit_po': 5,
+    'invoices:delete_po': 4,
+    'invoices:invoice_list': 8,
+    'invoices:create_invoice': 5,
+    'invoices:invoice_detail': 11,
+    'invoices:invoice_pdf': 5,
+    'invoices:queue_invoice_pdf': 3,
+    'invoices:edit_invoice': 9,
+    'invoices:delete_invoice': 2,
+    'invoices:eway_bill_info': 5,
+    'invoices:eway_bill_data': 5,
+    'invoices:eway_bill_export': 2,
+    'invoices:einvoice_info': 5,
+    'invoices:einvoice_data': 5,
+    'invoices:einvoice_export': 3,
+    'invoices:einvoice_preflight': 3,
+    'invoices:add_payment': 3,
+    'invoices:bank_reconcile': 3,
+    'invoices:edit_payment': 5,
+    'invoices:delete_payment': 4,
+    'invoices:client_list': 2,
+    'invoices:create_client': 1,
+    'invoices:edit_client': 2,
+    'invoices:client_statement': 10,
+    'invoices:client_receipt': 5,
+    'invoices:delete_client': 4,
+    'invoices:product_list': 2,
+    'invoices:create_product': 1,
+    'invoices:edit_product': 2,
+    'invoices:delete_product': 2,
+    'invoices:reports': 13,
+    'invoices:gstr1_report': 6,
+    'invoices:receivables_aging': 4,
+    'invoices:tds_report': 4,
+    'invoices:tds_client_report': 5,
+    'invoices:company_list': 2,
+    'invoices:create_company': 1,
+    'invoices:edit_company': 2,
+    'invoices:delete_company': 5,
+    'invoices:settings': 2,
+    'invoices:job_status': 2,
+    'invoices:job_download': 2,
+    'invoices:profile_list': 1,
+    'invoices:profile_detail': 1,
+    'invoices:metrics': 2,
+    'invoices:api_po_line_items': 3,
+    'invoices:api_po_line_item_detail': 3,
+    'invoices:api_client_receipt': 4,
+    'invoices:api_company_pos': 3,
+    'invoices:api_company_next_invoice_number': 3,
+}
+
+
+def seed_company(user, name, prefix, clients, rows):
+    """
+    A company with `rows` purchase orders, invoices and payments. The last
+    PO has `rows` line items and the first invoice `rows` items and payments,
+    so detail pages and formsets grow with `rows` too.
+    """
+    company = Company.objects.create(
+        user=user, name=name, gstin='27AAPFU0939F1ZV', pan='AAPFU0939F',
+        address='12 Park Street, Mumbai, Maharashtra 400001', email=f'{prefix.lower()}@example.com',
+        invoice_prefix=f'{prefix}-', bank_name='HDFC Bank', account_number='50100012345678', ifsc_code='HDFC0000001',
+    )
+    uom = UOM.objects.get(name='Nos')
+
+    pos = PurchaseOrder.objects.bulk_create([
+        PurchaseOrder(company=company, po_number=f'{prefix}-PO-{i:04d}', main_line_number='10', main_line_description=f'Works {i}')
+        for i in range(rows)
+    ])
+    POLineItem.objects.bulk_create([
+        POLineItem(
+            purchase_order=po, subline_number=f'{n + 1}', subline_description=f'Line {n + 1}',
+            quantity=Decimal('100'), price=Decimal('250.00'), uom=uom,
+        )
+        for index, po in enumerate(pos) for n in range(rows if index == len(pos) - 1 else 1)
+    ])
+
+    invoices = Invoice.objects.bulk_create([
+        Invoice(
+            invoice_number=f'{prefix}-2025-{i + 1:04d}', company=company,
+            # Half the invoices go to the first client so their statement and receipt pages grow with `rows`
+            client=clients[0] if i % 2 == 0 else clients[i % len(clients)],
+            po_reference=pos[i], po_number=pos[i].po_number, invoice_date=INVOICE_DATE, due_date=date(2025, 7, 10),
+            subtotal=Decimal('1000.00'), cgst_amount=Decimal('90.00'), sgst_amount=Decimal('90.00'),
+            tax_amount=Decimal('180.00'), total=Decimal('1180.00'), place_of_supply='Maharashtra', state_code='27',
+            status=STATUSES[i % len(STATUSES)], created_by=user,
+        )
+        for i in range(rows)
+    ])
+    InvoiceItem.objects.bulk_create([
+        InvoiceItem(
+            invoice=invoice, description=f'Service {n + 1}', sac_code='998314',
+            quantity=Decimal('4'), rate=Decimal('250.00'), total=Decimal('1000.00'),
+        )
+        for index, invoice in enumerate(invoices) for n in range(rows if index == 0 else 1)
+    ])
+    Payment.objects.bulk_create([
+        Payment(
+            invoice=invoice, payment_date=PAYMENT_DATE, amount=Decimal('100.00'), tds_amount=Decimal('2.00'),
+            tds_percentage=Decimal('2.00'), net_amount=Decimal('98.00'), reference_number=f'UTR{index:06d}{n:04d}',
+            created_by=user,
+        )
+        for index, invoice in enumerate(invoices) if invoice.status != 'DRAFT'
+        for n in range(rows if index == 0 else 1)
+    ])
+    return company
+
+
+def seed(rows):
+    """Users, shared masters and three companies (two of them the user's) with `rows` of everything"""
+    user = User.objects.create_user('owner', 'owner@example.com', 'secret', is_staff=True)
+    other = User.objects.create_user('other', 'other@example.com', 'secret')
+
+    # Only a few UOMs are active, so each of the 500 PO line item forms renders a short select
+    UOM.objects.bulk_create([UOM(name='Nos', code='NOS')] + [
+        UOM(name=f'Unit {i}', code=f'U{i}', is_active=i < 4) for i in range(rows - 1)
+    ])
+    Product.objects.bulk_create([
+        Product(name=f'Product {i}', sku=f'SKU-{i:04d}', unit_price=Decimal('250.00')) for i in range(rows)
+    ])
+    clients = Client.objects.bulk_create([
+        Client(
+            name=f'Client {i:04d}', email=f'client{i}@example.com', gstin='24AAACB1234C1Z5',
+            address='5 Ring Road, Surat, Gujarat 395002', address_line1='5 Ring Road', city='Surat',
+            pin='395002', state_code='24',
+        )
+        for i in range(rows)
+    ])
+
+    company = seed_company(user, 'Acme Engineering', 'ACME', clients, rows)
+    company.is_default = True
+    company.save()
+    seed_company(user, 'Acme Services', 'ACS', clients, rows)
+    seed_company(other, 'Other Traders', 'OTH', clients, rows)
+
+    CompanySettings.get_settings()
+    invoice = Invoice.objects.filter(company=company).order_by('invoice_number').first()
+    job = Job.objects.create(name='invoice_pdf', queue='pdf', status='DONE', created_by=user, payload={'invoice_id': invoice.pk})
+    job.result_file.save('invoice.pdf', ContentFile(b'%PDF-1.4'), save=True)
+    return {
+        'user': user,
+        'company': company,
+        'client': clients[0],
+        'invoice': invoice,
+        'po': PurchaseOrder.objects.filter(company=company).order_by('po_number').last(),
+        'payment': invoice.payments.order_by('pk').first(),
+        'uom': UOM.objects.get(name='Nos'),
+        'product': Product.objects.order_by('pk').first(),
+        'job': job,
+    }
+
+
+class QueryBudgetTests:
+    """Mixin with one test per URL; subclasses set `rows`"""
+    rows = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed(cls.rows)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.data['user'])
+
+    def assertQueryBudget(self, name, *args, method='get', query=None, status=200, exported=None, **kwargs):
+        """
+        Request the named URL and check it runs exactly QUERY_BUDGETS[name]
+        queries, plus one per chunk of the `exported` invoices for streaming exports
+        """
+        budget = QUERY_BUDGETS[name]
+        if exported is not None:
+            budget += max(math.ceil(exported / EXPORT_CHUNK_SIZE), 1)
+        url = reverse(name, args=args)
+        if query:
+            url = f'{url}?{query}'
+        reference_cache.clear()
+        with self.assertNumQueries(budget):
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_every_url_has_a_budget(self):
+        names = {f'invoices:{pattern.name}' for pattern in invoice_urls.urlpatterns if isinstance(pattern, URLPattern)}
+        self.assertEqual(names, set(QUERY_BUDGETS))
+
+    def test_dashboard_and_reports(self):
+        company = self.data['company']
+        self.assertQueryBudget('invoices:dashboard')
+        self.assertQueryBudget('invoices:reports')
+        self.assertQueryBudget('invoices:gstr1_report', query=f'company={company.pk}&month=2025-06')
+        self.assertQueryBudget('invoices:receivables_aging')
+        self.assertQueryBudget('invoices:tds_report', query=f'company={company.pk}&fy=2025')
+        self.assertQueryBudget('invoices:tds_client_report', self.data['client'].pk, query=f'company={company.pk}&fy=2025')
+
+    def test_masters(self):
+        uom, product, client = self.data['uom'], self.data['product'], self.data['client']
+        self.assertQueryBudget('invoices:uom_list')
+        self.assertQueryBudget('invoices:create_uom')
+        self.assertQueryBudget('invoices:edit_uom', uom.pk)
+        self.assertQueryBudget('invoices:delete_uom', uom.pk)
+        self.assertQueryBudget('invoices:product_list')
+        self.assertQueryBudget('invoices:create_product')
+        self.assertQueryBudget('invoices:edit_product', product.pk)
+        self.assertQueryBudget('invoices:delete_product', product.pk)
+        self.assertQueryBudget('invoices:client_list')
+        self.assertQueryBudget('invoices:create_client')
+        self.assertQueryBudget('invoices:edit_client', client.pk)
+        self.assertQueryBudget('invoices:delete_client', client.pk)
+
+    def test_companies_and_settings(self):
+        company = self.data['company']
+        self.assertQueryBudget('invoices:company_list')
+        self.assertQueryBudget('invoices:create_company')
+        self.assertQueryBudget('invoices:edit_company', company.pk)
+        self.assertQueryBudget('invoices:delete_company', company.pk)
+        self.assertQueryBudget('invoices:settings')
+
+    def test_purchase_orders(self):
+        po, company = self.data['po'], self.data['company']
+        self.assertQueryBudget('invoices:manage_po')
+        self.assertQueryBudget('invoices:create_po')
+        self.assertQueryBudget('invoices:edit_po', po.pk)
+        self.assertQueryBudget('invoices:delete_po', po.pk)
+        response = self.assertQueryBudget('invoices:api_po_line_items', po.pk)
+        self.assertEqual(len(response.json()['items']), self.rows)
+        self.assertQueryBudget('invoices:api_po_line_item_detail', po.subline_items.first().pk)
+        response = self.assertQueryBudget('invoices:api_company_pos', company.pk)
+        self.assertEqual(len(response.json()['pos']), self.rows)
+        self.assertQueryBudget('invoices:api_company_next_invoice_number', company.pk)
+
+    def test_reference_data_is_cached(self):
+        url = reverse('invoices:create_po')
+        reference_cache.clear()
+        self.client.get(url)
+        # Warm: UOMs, companies and the default company come from the reference cache
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        UOM.objects.create(name='Metre', code='MTR')
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertContains(response, 'Metre')
+
+    def test_deferred_purchase_orders_invalidate_their_company(self):
+        company = self.data['company']
+        po = PurchaseOrder.objects.only('id', 'po_number').get(pk=self.data['po'].pk)
+        reference_cache.po_choices(company.pk)
+        po.po_number = 'PO-RENAMED'
+        po.save()
+        self.assertIn('PO-RENAMED', str(reference_cache.po_choices(company.pk)))
+        PurchaseOrder.objects.only('id').get(pk=po.pk).delete()
+        self.assertNotIn('PO-RENAMED', str(reference_cache.po_choices(company.pk)))
+
+    def test_invoices(self):
+        invoice = self.data['invoice']
+        response = self.assertQueryBudget('invoices:invoice_list')
+        self.assertEqual(response.context['total_count'], 2 * self.rows)
+        self.assertQueryBudget('invoices:create_invoice')
+        self.assertQueryBudget('invoices:invoice_detail', invoice.pk)
+        self.assertQueryBudget('invoices:edit_invoice', invoice.pk)
+        self.assertQueryBudget('invoices:delete_invoice', invoice.pk)
+        self.assertQueryBudget('invoices:invoice_pdf', invoice.pk)
+        self.assertQueryBudget('invoices:queue_invoice_pdf', invoice.pk, method='post', status=202)
+
+    def test_einvoice_and_eway_bill(self):
+        invoice, company = self.data['invoice'], self.data['company']
+        ids = list(Invoice.objects.filter(company=company).values_list('pk', flat=True))
+        issued = Invoice.objects.filter(company=company).exclude(status='DRAFT').count()
+        period = f'company={company.pk}&from=2025-06-01&to=2025-06-30'
+        self.assertQueryBudget('invoices:eway_bill_info', invoice.pk)
+        self.assertQueryBudget('invoices:eway_bill_data', invoice.pk)
+        self.assertQueryBudget('invoices:eway_bill_export', method='post', data={'ids': ','.join(map(str, ids))}, exported=len(ids))
+        self.assertQueryBudget('invoices:einvoice_info', invoice.pk)
+        self.assertQueryBudget('invoices:einvoice_data', invoice.pk)
+        self.assertQueryBudget('invoices:einvoice_export', query=period, exported=issued)
+        response = self.assertQueryBudget('invoices:einvoice_preflight', query=period, exported=issued)
+        self.assertEqual(response.json()['checked'], issued)
+
+    def test_payments(self):
+        invoice, payment, client, company = self.data['invoice'], self.data['payment'], self.data['client'], self.data['company']
+        self.assertQueryBudget('invoices:add_payment', invoice.pk)
+        self.assertQueryBudget('invoices:edit_payment', payment.pk)
+        self.assertQueryBudget('invoices:delete_payment', payment.pk)
+        self.assertQueryBudget('invoices:bank_reconcile')
+        self.assertQueryBudget(
+            'invoices:client_statement', client.pk, query=f'company={company.pk}&from=2025-04-01&to=2026-03-31',
+        )
+        self.assertQueryBudget('invoices:client_receipt', client.pk, query=f'company={company.pk}')
+        response = self.assertQueryBudget(
+            'invoices:api_client_receipt', client.pk, method='post', content_type='application/json',
+            data=json.dumps({
+                'company': company.pk, 'payment_date': '2025-07-01', 'amount': '1000.00',
+                'payment_method': 'NEFT', 'preview': True,
+            }),
+        )
+        self.assertFalse(response.json()['recorded'])
+
+    def test_jobs(self):
+        job = self.data['job']
+        self.assertQueryBudget('invoices:job_status', job.pk)
+        response = self.assertQueryBudget('invoices:job_download', job.pk)
+        response.close()
+
+    def test_staff_pages(self):
+        response = self.client.get(reverse('invoices:reports'), {'_profile': '1'})
+        name = response['X-Profile-Name']
+        self.assertQueryBudget('invoices:profile_list')
+        self.assertQueryBudget('invoices:profile_detail', name)
+        self.assertQueryBudget('invoices:metrics')
+
+
+class OneRowQueryBudgetTests(QueryBudgetTests, TestCase):
+    rows = 1
+
+
+class ManyRowsQueryBudgetTests(QueryBudgetTests, TestCase):
+    rows = 500
+
+
+class LedgerTests(TestCase):
+    """Base for behaviour tests: one user, company and client, and invoices made to measure"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        cls.company = Company.objects.create(
+            user=cls.user, name='Acme Engineering', gstin='27AAPFU0939F1ZV', pan='AAPFU0939F',
+            address='12 Park Street, Mumbai, Maharashtra 400001', invoice_prefix='ACME-', is_default=True,
+        )
+        cls.customer = Client.objects.create(
+            name='Bharat Traders', email='accounts@bharat.example', gstin='24AAACB1234C1Z5',
+            address='5 Ring Road, Surat, Gujarat 395002',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def make_invoice(self, number, total, due_date, invoice_date=INVOICE_DATE, status='PENDING'):
+        return Invoice.objects.create(
+            invoice_number=f'ACME-2025-{number:04d}', company=self.company, client=self.customer,
+            invoice_date=invoice_date, due_date=due_date, subtotal=total, total=total, status=status,
+            created_by=self.user,
+        )
+
+    def paid(self, invoice):
+        return sum(invoice.payments.values_list('net_amount', flat=True), Decimal('0'))
+
+
+class ReceiptTests(LedgerTests):
+    """Receipts spread over open invoices: FIFO, by hand and rejected input"""
+
+    def setUp(self):
+        super().setUp()
+        self.later = self.make_invoice(1, Decimal('1000.00'), date(2025, 7, 10))
+        self.oldest = self.make_invoice(2, Decimal('500.00'), date(2025, 6, 30))
+        self.latest = self.make_invoice(3, Decimal('800.00'), date(2025, 8, 10))
+        self.url = reverse('invoices:api_client_receipt', args=[self.customer.pk])
+
+    def post(self, body):
+        return self.client.post(self.url, data=json.dumps(body), content_type='application/json')
+
+    def receipt(self, amount, **fields):
+        return {
+            'company': self.company.pk, 'payment_date': '2025-07-15', 'amount': amount,
+            'payment_method': 'NEFT', **fields,
+        }
+
+    def test_fifo_allocation(self):
+        response = self.post(self.receipt('1220.00', tds_amount='20.00'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['recorded'])
+        self.assertEqual(self.paid(self.oldest), Decimal('500.00'))
+        self.assertEqual(self.paid(self.later), Decimal('700.00'))
+        self.assertEqual(self.paid(self.latest), Decimal('0'))
+        self.assertEqual(sum(Payment.objects.values_list('tds_amount', flat=True), Decimal('0')), Decimal('20.00'))
+        self.oldest.refresh_from_db()
+        self.assertEqual(self.oldest.status, 'PAID')
+
+        # The next receipt starts where this one left off
+        self.assertEqual(self.post(self.receipt('1100.00')).status_code, 200)
+        self.assertEqual(self.paid(self.later), Decimal('1000.00'))
+        self.assertEqual(self.paid(self.latest), Decimal('800.00'))
+        response = self.post(self.receipt('1.00'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_manual_allocation(self):
+        allocations = {str(self.latest.pk): '300.00', str(self.later.pk): 200}
+        response = self.post(self.receipt('500.00', allocations=allocations, preview=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(
+            {payment['invoice_id']: payment['net_amount'] for payment in response.json()['payments']},
+            {self.latest.pk: '300.00', self.later.pk: '200.00'},
+        )
+
+        self.assertEqual(self.post(self.receipt('500.00', allocations=allocations)).status_code, 200)
+        self.assertEqual(self.paid(self.latest), Decimal('300.00'))
+        self.assertEqual(self.paid(self.later), Decimal('200.00'))
+        self.assertEqual(self.paid(self.oldest), Decimal('0'))
+
+        # The form view books the same split from alloc_<id> inputs
+        response = self.client.post(
+            f"{reverse('invoices:client_receipt', args=[self.customer.pk])}?company={self.company.pk}",
+            {'payment_date': '2025-07-20', 'amount': '500.00', 'payment_method': 'NEFT', 'action': 'record',
+             f'alloc_{self.oldest.pk}': '500.00'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.paid(self.oldest), Decimal('500.00'))
+
+    def test_bad_input_is_rejected(self):
+        invoice_id = str(self.oldest.pk)
+        for body in (
+            [1, 2],
+            'receipt',
+            self.receipt('100.00', allocations=[1]),
+            self.receipt('100.00', allocations={invoice_id: None}),
+            self.receipt('100.00', allocations={invoice_id: True}),
+            self.receipt('100.00', allocations={invoice_id: {'amount': 100}}),
+            self.receipt('100.00', allocations={'first': '100.00'}),
+            self.receipt('100.00', allocations={invoice_id: 'lots'}),
+            self.receipt('100.00', allocations={invoice_id: 'NaN'}),
+            self.receipt('100.00', allocations={invoice_id: '60.00'}),
+            self.receipt('600.00', allocations={invoice_id: '600.00'}),
+            self.receipt('100.00', allocations={'999999': '100.00'}),
+            self.receipt('5000.00'),
+            self.receipt('abc'),
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        for company in (None, [1], 'abc', 999999):
+            with self.subTest(company=company):
+                self.assertEqual(self.post(self.receipt('100.00', company=company)).status_code, 404)
+        self.assertEqual(self.client.post(self.url, data='{', content_type='application/json').status_code, 400)
+        self.assertFalse(Payment.objects.exists())
+
+
+class BankReconcileTests(LedgerTests):
+    """Statement proposals are stored, confirmed once and checked again before booking"""
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.make_invoice(1, Decimal('1180.00'), date(2025, 7, 10))
+        self.second = self.make_invoice(2, Decimal('590.00'), date(2025, 7, 20))
+        self.url = reverse('invoices:bank_reconcile')
+
+    def upload(self):
+        statement = ContentFile(
+            b'Txn Date,Narration,Ref No,Credit\n'
+            b'15/07/2025,NEFT-BHARAT TRADERS-ACME-2025-0001,UTR0000000001,1180.00\n'
+            b'16/07/2025,NEFT-BHARAT TRADERS-ACME-2025-0002,UTR0000000002,590.00\n',
+            name='statement.csv',
+        )
+        response = self.client.post(self.url, {'company': self.company.pk, 'statement': statement})
+        self.assertEqual(len(response.context['matches']), 2)
+        self.assertNotIn('bank_reconcile', self.client.session)
+        return response.context['statement_import']
+
+    def apply(self, statement_import):
+        return self.client.post(self.url, {'action': 'apply', 'statement_import': statement_import.pk})
+
+    def test_confirming_twice_books_once(self):
+        statement_import = self.upload()
+        self.assertEqual(self.apply(statement_import).status_code, 302)
+        self.assertEqual(self.apply(statement_import).status_code, 302)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertFalse(BankStatementImport.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'PAID')
+
+    def test_stale_proposals_are_skipped(self):
+        statement_import = self.upload()
+        # Between upload and confirmation the first invoice is paid by hand, and the
+        # second statement line is booked under its reference elsewhere
+        Payment.objects.create(
+            invoice=self.first, payment_date=date(2025, 7, 15), amount=Decimal('1180.00'), net_amount=Decimal('1180.00'),
+        )
+        other = self.make_invoice(3, Decimal('590.00'), date(2025, 7, 20))
+        Payment.objects.create(
+            invoice=other, payment_date=date(2025, 7, 16), amount=Decimal('590.00'), net_amount=Decimal('590.00'),
+            reference_number='utr0000000002',
+        )
+        self.assertEqual(self.apply(statement_import).status_code, 302)
+        self.assertEqual(self.paid(self.first), Decimal('1180.00'))
+        self.assertEqual(self.paid(self.second), Decimal('0'))
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_other_users_cannot_confirm(self):
+        statement_import = self.upload()
+        self.client.force_login(User.objects.create_user('other', 'other@example.com', 'secret'))
+        self.apply(statement_import)
+        self.assertFalse(Payment.objects.exists())
+        self.assertTrue(BankStatementImport.objects.exists())
+
+
+class StatementTests(LedgerTests):
+    """Opening balances from monthly checkpoints match the ledger as it changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.first = self.make_invoice(1, Decimal('1000.00'), date(2025, 5, 10), invoice_date=date(2025, 4, 10))
+        self.second = self.make_invoice(2, Decimal('2500.00'), date(2025, 6, 20), invoice_date=date(2025, 5, 20))
+        self.third = self.make_invoice(3, Decimal('700.00'), date(2025, 8, 5), invoice_date=date(2025, 7, 5))
+        self.pay(self.first, Decimal('400.00'), date(2025, 5, 2))
+        self.pay(self.second, Decimal('2500.00'), date(2025, 6, 15))
+
+    def pay(self, invoice, amount, payment_date):
+        return Payment.objects.create(
+            invoice=invoice, payment_date=payment_date, amount=amount, net_amount=amount, created_by=self.user,
+        )
+
+    def ledger_balance(self, before):
+        """Balance before a date from every invoice and payment, without checkpoints"""
+        invoiced = Invoice.objects.filter(
+            company=self.company, client=self.customer, invoice_date__lt=before,
+        ).exclude(status='DRAFT').values_list('total', flat=True)
+        received = Payment.objects.filter(
+            invoice__company=self.company, invoice__client=self.customer, payment_date__lt=before,
+            status='RECEIVED', is_on_hold=False,
+        ).exclude(invoice__status='DRAFT').values_list('net_amount', flat=True)
+        return sum(invoiced, Decimal('0')) - sum(received, Decimal('0'))
+
+    def assertOpeningBalances(self):
+        for day in (date(2025, 5, 1), date(2025, 6, 16), date(2025, 8, 1), date(2025, 9, 30)):
+            statement = build_client_statement(self.company, self.customer, day, date(2025, 12, 31))
+            self.assertEqual(statement['opening_balance'], self.ledger_balance(day), day)
+            self.assertEqual(statement['closing_balance'], self.ledger_balance(date(2026, 1, 1)), day)
+
+    def test_checkpointed_balances_match_the_ledger(self):
+        self.assertOpeningBalances()
+        self.assertEqual(StatementCheckpoint.objects.filter(client=self.customer).count(), 5)
+
+        self.first.total = Decimal('1200.00')
+        self.first.save()
+        self.assertOpeningBalances()
+
+        self.pay(self.third, Decimal('100.00'), date(2025, 4, 30))
+        self.assertOpeningBalances()
+
+        self.second.invoice_date = date(2025, 8, 2)
+        self.second.save()
+        self.assertOpeningBalances()
+
+        # Its April payment leaves the ledger with it
+        self.third.status = 'DRAFT'
+        self.third.save()
+        self.assertOpeningBalances()
+
+        self.first.delete()
+        self.assertOpeningBalances()
+
+    def test_only_ledger_changes_drop_checkpoints(self):
+        build_client_statement(self.company, self.customer, date(2025, 9, 1), date(2025, 9, 30))
+        checkpoints = StatementCheckpoint.objects.filter(client=self.customer)
+        self.assertEqual(checkpoints.count(), 5)
+
+        invoice = Invoice.objects.get(pk=self.first.pk)
+        with self.assertNumQueries(2):
+            invoice.reminder_sent_at = timezone.now()
+            invoice.save(update_fields=['reminder_sent_at'])
+            invoice.status = 'OVERDUE'
+            invoice.save()
+        self.assertEqual(checkpoints.count(), 5)
+
+        # An item changes the total: checkpoints from the invoice month on go
+        InvoiceItem.objects.create(invoice=invoice, description='Extra', quantity=Decimal('1'), rate=Decimal('50.00'))
+        self.assertEqual(list(checkpoints.values_list('month', flat=True)), [])
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.subtotal, Decimal('50.00'))
+
+    def test_deferred_fields_are_treated_as_unknown(self):
+        self.assertOpeningBalances()
+        self.assertEqual(len(Invoice.objects.only('id', 'invoice_number')), 3)
+        self.assertEqual(len(Payment.objects.only('id', 'amount')), 2)
+
+        # Loaded without its date: the whole ledger is rebuilt after the move
+        invoice = Invoice.objects.only('id').get(pk=self.second.pk)
+        invoice.invoice_date = date(2025, 4, 1)
+        invoice.save()
+        self.assertOpeningBalances()
+
+        payment = Payment.objects.only('id', 'amount').get(invoice=self.first)
+        payment.payment_date = date(2025, 8, 20)
+        payment.save()
+        self.assertOpeningBalances()
+
+        Payment.objects.only('id').get(pk=payment.pk).delete()
+        self.assertOpeningBalances()
+        Invoice.objects.defer('company', 'client', 'invoice_date').get(pk=self.third.pk).delete()
+        self.assertOpeningBalances()
+
+    def test_items_saved_with_the_form_recalculate_once(self):
+        invoice = self.third
+        InvoiceItem.objects.create(invoice=invoice, description='Design', quantity=Decimal('2'), rate=Decimal('300.00'))
+        formset = InvoiceItemFormSet(instance=invoice, data={
+            'items-TOTAL_FORMS': '3', 'items-INITIAL_FORMS': '1', 'items-MIN_NUM_FORMS': '0', 'items-MAX_NUM_FORMS': '1000',
+            'items-0-id': str(invoice.items.get().pk), 'items-0-description': 'Design', 'items-0-quantity': '2',
+            'items-0-rate': '300.00', 'items-0-DELETE': 'on',
+            'items-1-description': 'Build', 'items-1-quantity': '3', 'items-1-rate': '100.00',
+            'items-2-description': 'Support', 'items-2-quantity': '1', 'items-2-rate': '250.00',
+        }, prefix='items')
+        self.assertTrue(formset.is_valid(), formset.errors)
+        with mock.patch.object(Invoice, 'calculate_totals', autospec=True, side_effect=Invoice.calculate_totals) as calculate:
+            views._save_invoice_items(formset)
+        self.assertEqual(calculate.call_count, 1)
+        invoice.refresh_from_db()
+        self.assertEqual(sorted(invoice.items.values_list('description', flat=True)), ['Build', 'Support'])
+        self.assertEqual(invoice.subtotal, Decimal('550.00'))
+
+
+class TdsReportTests(LedgerTests):
+    """The financial year in ?fy= is kept within the years the report covers"""
+
+    def test_out_of_range_years_fall_back_to_the_current_one(self):
+        current = financial_year(date.today())
+        for fy, expected in [('2024', 2024), ('2000', 2000), ('0', current), ('1999', current),
+                             (str(current + 1), current), ('99999', current), ('-5', current), ('x', current)]:
+            for name, args in [('invoices:tds_report', []), ('invoices:tds_client_report', [self.customer.pk])]:
+                response = self.client.get(reverse(name, args=args), {'fy': fy})
+                self.assertEqual(response.status_code, 200, (name, fy))
+                self.assertEqual(response.context['fy'], expected, (name, fy))
+
+
+class EinvoiceExportTests(LedgerTests):
+    """E-invoice and e-way bill JSON: exact paise amounts and the streamed bulk exports"""
+
+    def make_billed_invoice(self, number, status='PENDING'):
+        invoice = self.make_invoice(number, Decimal('0'), INVOICE_DATE + timedelta(days=30), status=status)
+        # 3 x 0.10 is 0.30000000000000004 in floats
+        InvoiceItem.objects.create(invoice=invoice, description='Bolts', quantity=Decimal('3'), rate=Decimal('0.10'))
+        InvoiceItem.objects.create(invoice=invoice, description='Inspection', quantity=Decimal('1'), rate=Decimal('1234567.89'))
+        invoice.refresh_from_db()
+        return invoice
+
+    def test_dumps_json_writes_decimals_exactly(self):
+        value = {'a': Decimal('0.30'), 'b': [Decimal('1234567890.12'), 1, 'x'], 'c': None}
+        self.assertEqual(dumps_json(value), '{"a":0.30,"b":[1234567890.12,1,"x"],"c":null}')
+
+    def test_amounts_are_exact(self):
+        invoice = self.make_billed_invoice(1)
+        response = self.client.get(reverse('invoices:einvoice_data', args=[invoice.pk]))
+        text = response.content
+        data = json.loads(text, parse_float=Decimal)
+
+        self.assertEqual(data['ValDtls']['AssVal'], Decimal('1234568.19'))
+        self.assertEqual(data['ValDtls']['CgstVal'], Decimal('111111.14'))
+        self.assertEqual(data['ValDtls']['TotInvVal'], Decimal('1456790.46'))
+        bolts = data['ItemList'][0]
+        self.assertEqual((bolts['TotAmt'], bolts['CgstAmt'], bolts['TotItemVal']), (Decimal('0.30'), Decimal('0.03'), Decimal('0.36')))
+        # Paise are always written with two places, never through float
+        self.assertIn(b'"TotAmt":0.30,', text)
+        self.assertNotIn(b'0000000', text)
+
+    def test_bulk_einvoice_export_streams_every_issued_invoice(self):
+        issued = [self.make_billed_invoice(number) for number in range(1, 6)]
+        self.make_billed_invoice(6, status='DRAFT')
+        self.make_invoice(7, Decimal('10.00'), INVOICE_DATE, invoice_date=date(2025, 7, 1))
+        with mock.patch('invoices.einvoice_utils.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.get(reverse('invoices:einvoice_export'), {
+                'company': self.company.pk, 'from': '2025-06-01', 'to': '2025-06-30',
+            })
+            chunks = list(response.streaming_content)
+
+        self.assertTrue(response.streaming)
+        # '[', one chunk per invoice, ']'
+        self.assertEqual(len(chunks), len(issued) + 2)
+        documents = json.loads(b''.join(chunks), parse_float=Decimal)
+        self.assertEqual([document['DocDtls']['No'] for document in documents], [invoice.invoice_number for invoice in issued])
+        self.assertEqual({document['ValDtls']['TotInvVal'] for document in documents}, {Decimal('1456790.46')})
+        self.assertEqual({len(document['ItemList']) for document in documents}, {2})
+
+    def test_bulk_eway_bill_export_streams_selected_invoices(self):
+        invoices = [self.make_billed_invoice(number) for number in range(1, 4)]
+        with mock.patch('invoices.einvoice_utils.EXPORT_CHUNK_SIZE', 2):
+            response = self.client.post(reverse('invoices:eway_bill_export'), {
+                'ids': ','.join(str(invoice.pk) for invoice in invoices[:2]),
+            })
+            data = json.loads(b''.join(response.streaming_content), parse_float=Decimal)
+
+        self.assertEqual([bill['docNo'] for bill in data['billLists']], [invoice.invoice_number for invoice in invoices[:2]])
+        self.assertEqual(data['billLists'][0]['itemList'][0]['taxableAmount'], Decimal('0.30'))
+        self.assertEqual(data['billLists'][0]['fromGstin'], self.company.gstin)
+
+
+class JobQueueTests(LedgerTests):
+    """Background jobs: enqueueing, claiming, heartbeats, retries and who may see the result"""
+
+    def setUp(self):
+        super().setUp()
+        handlers = {
+            'test_ok': {'func': lambda job, **payload: payload, 'queue': 'test', 'priority': 100},
+            'test_fail': {'func': self.fail_job, 'queue': 'test', 'priority': 100},
+        }
+        patcher = mock.patch.dict(jobs.JOB_HANDLERS, handlers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def fail_job(job, **payload):
+        raise RuntimeError('printer on fire')
+
+    def test_enqueue(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_job')
+        invoice = self.make_invoice(1, Decimal('1000.00'), date(2025, 7, 10))
+        response = self.client.post(reverse('invoices:queue_invoice_pdf', args=[invoice.pk]))
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(pk=response.json()['id'])
+        self.assertEqual((job.name, job.queue, job.status), ('invoice_pdf', 'pdf', 'QUEUED'))
+        self.assertEqual(job.payload, {'invoice_id': invoice.pk})
+        self.assertEqual(self.client.get(response.json()['status_url']).json()['status'], 'QUEUED')
+
+    def test_claim_order(self):
+        now = timezone.now()
+        later = jobs.enqueue('test_ok', run_at=now + timezone.timedelta(minutes=5))
+        normal = jobs.enqueue('test_ok')
+        urgent = jobs.enqueue('test_ok', priority=10)
+        claimed = [jobs.claim_job('test', 'worker-1') for _ in range(3)]
+        self.assertEqual(claimed[:2], [urgent, normal])
+        self.assertIsNone(claimed[2])
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'QUEUED')
+
+    @override_settings(JOB_LOCK_TIMEOUT=600)
+    def test_only_jobs_without_heartbeat_are_reclaimed(self):
+        job = jobs.enqueue('test_ok')
+        job = jobs.claim_job('test', 'worker-1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(seconds=601))
+        self.assertTrue(jobs.Heartbeat(job).beat())
+        self.assertIsNone(jobs.claim_job('test', 'worker-2'))
+
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(seconds=601))
+        reclaimed = jobs.claim_job('test', 'worker-2')
+        self.assertEqual((reclaimed.pk, reclaimed.locked_by, reclaimed.attempts), (job.pk, 'worker-2', 2))
+        # The first worker's heartbeat no longer owns the job
+        self.assertFalse(jobs.Heartbeat(job).beat())
+
+    def test_heartbeat_runs_while_the_handler_does(self):
+        beating = threading.Event()
+
+        def slow_job(job, **payload):
+            self.assertTrue(beating.wait(5))
+            return {'done': True}
+
+        jobs.JOB_HANDLERS['test_slow'] = {'func': slow_job, 'queue': 'test', 'priority': 100}
+        jobs.enqueue('test_slow')
+        job = jobs.claim_job('test', 'worker-1')
+        with mock.patch.object(jobs.Heartbeat, 'beat', side_effect=lambda: beating.set() or True), \
+                override_settings(JOB_HEARTBEAT_SECONDS=0.01):
+            self.assertTrue(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('DONE', {'done': True}))
+
+    def test_stalled_worker_does_not_overwrite_the_new_run(self):
+        stale_files = []
+
+        def stalled_job(job, **payload):
+            job.result_file.save('result.txt', ContentFile(job.locked_by.encode()), save=False)
+            if not stale_files:
+                stale_files.append(job.result_file.name)
+                # The worker stalls past JOB_LOCK_TIMEOUT and another one claims the job
+                Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(days=1))
+                self.assertEqual(jobs.claim_job('test', 'worker-2').locked_by, 'worker-2')
+            return {'worker': job.locked_by}
+
+        jobs.JOB_HANDLERS['test_stalled'] = {'func': stalled_job, 'queue': 'test', 'priority': 100}
+        job = jobs.enqueue('test_stalled')
+        self.assertFalse(jobs.run_job(jobs.claim_job('test', 'worker-1')))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.result, job.result_file.name), ('RUNNING', 'worker-2', None, ''))
+        self.assertFalse(job.result_file.storage.exists(stale_files[0]))
+
+        self.assertTrue(jobs.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('DONE', {'worker': 'worker-2'}))
+        self.assertEqual(job.result_file.read(), b'worker-2')
+        job.result_file.close()
+
+        # Nor does a stalled run that failed
+        failing = jobs.enqueue('test_fail')
+        failing = jobs.claim_job('test', 'worker-1')
+        Job.objects.filter(pk=failing.pk).update(locked_by='worker-2')
+        self.assertFalse(jobs.run_job(failing))
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.last_error), ('RUNNING', None))
+
+    @override_settings(JOB_RETRY_BACKOFF_SECONDS=30)
+    def test_retries_with_backoff_then_fails(self):
+        jobs.enqueue('test_fail', max_attempts=3)
+        delays = []
+        for _ in range(3):
+            job = jobs.claim_job('test', 'worker-1')
+            started = timezone.now()
+            self.assertFalse(jobs.run_job(job))
+            job.refresh_from_db()
+            delays.append(round((job.run_at - started).total_seconds() / 30) * 30)
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+        self.assertEqual((job.status, job.attempts), ('FAILED', 3))
+        self.assertIn('printer on fire', job.last_error)
+        self.assertEqual(delays[:2], [30, 60])
+        self.assertIsNone(jobs.claim_job('test', 'worker-1'))
+
+    def test_only_the_owner_sees_the_result(self):
+        job = jobs.enqueue('test_ok', user=self.user)
+        jobs.run_job(jobs.claim_job('test', 'worker-1'))
+        job.refresh_from_db()
+        job.result_file.save('result.txt', ContentFile(b'done'), save=True)
+        response = self.client.get(reverse('invoices:job_download', args=[job.pk]))
+        self.assertEqual(b''.join(response.streaming_content), b'done')
+        response.close()
+
+        self.client.force_login(User.objects.create_user('other', 'other@example.com', 'secret'))
+        self.assertEqual(self.client.get(reverse('invoices:job_status', args=[job.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('invoices:job_download', args=[job.pk])).status_code, 404)
+
+    def test_unfinished_jobs_have_no_download(self):
+        job = jobs.enqueue('test_ok', user=self.user)
+        self.assertEqual(self.client.get(reverse('invoices:job_download', args=[job.pk])).status_code, 404)
+        self.assertIsNone(self.client.get(reverse('invoices:job_status', args=[job.pk])).json()['download_url'])
+
+
+class SchedulerTests(LedgerTests):
+    """run_scheduler's schedule and leader lock, and the tasks it runs: overdue sweep, reminders, cache warm-up"""
+
+    def at(self, hhmm, day=date(2025, 7, 15)):
+        hour, minute = (int(part) for part in hhmm.split(':'))
+        return timezone.make_aware(datetime(day.year, day.month, day.day, hour, minute))
+
+    def test_is_due(self):
+        hourly = {'name': 'hourly', 'every': 3600}
+        now = self.at('10:00')
+        self.assertTrue(scheduler.is_due(hourly, None, now))
+        self.assertFalse(scheduler.is_due(hourly, now - timedelta(minutes=59), now))
+        self.assertTrue(scheduler.is_due(hourly, now - timedelta(minutes=60), now))
+
+        daily = {'name': 'daily', 'at': '09:00'}
+        self.assertFalse(scheduler.is_due(daily, None, self.at('08:59')))
+        self.assertTrue(scheduler.is_due(daily, None, self.at('09:00')))
+        self.assertTrue(scheduler.is_due(daily, self.at('09:00', date(2025, 7, 14)), self.at('09:30')))
+        self.assertFalse(scheduler.is_due(daily, self.at('09:00'), self.at('23:59')))
+
+    @override_settings(SCHEDULER_TASKS=[
+        {'name': 'sweep', 'every': 3600, 'command': 'sweep_overdue_invoices'},
+        {'name': 'broken', 'every': 3600, 'command': 'no_such_command'},
+    ])
+    def test_tick_records_runs_and_does_not_repeat_them(self):
+        runs = {run.name: run for run in scheduler.tick()}
+        self.assertEqual(set(runs), {'sweep', 'broken'})
+        self.assertTrue(runs['sweep'].success)
+        self.assertIn('Marked 0 invoice(s)', runs['sweep'].output)
+        self.assertFalse(runs['broken'].success)
+        self.assertIn('CommandError', runs['broken'].output)
+
+        self.assertEqual(scheduler.tick(), [])
+        later = timezone.now() + timedelta(hours=1, seconds=1)
+        self.assertEqual(len(scheduler.tick(now=later)), 2)
+        self.assertEqual(ScheduledRun.objects.count(), 4)
+
+    def test_warm_reference_cache(self):
+        PurchaseOrder.objects.create(company=self.company, po_number='PO-1', main_line_number='10', main_line_description='Pumps')
+        User.objects.filter(pk=self.user.pk).update(last_login=timezone.now())
+        User.objects.create_user('dormant', 'dormant@example.com', 'secret')
+        reference_cache.clear()
+        output = StringIO()
+        call_command('warm_reference_cache', stdout=output)
+        self.assertIn('for 1 user(s)', output.getvalue())
+
+        # Another worker: empty LRU, warm shared tier
+        reference_cache.local_cache().clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_cache.po_choices(self.company.pk), [(mock.ANY, 'PO-1 - Pumps')])
+            reference_cache.default_company(self.user.pk)
+            reference_cache.uom_choices()
+
+    @skipUnless(connection.vendor == 'postgresql', 'advisory locks need PostgreSQL')
+    def test_only_one_leader(self):
+        other = connection.copy()
+        try:
+            self.assertTrue(scheduler.try_acquire_leadership())
+            self.assertTrue(scheduler.try_acquire_leadership())
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', scheduler.LEADER_LOCK_KEYS)
+                self.assertFalse(cursor.fetchone()[0])
+            scheduler.release_leadership()
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', scheduler.LEADER_LOCK_KEYS)
+                self.assertTrue(cursor.fetchone()[0])
+            self.assertFalse(scheduler.try_acquire_leadership())
+        finally:
+            other.close()
+
+    def test_sweep_marks_past_due_invoices_overdue(self):
+        today = date.today()
+        past = self.make_invoice(1, Decimal('100.00'), today - timedelta(days=1))
+        due_today = self.make_invoice(2, Decimal('100.00'), today)
+        paid = self.make_invoice(3, Decimal('100.00'), today - timedelta(days=30), status='PAID')
+        draft = self.make_invoice(4, Decimal('100.00'), today - timedelta(days=30), status='DRAFT')
+        call_command('sweep_overdue_invoices', stdout=StringIO())
+        statuses = dict(Invoice.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[invoice.pk] for invoice in (past, due_today, paid, draft)],
+            ['OVERDUE', 'PENDING', 'PAID', 'DRAFT'],
+        )
+
+    @override_settings(REMINDER_OVERDUE_WINDOW_DAYS=7)
+    def test_overdue_reminders_are_not_backfilled(self):
+        today = date.today()
+        upcoming = self.make_invoice(1, Decimal('100.00'), today + timedelta(days=3))
+        recent = self.make_invoice(2, Decimal('100.00'), today - timedelta(days=6), status='OVERDUE')
+        self.make_invoice(3, Decimal('100.00'), today - timedelta(days=7), status='OVERDUE')
+        self.make_invoice(4, Decimal('100.00'), today - timedelta(days=200), status='OVERDUE')
+        call_command('send_invoice_reminders', stdout=StringIO())
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            [f'Reminder: Invoice {upcoming.invoice_number} Due Soon', f'Reminder: Invoice {recent.invoice_number} Overdue'],
+        )
+
+        # The overdue reminder is sent once: the next day's run skips it
+        Invoice.objects.filter(pk=recent.pk).update(reminder_sent_at=timezone.now() - timedelta(days=1))
+        mail.outbox = []
+        call_command('send_invoice_reminders', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+
+        # A deliberate backfill reaches the older ones
+        call_command('send_invoice_reminders', overdue_window=0, stdout=StringIO())
+        self.assertEqual(
+            sorted(message.subject for message in mail.outbox),
+            ['Reminder: Invoice ACME-2025-0003 Overdue', 'Reminder: Invoice ACME-2025-0004 Overdue'],
+        )
+
+
+class AddressTests(LedgerTests):
+    """Free-text addresses parsed into structured fields, and when saving re-parses them"""
+
+    def assertParsed(self, address, line1, city, pin, state_code, gstin=None):
+        parsed = parse_address(address, gstin)
+        self.assertEqual(
+            (parsed['address_line1'], parsed['city'], parsed['pin'], parsed['state_code']),
+            (line1, city, pin, state_code), address,
+        )
+
+    def test_parse_address(self):
+        self.assertParsed('123 Business Street, Ahmedabad, Gujarat - 380001', '123 Business Street', 'Ahmedabad', '380001', '24')
+        self.assertParsed('12 MG Road, Surat 394 130, Gujarat, India', '12 MG Road', 'Surat', '394130', '24')
+        self.assertParsed('Shop 3, Main Bazar, Shimla, Himachal Pradesh, PIN: 171001', 'Shop 3, Main Bazar', 'Shimla', '171001', '02')
+        self.assertParsed('5 Ring Road, Surat', '5 Ring Road', 'Surat', '', '24', gstin='24AAACB1234C1Z5')
+        self.assertParsed('', '', '', '', '')
+
+    def test_city_states(self):
+        self.assertParsed('Chandigarh - 160017', '', 'Chandigarh', '160017', '04')
+        self.assertParsed('Plot 4, Sector 17, Chandigarh - 160017', 'Plot 4, Sector 17', 'Chandigarh', '160017', '04')
+        self.assertParsed('Okhla Phase 2, New Delhi 110020', 'Okhla Phase 2', 'New Delhi', '110020', '07')
+        self.assertParsed('A-12, Dwarka, New Delhi, Delhi 110075', 'A-12, Dwarka', 'New Delhi', '110075', '07')
+
+    def test_long_street_is_split_over_two_lines(self):
+        street = ', '.join(f'Building {i} Industrial Estate Road' for i in range(4))
+        parsed = parse_address(f'{street}, Surat, Gujarat 395002')
+        self.assertLessEqual(len(parsed['address_line1']), 100)
+        self.assertEqual(f"{parsed['address_line1']}, {parsed['address_line2']}", street)
+
+    def test_save_parses_only_new_or_changed_addresses(self):
+        self.assertEqual((self.customer.city, self.customer.pin), ('Surat', '395002'))
+        customer = Client.objects.get(pk=self.customer.pk)
+        customer.city = ''
+        customer.save()
+        customer.name = 'Bharat Traders LLP'
+        customer.save()
+        customer = Client.objects.get(pk=customer.pk)
+        self.assertEqual(customer.city, '')
+
+        customer.address = 'Sector 17, Chandigarh - 160017'
+        customer.gstin = '04AAACB1234C1Z5'
+        customer.save()
+        customer = Client.objects.get(pk=customer.pk)
+        self.assertEqual((customer.city, customer.pin, customer.state_code), ('Chandigarh', '160017', '04'))
+
+        # A field edited along with the address is kept
+        customer.address = 'Okhla Phase 2, New Delhi 110020'
+        customer.gstin = '07AAACB1234C1Z5'
+        customer.address_line1 = 'Unit 9, Okhla Phase 2'
+        customer.save()
+        customer = Client.objects.get(pk=customer.pk)
+        self.assertEqual(
+            (customer.address_line1, customer.city, customer.pin, customer.state_code),
+            ('Unit 9, Okhla Phase 2', 'New Delhi', '110020', '07'),
+        )
+
+        # Loaded without them, the structured fields are parsed again; the GSTIN still decides the state
+        customer = Client.objects.only('id', 'address').get(pk=customer.pk)
+        customer.address = '5 Ring Road, Surat, Gujarat 395002'
+        customer.save()
+        customer = Client.objects.get(pk=customer.pk)
+        self.assertEqual((customer.city, customer.pin, customer.state_code), ('Surat', '395002', '07'))
+
+    def test_deferred_address_is_not_parsed(self):
+        Client.objects.filter(pk=self.customer.pk).update(city='')
+        customer = Client.objects.only('name').get(pk=self.customer.pk)
+        customer.save()
+        self.assertEqual(Client.objects.get(pk=customer.pk).city, '')
+
+
+@override_settings(SERVER_TIMING_HEADER=False)
+class ServerTimingTests(LedgerTests):
+    """Request timings go to staff users only unless SERVER_TIMING_HEADER is on"""
+
+    def test_only_staff_get_timings(self):
+        self.client.logout()
+        self.assertNotIn('Server-Timing', self.client.get(reverse('accounts:login')))
+        self.client.force_login(self.user)
+        self.assertNotIn('Server-Timing', self.client.get(reverse('invoices:invoice_list')))
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('invoices:invoice_list'))
+        self.assertIn('queries', response['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_header_for_everyone(self):
+        self.client.logout()
+        self.assertIn('Server-Timing', self.client.get(reverse('accounts:login')))
+
+
+class AmountInWordsTests(SimpleTestCase):
+    """The lakh/crore converter printed on every invoice"""
+
+    def test_amounts(self):
+        for amount, words in (
+            (Decimal('0'), 'Rupees Zero Only'),
+            (None, 'Rupees Zero Only'),
+            (Decimal('0.50'), 'Rupees Zero and Fifty Paise Only'),
+            (Decimal('1.01'), 'Rupees One and One Paise Only'),
+            (Decimal('1180.00'), 'Rupees One Thousand One Hundred Eighty Only'),
+            (1180.0, 'Rupees One Thousand One Hundred Eighty Only'),
+            (Decimal('123456.78'),
+             'Rupees One Lakh Twenty Three Thousand Four Hundred Fifty Six and Seventy Eight Paise Only'),
+        ):
+            with self.subTest(amount=amount):
+                self.assertEqual(amount_in_words(amount), words)
+
+    def test_lakh_and_crore_boundaries(self):
+        for amount, words in (
+            (99999, 'Rupees Ninety Nine Thousand Nine Hundred Ninety Nine Only'),
+            (100000, 'Rupees One Lakh Only'),
+            (100001, 'Rupees One Lakh One Only'),
+            (9999999, 'Rupees Ninety Nine Lakh Ninety Nine Thousand Nine Hundred Ninety Nine Only'),
+            (10000000, 'Rupees One Crore Only'),
+            (10000000.01, 'Rupees One Crore and One Paise Only'),
+            (1000000000, 'Rupees One Hundred Crore Only'),
+            (1234567890123, 'Rupees One Lakh Twenty Three Thousand Four Hundred Fifty Six Crore '
+                            'Seventy Eight Lakh Ninety Thousand One Hundred Twenty Three Only'),
+        ):
+            with self.subTest(amount=amount):
+                self.assertEqual(amount_in_words(Decimal(str(amount))), words)
+
+    def test_paise_rounding_and_negatives(self):
+        # Half-even, as DecimalField stores the total
+        self.assertEqual(amount_in_words(Decimal('0.005')), 'Rupees Zero Only')
+        self.assertEqual(amount_in_words(Decimal('0.015')), 'Rupees Zero and Two Paise Only')
+        self.assertEqual(amount_in_words(Decimal('99.999')), 'Rupees One Hundred Only')
+        self.assertEqual(amount_in_words(Decimal('-1180.00')), 'Minus Rupees One Thousand One Hundred Eighty Only')
+        self.assertEqual(amount_in_words(Decimal('-0.25')), 'Minus Rupees Zero and Twenty Five Paise Only')
+        self.assertEqual(amount_in_words(Decimal('-0.001')), 'Rupees Zero Only')
+
+
+class MetricsAccessTests(SimpleTestCase):
+    """Who may scrape /metrics, directly and through nginx"""
+
+    def allowed(self, remote='127.0.0.1', **headers):
+        return scrape_allowed(RequestFactory().get('/metrics', REMOTE_ADDR=remote, headers=headers))
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1', '::1'])
+    def test_allowed_addresses(self):
+        self.assertTrue(self.allowed())
+        self.assertTrue(self.allowed(x_real_ip='127.0.0.1', x_forwarded_for='127.0.0.1'))
+        self.assertFalse(self.allowed('203.0.113.5'))
+        # Through nginx the proxy is the REMOTE_ADDR; the client is in the headers
+        self.assertFalse(self.allowed(x_real_ip='203.0.113.5', x_forwarded_for='203.0.113.5'))
+        self.assertFalse(self.allowed(x_forwarded_for='127.0.0.1, 203.0.113.5'))
+        # Only the local proxy is believed
+        self.assertFalse(self.allowed('203.0.113.5', x_real_ip='127.0.0.1'))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertFalse(self.allowed())
+        self.assertFalse(self.allowed(authorization='Bearer wrong'))
+        self.assertTrue(self.allowed('203.0.113.5', authorization='Bearer s3cret'))
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """The shared cache backend: expiry, add/incr semantics and increments from several processes"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = SQLiteCache(str(Path(self.directory) / 'cache.sqlite3'), {'TIMEOUT': 60})
+
+    def test_values_and_expiry(self):
+        self.cache.set('choices', [(1, 'Nos')])
+        self.cache.set('flag', True)
+        self.cache.set('short', 'gone', timeout=-1)
+        self.assertEqual(self.cache.get('choices'), [(1, 'Nos')])
+        self.assertIs(self.cache.get('flag'), True)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 'back'))
+        self.assertFalse(self.cache.add('choices', []))
+        self.assertEqual(self.cache.get_many(['choices', 'short', 'missing']), {'choices': [(1, 'Nos')], 'short': 'back'})
+
+    def test_incr(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr('version')
+        self.cache.set('version', 7)
+        self.assertEqual(self.cache.incr('version'), 8)
+        self.assertEqual(self.cache.decr('version', 3), 5)
+
+    def test_incr_from_several_processes(self):
+        self.cache.set('version', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=lambda: [self.cache.incr('version') for _ in range(200)]) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('version'), 600)
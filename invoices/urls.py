@@ -23,15 +23,20 @@ urlpatterns = [
     path('invoices/create/', views.create_invoice, name='create_invoice'),
     path('invoices/<int:pk>/', views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:pk>/pdf/', views.invoice_pdf, name='invoice_pdf'),
+    path('invoices/<int:pk>/pdf/queue/', views.queue_invoice_pdf, name='queue_invoice_pdf'),
     path('invoices/<int:pk>/edit/', views.edit_invoice, name='edit_invoice'),
     path('invoices/<int:pk>/delete/', views.delete_invoice, name='delete_invoice'),
     path('invoices/<int:pk>/eway-bill/', views.eway_bill_info, name='eway_bill_info'),
     path('invoices/<int:pk>/eway-bill/download/', views.eway_bill_data, name='eway_bill_data'),
+    path('invoices/eway-bill/export/', views.eway_bill_export, name='eway_bill_export'),
     path('invoices/<int:pk>/einvoice/', views.einvoice_info, name='einvoice_info'),
     path('invoices/<int:pk>/einvoice/download/', views.einvoice_data, name='einvoice_data'),
+    path('invoices/einvoice/export/', views.einvoice_export, name='einvoice_export'),
+    path('invoices/einvoice/preflight/', views.einvoice_preflight, name='einvoice_preflight'),
     
     # Payments
     path('invoices/<int:invoice_id>/payment/add/', views.add_payment, name='add_payment'),
+    path('payments/reconcile/', views.bank_reconcile, name='bank_reconcile'),
     path('payments/<int:pk>/edit/', views.edit_payment, name='edit_payment'),
     path('payments/<int:pk>/delete/', views.delete_payment, name='delete_payment'),
     
@@ -39,6 +44,8 @@ urlpatterns = [
     path('clients/', views.client_list, name='client_list'),
     path('clients/create/', views.create_client, name='create_client'),
     path('clients/<int:pk>/edit/', views.edit_client, name='edit_client'),
+    path('clients/<int:pk>/statement/', views.client_statement, name='client_statement'),
+    path('clients/<int:pk>/receipt/', views.client_receipt, name='client_receipt'),
     path('clients/<int:pk>/delete/', views.delete_client, name='delete_client'),
     
     # Products
@@ -49,6 +56,10 @@ urlpatterns = [
     
     # Reports
     path('reports/', views.reports, name='reports'),
+    path('reports/gstr1/', views.gstr1_report, name='gstr1_report'),
+    path('reports/aging/', views.receivables_aging, name='receivables_aging'),
+    path('reports/tds/', views.tds_report, name='tds_report'),
+    path('reports/tds/clients/<int:client_id>/', views.tds_client_report, name='tds_client_report'),
     
     # Companies
     path('companies/', views.company_list, name='company_list'),
@@ -59,9 +70,21 @@ urlpatterns = [
     # Settings
     path('settings/', views.settings, name='settings'),
     
+    # Background jobs
+    path('jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
+    
+    # Request profiles (staff)
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
+
+    # Prometheus scrape endpoint
+    path('metrics', views.metrics, name='metrics'),
+    
     # API endpoints
     path('api/po/<int:po_id>/line-items/', views.api_po_line_items, name='api_po_line_items'),
     path('api/po-line-item/<int:item_id>/', views.api_po_line_item_detail, name='api_po_line_item_detail'),
+    path('api/clients/<int:client_id>/receipt/', views.api_client_receipt, name='api_client_receipt'),
     path('api/company/<int:company_id>/pos/', views.api_company_pos, name='api_company_pos'),
     path('api/company/<int:company_id>/next-invoice-number/', views.api_company_next_invoice_number, name='api_company_next_invoice_number'),
 ]
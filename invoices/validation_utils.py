@@ -0,0 +1,329 @@
+"""
+Pre-flight validation of e-invoice (INV-01) and e-way bill payloads
+
+The rule tables below are compiled once per process (get_einvoice_validator /
+get_eway_bill_validator) into flat lists of (path, getter, checks), so
+validating a payload is a handful of dict lookups and precompiled regex
+matches per field.
+"""
+import re
+from decimal import Decimal
+from functools import lru_cache
+
+
+# GST state / UT codes (first two digits of a GSTIN)
+STATE_CODES = {
+    '01': 'Jammu and Kashmir', '02': 'Himachal Pradesh', '03': 'Punjab', '04': 'Chandigarh',
+    '05': 'Uttarakhand', '06': 'Haryana', '07': 'Delhi', '08': 'Rajasthan', '09': 'Uttar Pradesh',
+    '10': 'Bihar', '11': 'Sikkim', '12': 'Arunachal Pradesh', '13': 'Nagaland', '14': 'Manipur',
+    '15': 'Mizoram', '16': 'Tripura', '17': 'Meghalaya', '18': 'Assam', '19': 'West Bengal',
+    '20': 'Jharkhand', '21': 'Odisha', '22': 'Chhattisgarh', '23': 'Madhya Pradesh', '24': 'Gujarat',
+    '26': 'Dadra and Nagar Haveli and Daman and Diu', '27': 'Maharashtra', '29': 'Karnataka',
+    '30': 'Goa', '31': 'Lakshadweep', '32': 'Kerala', '33': 'Tamil Nadu', '34': 'Puducherry',
+    '35': 'Andaman and Nicobar Islands', '36': 'Telangana', '37': 'Andhra Pradesh', '38': 'Ladakh',
+    '97': 'Other Territory', '96': 'Other Country',
+}
+
+GST_RATES = {Decimal(rate) for rate in ('0', '0.1', '0.25', '1', '1.5', '3', '5', '6', '7.5', '12', '18', '28')}
+
+# Portal tolerance when comparing totals
+TOTAL_TOLERANCE = Decimal('1.00')
+
+GSTIN_RE = re.compile(r'\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z]')
+GSTIN_CHARS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+PIN_RE = re.compile(r'[1-9]\d{5}')
+DATE_RE = re.compile(r'(0[1-9]|[12]\d|3[01])/(0[1-9]|1[0-2])/\d{4}')
+DOC_NO_RE = re.compile(r'[A-Za-z1-9][A-Za-z0-9/-]{0,15}')
+HSN_RE = re.compile(r'\d{4}|\d{6}|\d{8}')
+
+
+def gstin_check_digit(body):
+    """Check digit for the first 14 characters of a GSTIN"""
+    total = 0
+    for index, char in enumerate(body[:14]):
+        product = GSTIN_CHARS.index(char) * (2 if index % 2 else 1)
+        total += product // 36 + product % 36
+    return GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+@lru_cache(maxsize=4096)
+def gstin_is_valid(gstin):
+    """Format, state code and check digit of a GSTIN"""
+    if not gstin or not GSTIN_RE.fullmatch(gstin) or gstin[:2] not in STATE_CODES:
+        return False
+    return gstin[14] == gstin_check_digit(gstin)
+
+
+# ==================== FIELD CHECKS ====================
+# Each check takes the field value and returns an error message or None.
+
+def _blank(value):
+    return value is None or value == ''
+
+
+def required(value):
+    return 'is required' if _blank(value) else None
+
+
+def max_length(limit):
+    def check(value):
+        if not _blank(value) and len(str(value)) > limit:
+            return f'must be at most {limit} characters'
+    return check
+
+
+def pattern(regex, message):
+    def check(value):
+        if not _blank(value) and not regex.fullmatch(str(value)):
+            return message
+    return check
+
+
+def one_of(choices, message=None):
+    choices = frozenset(choices)
+    message = message or f"must be one of {', '.join(sorted(str(choice) for choice in choices))}"
+
+    def check(value):
+        if not _blank(value) and value not in choices:
+            return message
+    return check
+
+
+def gstin(value):
+    if not _blank(value) and not gstin_is_valid(value):
+        return 'is not a valid GSTIN'
+
+
+def gstin_or_urp(value):
+    # Unregistered recipients are declared as URP on e-way bills
+    if value != 'URP':
+        return gstin(value)
+
+
+def state_code(value):
+    if not _blank(value) and str(value) not in STATE_CODES:
+        return 'is not a valid GST state code'
+
+
+pin = pattern(PIN_RE, 'must be a 6-digit PIN code')
+date = pattern(DATE_RE, 'must be a date as DD/MM/YYYY')
+
+
+# ==================== RULE TABLES ====================
+
+INV01_RULES = {
+    'Version': [required],
+    'TranDtls.TaxSch': [required, one_of(['GST'])],
+    'TranDtls.SupTyp': [required, one_of(['B2B', 'SEZWP', 'SEZWOP', 'EXPWP', 'EXPWOP', 'DEXP'])],
+    'DocDtls.Typ': [required, one_of(['INV', 'CRN', 'DBN'])],
+    'DocDtls.No': [required, pattern(DOC_NO_RE, 'must be 1-16 letters, digits, "/" or "-" and not start with 0, "/" or "-"')],
+    'DocDtls.Dt': [required, date],
+    'SellerDtls.Gstin': [required, gstin],
+    'SellerDtls.LglNm': [required, max_length(100)],
+    'SellerDtls.Addr1': [required, max_length(100)],
+    'SellerDtls.Addr2': [max_length(100)],
+    'SellerDtls.Loc': [required, max_length(50)],
+    'SellerDtls.Pin': [required, pin],
+    'SellerDtls.Stcd': [required, state_code],
+    'BuyerDtls.Gstin': [required, gstin],
+    'BuyerDtls.LglNm': [required, max_length(100)],
+    'BuyerDtls.Pos': [required, state_code],
+    'BuyerDtls.Addr1': [required, max_length(100)],
+    'BuyerDtls.Addr2': [max_length(100)],
+    'BuyerDtls.Loc': [required, max_length(50)],
+    'BuyerDtls.Pin': [required, pin],
+    'BuyerDtls.Stcd': [required, state_code],
+    'ValDtls.AssVal': [required],
+    'ValDtls.TotInvVal': [required],
+}
+
+INV01_ITEM_RULES = {
+    'SlNo': [required, max_length(6)],
+    'PrdDesc': [max_length(300)],
+    'IsServc': [required, one_of(['Y', 'N'])],
+    'HsnCd': [required, pattern(HSN_RE, 'must be a 4, 6 or 8 digit HSN/SAC code')],
+    'UnitPrice': [required],
+    'TotAmt': [required],
+    'AssAmt': [required],
+    'GstRt': [required, one_of(GST_RATES, 'is not a valid GST rate')],
+    'TotItemVal': [required],
+}
+
+EWAY_BILL_RULES = {
+    'userGstin': [required, gstin],
+    'supplyType': [required, one_of(['O', 'I'])],
+    'docType': [required, one_of(['INV', 'BIL', 'BOE', 'CHL', 'OTH'])],
+    'docNo': [required, pattern(DOC_NO_RE, 'must be 1-16 letters, digits, "/" or "-"')],
+    'docDate': [required, date],
+    'fromGstin': [required, gstin_or_urp],
+    'fromTrdName': [max_length(100)],
+    'fromAddr1': [max_length(120)],
+    'fromAddr2': [max_length(120)],
+    'fromPlace': [max_length(50)],
+    'fromPincode': [required, pin],
+    'fromStateCode': [required, state_code],
+    'actFromStateCode': [required, state_code],
+    'toGstin': [required, gstin_or_urp],
+    'toTrdName': [max_length(100)],
+    'toAddr1': [max_length(120)],
+    'toAddr2': [max_length(120)],
+    'toPlace': [max_length(50)],
+    'toPincode': [required, pin],
+    'toStateCode': [required, state_code],
+    'actToStateCode': [required, state_code],
+    'totInvValue': [required],
+}
+
+EWAY_BILL_ITEM_RULES = {
+    'hsnCode': [required, pattern(HSN_RE, 'must be a 4, 6 or 8 digit HSN/SAC code')],
+    'taxableAmount': [required],
+}
+
+
+# ==================== COMPILATION ====================
+
+def _getter(path):
+    keys = tuple(path.split('.'))
+
+    def get(data):
+        for key in keys:
+            if not isinstance(data, dict):
+                return None
+            data = data.get(key)
+        return data
+    return get
+
+
+def compile_rules(rules):
+    """Turn a {dotted.path: [checks]} table into [(path, getter, checks)]"""
+    return [(path, _getter(path), tuple(checks)) for path, checks in rules.items()]
+
+
+def _run(compiled, data, errors, prefix=''):
+    for path, get, checks in compiled:
+        value = get(data)
+        for check in checks:
+            message = check(value)
+            if message:
+                errors.append((prefix + path, message))
+                break
+
+
+def _close(a, b):
+    return a is not None and b is not None and abs(Decimal(a) - Decimal(b)) <= TOTAL_TOLERANCE
+
+
+class PayloadValidator:
+    """Compiled document + line-item rules with cross-field checks"""
+
+    def __init__(self, rules, item_rules, items_key, cross_checks=()):
+        self.rules = compile_rules(rules)
+        self.item_rules = compile_rules(item_rules)
+        self.items_key = items_key
+        self.cross_checks = tuple(cross_checks)
+
+    def validate(self, data):
+        """Return a list of (field path, message); empty when the payload is valid"""
+        errors = []
+        _run(self.rules, data, errors)
+        items = data.get(self.items_key) or []
+        if not items:
+            errors.append((self.items_key, 'must contain at least one item'))
+        for index, item in enumerate(items):
+            _run(self.item_rules, item, errors, prefix=f'{self.items_key}[{index}].')
+        if not errors:
+            # Totals are only meaningful once every field is present
+            for check in self.cross_checks:
+                errors.extend(check(data))
+        return errors
+
+
+def _einvoice_cross_checks(data):
+    errors = []
+    seller, buyer, values = data['SellerDtls'], data['BuyerDtls'], data['ValDtls']
+
+    if seller['Gstin'][:2] != seller['Stcd']:
+        errors.append(('SellerDtls.Stcd', 'does not match the state in the seller GSTIN'))
+    if buyer['Gstin'][:2] != buyer['Stcd']:
+        errors.append(('BuyerDtls.Stcd', 'does not match the state in the buyer GSTIN'))
+    if seller['Gstin'] == buyer['Gstin']:
+        errors.append(('BuyerDtls.Gstin', 'must differ from the seller GSTIN'))
+
+    interstate = seller['Stcd'] != buyer['Pos']
+    if interstate and (values.get('CgstVal') or values.get('SgstVal')):
+        errors.append(('ValDtls.IgstVal', 'inter-state supply must be charged IGST, not CGST/SGST'))
+    if not interstate and values.get('IgstVal') and data['TranDtls'].get('IgstOnIntra') != 'Y':
+        errors.append(('ValDtls.CgstVal', 'intra-state supply must be charged CGST/SGST, not IGST'))
+
+    items = data['ItemList']
+    if not _close(sum(item['AssAmt'] for item in items), values['AssVal']):
+        errors.append(('ValDtls.AssVal', 'does not match the sum of item AssAmt'))
+    for key, item_key in (('CgstVal', 'CgstAmt'), ('SgstVal', 'SgstAmt'), ('IgstVal', 'IgstAmt')):
+        if not _close(sum(item.get(item_key) or 0 for item in items), values.get(key) or 0):
+            errors.append((f'ValDtls.{key}', f'does not match the sum of item {item_key}'))
+
+    parts = ('AssVal', 'CgstVal', 'SgstVal', 'IgstVal', 'CesVal', 'StCesVal', 'OthChrg', 'RndOffAmt')
+    if not _close(sum(values.get(part) or 0 for part in parts), values['TotInvVal']):
+        errors.append(('ValDtls.TotInvVal', 'does not match assessable value plus taxes and charges'))
+    return errors
+
+
+def _eway_bill_cross_checks(data):
+    errors = []
+    if data['fromGstin'] != 'URP' and data['fromGstin'][:2] != data['fromStateCode']:
+        errors.append(('fromStateCode', 'does not match the state in fromGstin'))
+    if data['toGstin'] != 'URP' and data['toGstin'][:2] != data['toStateCode']:
+        errors.append(('toStateCode', 'does not match the state in toGstin'))
+    return errors
+
+
+@lru_cache(maxsize=None)
+def get_einvoice_validator():
+    return PayloadValidator(INV01_RULES, INV01_ITEM_RULES, 'ItemList', [_einvoice_cross_checks])
+
+
+@lru_cache(maxsize=None)
+def get_eway_bill_validator():
+    return PayloadValidator(EWAY_BILL_RULES, EWAY_BILL_ITEM_RULES, 'itemList', [_eway_bill_cross_checks])
+
+
+# ==================== PRE-FLIGHT REPORT ====================
+
+def preflight_report(invoices):
+    """
+    Validate the INV-01 and e-way bill payloads of every invoice.
+
+    `invoices` should come from export_invoices_queryset() and is read in
+    chunks as the bulk exports read it. Returns a dict with counts and the
+    errors of each failing invoice.
+    """
+    from .einvoice_utils import EXPORT_CHUNK_SIZE, build_einvoice_data, build_eway_bill
+
+    einvoice_validator = get_einvoice_validator()
+    eway_validator = get_eway_bill_validator()
+    report = {'checked': 0, 'valid': 0, 'invalid': 0, 'invoices': []}
+
+    for invoice in invoices.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        items = invoice.items.all()
+        errors = [
+            {'document': 'einvoice', 'field': field, 'message': message}
+            for field, message in einvoice_validator.validate(
+                build_einvoice_data(invoice, items, invoice.company, invoice.client)
+            )
+        ] + [
+            {'document': 'eway_bill', 'field': field, 'message': message}
+            for field, message in eway_validator.validate(
+                build_eway_bill(invoice, items, invoice.company, invoice.client)
+            )
+        ]
+        report['checked'] += 1
+        if errors:
+            report['invalid'] += 1
+            report['invoices'].append({
+                'id': invoice.pk,
+                'invoice_number': invoice.invoice_number,
+                'errors': errors,
+            })
+        else:
+            report['valid'] += 1
+    return report
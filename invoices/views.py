@@ -1,18 +1,39 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
+from django.db import transaction
+from django.db.models import Sum, Count, Q, DecimalField, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, StreamingHttpResponse
+from django.urls import reverse
 from datetime import date, timedelta
 from decimal import Decimal
-import json
+from .einvoice_utils import (
+    build_einvoice_data, build_eway_bill_data, dumps_json, eway_bill_queryset, export_invoices_queryset,
+    iter_einvoice_export, iter_eway_bill_export
+)
+from .receipt_utils import build_receipt_payments, client_open_invoices, receipt_allocations, record_receipt
+from .reconcile_utils import (
+    CONFIDENT_MATCHES, apply_matches, deserialize_matches, parse_bank_statement, reconcile, save_proposals, take_proposals
+)
+from .gstr1_utils import b2b_by_recipient, build_gstr1, gstr1_portal_json, gstr1_totals, gstr1_zip, month_period
+from .receivables_utils import (
+    AGING_BUCKETS, aging_csv, aging_report, aging_totals, build_client_statement, statement_csv
+)
+from .tds_utils import (
+    FIRST_FY, QUARTERS, client_tds_csv, client_tds_payments, financial_year, fy_label, tds_summary, tds_summary_csv
+)
+from .validation_utils import preflight_report
+from . import reference_cache
 from .models import (
-    Client, Product, PurchaseOrder, POLineItem, Invoice, InvoiceItem, Company, CompanySettings, UOM, Payment
+    Client, Product, PurchaseOrder, POLineItem, Invoice, InvoiceItem, Company, CompanySettings, UOM, Payment, Job
 )
 from .forms import (
     PurchaseOrderForm, POLineItemFormSet, InvoiceForm, InvoiceItemFormSet,
-    get_invoice_item_formset, ClientForm, ProductForm, CompanyForm, CompanySettingsForm, UOMForm, PaymentForm
+    get_invoice_item_formset, ClientForm, ProductForm, CompanyForm, CompanySettingsForm, UOMForm, PaymentForm,
+    ReceiptForm
 )
 
 
@@ -77,6 +98,8 @@ def dashboard(request):
         total_revenue=Sum('invoices__total')
     ).filter(is_active=True).order_by('-total_revenue')[:3]
     
+    aging = aging_totals(base_invoices)
+    
     context = {
         'total_invoices': total_invoices,
         'paid_amount': paid_amount,
@@ -87,6 +110,8 @@ def dashboard(request):
         'top_clients': top_clients,
         'status_breakdown': status_breakdown,
         'monthly_revenue': monthly_revenue,
+        'aging': aging,
+        'aging_buckets': [(label, aging[key]) for key, label, _, _ in AGING_BUCKETS],
     }
     return render(request, 'invoices/dashboard.html', context)
 
@@ -94,7 +119,7 @@ def dashboard(request):
 @login_required
 def uom_list(request):
     """List all UOMs"""
-    uoms = UOM.objects.all().order_by('name')
+    uoms = reference_cache.all_uoms()
     return render(request, 'invoices/uom_list.html', {'uoms': uoms})
 
 
@@ -155,16 +180,14 @@ def manage_po(request):
     pos = PurchaseOrder.objects.filter(company__in=user_companies).prefetch_related('subline_items__uom', 'company').order_by('-created_at')
     
     # Apply company filter if selected
-    if company_id:
-        try:
-            selected_company = Company.objects.get(pk=company_id, user=request.user, is_active=True)
-            pos = pos.filter(company=selected_company)
-        except Company.DoesNotExist:
-            pass
+    companies = reference_cache.active_companies(request.user.pk)
+    selected_company = next((company for company in companies if str(company.pk) == company_id), None)
+    if selected_company:
+        pos = pos.filter(company_id=selected_company.pk)
     
     return render(request, 'invoices/manage_po.html', {
         'pos': pos,
-        'companies': user_companies,
+        'companies': companies,
         'selected_company_id': company_id
     })
 
@@ -264,6 +287,15 @@ def invoice_list(request):
     })
 
 
+def _save_invoice_items(formset):
+    """Save an invoice's item formset and recalculate the invoice once, not once per item"""
+    for item in formset.save(commit=False):
+        item.save(recalculate=False)
+    for item in formset.deleted_objects:
+        item.delete()
+    formset.instance.calculate_totals()
+
+
 @login_required
 def create_invoice(request):
     """Create new invoice"""
@@ -330,8 +362,7 @@ def create_invoice(request):
                                 })
             
             formset.instance = invoice
-            formset.save()
-            invoice.calculate_totals()
+            _save_invoice_items(formset)
             messages.success(request, f'Invoice {invoice.invoice_number} created successfully!')
             return redirect('invoices:invoice_list')
         else:
@@ -464,8 +495,7 @@ def edit_invoice(request, pk):
                                     'title': 'Edit Invoice'
                                 })
             
-            formset.save()
-            invoice.calculate_totals()
+            _save_invoice_items(formset)
             messages.success(request, 'Invoice updated successfully!')
             return redirect('invoices:invoice_list')
         else:
@@ -510,6 +540,113 @@ def client_list(request):
     return render(request, 'invoices/client_list.html', {'clients': clients})
 
 
+@login_required
+def client_statement(request, pk):
+    """Statement of account for a client with one of the user's companies, as HTML, PDF or CSV."""
+    from django.utils.dateparse import parse_date
+    
+    client = get_object_or_404(Client, pk=pk)
+    companies = _user_companies(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first() or Company.get_default(request.user)
+    if not company:
+        messages.error(request, 'Add a company before preparing statements.')
+        return redirect('invoices:company_list')
+    
+    today = date.today()
+    # Default to the current financial year (April-March)
+    fy_start = date(today.year if today.month >= 4 else today.year - 1, 4, 1)
+    try:
+        date_from = parse_date(request.GET.get('from', '')) or fy_start
+        date_to = parse_date(request.GET.get('to', '')) or today
+    except ValueError:
+        date_from, date_to = fy_start, today
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    
+    statement = build_client_statement(company, client, date_from, date_to)
+    filename = f"statement_{client.name[:30].replace(' ', '_')}_{date_from:%Y%m%d}_{date_to:%Y%m%d}"
+    output_format = request.GET.get('format')
+    if output_format == 'pdf':
+        from .pdf_utils import build_statement_pdf
+        response = HttpResponse(build_statement_pdf(statement), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
+        return response
+    if output_format == 'csv':
+        response = HttpResponse(statement_csv(statement), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+        return response
+    
+    context = {
+        'companies': companies,
+        'statement': statement,
+        'company': company,
+        'client': client,
+    }
+    return render(request, 'invoices/client_statement.html', context)
+
+
+def _manual_allocations(request):
+    """{invoice id: amount} from alloc_<id> inputs, or None when all are blank"""
+    allocations = {}
+    for key, value in request.POST.items():
+        if key.startswith('alloc_') and value.strip():
+            try:
+                allocations[int(key[6:])] = Decimal(value.strip())
+            except (ValueError, ArithmeticError):
+                raise ValueError(f'"{value}" is not a valid amount.')
+    return allocations or None
+
+
+@login_required
+def client_receipt(request, pk):
+    """Record one remittance against many of a client's open invoices, FIFO or split by hand."""
+    client = get_object_or_404(Client, pk=pk)
+    companies = _user_companies(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first() or Company.get_default(request.user)
+    if not company:
+        messages.error(request, 'Add a company before recording receipts.')
+        return redirect('invoices:company_list')
+    
+    invoices = None
+    allocations = {}
+    if request.method == 'POST':
+        form = ReceiptForm(request.POST)
+        if form.is_valid():
+            try:
+                manual = _manual_allocations(request)
+                if request.POST.get('action') == 'record':
+                    _, payments = record_receipt(company, client, form.cleaned_data, manual=manual, user=request.user)
+                    messages.success(
+                        request, f'Receipt of ₹{form.cleaned_data["amount"]:,.2f} applied to {len(payments)} invoice(s).'
+                    )
+                    return redirect(f"{reverse('invoices:client_statement', args=[client.pk])}?company={company.pk}")
+                invoices, allocations = receipt_allocations(company, client, form.cleaned_data, manual=manual)
+            except ValueError as e:
+                messages.error(request, str(e))
+                invoices, allocations = None, {}
+        else:
+            for field, errors in form.errors.items():
+                for error in errors:
+                    messages.error(request, f'{field}: {error}')
+    else:
+        form = ReceiptForm(initial={'payment_date': date.today()})
+    
+    if invoices is None:
+        invoices = client_open_invoices(company, client)
+    for invoice in invoices:
+        invoice['allocated'] = allocations.get(invoice['id'])
+    context = {
+        'companies': companies,
+        'company': company,
+        'client': client,
+        'form': form,
+        'invoices': invoices,
+        'total_outstanding': sum((invoice['outstanding'] for invoice in invoices), Decimal('0')),
+        'total_allocated': sum(allocations.values(), Decimal('0')),
+    }
+    return render(request, 'invoices/client_receipt.html', context)
+
+
 @login_required
 def create_client(request):
     """Create new client"""
@@ -656,6 +793,148 @@ def reports(request):
     return render(request, 'invoices/reports.html', context)
 
 
+@login_required
+def gstr1_report(request):
+    """GSTR-1 summary for a company and month, with portal JSON and CSV downloads (scoped to user's companies)."""
+    companies = _user_companies(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first() or Company.get_default(request.user)
+    
+    last_month = date.today().replace(day=1) - timedelta(days=1)
+    try:
+        year, month = (int(part) for part in request.GET.get('month', '').split('-'))
+        month_period(year, month)
+    except ValueError:
+        year, month = last_month.year, last_month.month
+    
+    if not company:
+        messages.error(request, 'Add a company before preparing GSTR-1.')
+        return redirect('invoices:company_list')
+    
+    report = build_gstr1(company, year, month)
+    output_format = request.GET.get('format')
+    filename = f"GSTR1_{report['gstin'] or company.invoice_prefix.strip('-')}_{report['fp']}"
+    if output_format == 'json':
+        response = HttpResponse(gstr1_portal_json(report), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.json"'
+        return response
+    if output_format == 'zip':
+        response = HttpResponse(gstr1_zip(report), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+        return response
+    
+    context = {
+        'companies': companies,
+        'company': company,
+        'month': f'{year}-{month:02d}',
+        'report': report,
+        'b2b_recipients': b2b_by_recipient(report['b2b']),
+        'totals': gstr1_totals(report),
+    }
+    return render(request, 'invoices/gstr1.html', context)
+
+
+@login_required
+def receivables_aging(request):
+    """Receivables aging by company and client, with CSV export (scoped to user's companies)."""
+    companies = _user_companies(request)
+    invoices = _user_invoices(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first()
+    if company:
+        invoices = invoices.filter(company=company)
+    
+    report = aging_report(invoices)
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(aging_csv(report), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="receivables_aging_{report["as_of"]:%Y%m%d}.csv"'
+        return response
+    
+    context = {
+        'companies': companies,
+        'company': company,
+        'report': report,
+    }
+    return render(request, 'invoices/aging.html', context)
+
+
+def _tds_period(request):
+    """(financial year, quarter or None) from ?fy=2025&quarter=1, defaulting to the current year"""
+    current = financial_year(date.today())
+    try:
+        year = int(request.GET.get('fy', ''))
+    except ValueError:
+        year = current
+    if not FIRST_FY <= year <= current:
+        # date() cannot hold year 0 or 99999; later years have no payments yet
+        year = current
+    try:
+        quarter = int(request.GET.get('quarter', ''))
+    except ValueError:
+        quarter = None
+    return year, quarter if quarter in (1, 2, 3, 4) else None
+
+
+def _tds_context(companies, company, year, quarter):
+    current = financial_year(date.today())
+    return {
+        'companies': companies,
+        'company': company,
+        'fy': year,
+        'fy_label': fy_label(year),
+        'quarter': quarter,
+        'quarters': [(number, label) for number, label, _ in QUARTERS],
+        'years': [(option, fy_label(option)) for option in range(current, current - 6, -1)],
+    }
+
+
+@login_required
+def tds_report(request):
+    """TDS deducted by clients per PAN, quarter and rate for Form 26AS reconciliation, with CSV export."""
+    companies = _user_companies(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first() or Company.get_default(request.user)
+    if not company:
+        messages.error(request, 'Add a company before preparing the TDS summary.')
+        return redirect('invoices:company_list')
+    
+    year, quarter = _tds_period(request)
+    summary = tds_summary(company, year, quarter)
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(tds_summary_csv(summary), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="tds_{summary["label"]}{f"_Q{quarter}" if quarter else ""}.csv"'
+        return response
+    
+    context = _tds_context(companies, company, year, quarter)
+    context['summary'] = summary
+    return render(request, 'invoices/tds_report.html', context)
+
+
+@login_required
+def tds_client_report(request, client_id):
+    """A client's payments with TDS in a financial year (drilldown of the TDS summary)."""
+    client = get_object_or_404(Client, pk=client_id)
+    companies = _user_companies(request)
+    company = companies.filter(pk=request.GET.get('company') or None).first() or Company.get_default(request.user)
+    if not company:
+        messages.error(request, 'Add a company before preparing the TDS summary.')
+        return redirect('invoices:company_list')
+    
+    year, quarter = _tds_period(request)
+    payments = client_tds_payments(company, client, year, quarter)
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(client_tds_csv(payments), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="tds_{client.name[:30].replace(" ", "_")}_{fy_label(year)}.csv"'
+        return response
+    
+    payments = list(payments)
+    context = _tds_context(companies, company, year, quarter)
+    context.update({
+        'client': client,
+        'payments': payments,
+        'total_amount': sum((payment.amount for payment in payments), Decimal('0')),
+        'total_tds': sum((payment.tds_amount for payment in payments), Decimal('0')),
+    })
+    return render(request, 'invoices/tds_client.html', context)
+
+
 @login_required
 def company_list(request):
     """List all companies for current user"""
@@ -742,14 +1021,18 @@ def api_po_line_items(request, po_id):
         po = PurchaseOrder.objects.filter(pk=po_id, company__in=user_companies).first()
         if not po:
             return JsonResponse({'error': 'Purchase order not found'}, status=404)
+        # Invoiced quantities summed in the same query instead of per line item
+        subline_items = po.subline_items.annotate(invoiced_quantity=Coalesce(
+            Sum('invoice_items__quantity'), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
         line_items = []
-        for item in po.subline_items.all():
+        for item in subline_items:
             line_items.append({
                 'id': item.id,
                 'subline_number': item.subline_number,
                 'description': item.subline_description,
                 'quantity': str(item.quantity),
-                'available_quantity': str(item.get_available_quantity()),
+                'available_quantity': str(item.quantity - item.invoiced_quantity),
                 'price': str(item.price),
             })
         return JsonResponse({'items': line_items})
@@ -762,14 +1045,13 @@ def api_company_pos(request, company_id):
     """API endpoint to get POs for a company"""
     try:
         company = get_object_or_404(Company, pk=company_id, user=request.user)
-        pos = PurchaseOrder.objects.filter(company=company).order_by('-created_at')
         po_list = []
-        for po in pos:
+        for pk, po_number, description in reference_cache.company_pos(company.pk):
             po_list.append({
-                'id': po.id,
-                'po_number': po.po_number,
-                'description': po.main_line_description,
-                'display': f"{po.po_number} - {po.main_line_description}",
+                'id': pk,
+                'po_number': po_number,
+                'description': description,
+                'display': f"{po_number} - {description}",
             })
         return JsonResponse({'pos': po_list})
     except Exception as e:
@@ -787,6 +1069,114 @@ def api_company_next_invoice_number(request, company_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+@login_required
+def api_client_receipt(request, client_id):
+    """
+    API endpoint to allocate a remittance over a client's open invoices.
+    POST JSON with the receipt fields, `company`, optional `allocations`
+    ({invoice id: amount}, FIFO when absent) and `preview` to only allocate.
+    """
+    import json
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    manual = data.get('allocations') or {}
+    if not isinstance(manual, dict) or not all(
+        key.isdigit() and isinstance(value, (str, int, float)) and not isinstance(value, bool)
+        for key, value in manual.items()
+    ):
+        return JsonResponse({'error': 'allocations must map invoice ids to amounts'}, status=400)
+    
+    client = Client.objects.filter(pk=client_id).first()
+    company_id = str(data.get('company', ''))
+    company = _user_companies(request).filter(pk=company_id).first() if company_id.isdigit() else None
+    if not client or not company:
+        return JsonResponse({'error': 'Company or client not found'}, status=404)
+    form = ReceiptForm(data)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    manual = {int(key): value for key, value in manual.items()}
+    try:
+        if data.get('preview'):
+            _, allocations = receipt_allocations(company, client, form.cleaned_data, manual=manual)
+            payments = build_receipt_payments(form.cleaned_data, allocations)
+        else:
+            _, payments = record_receipt(company, client, form.cleaned_data, manual=manual, user=request.user)
+    except (ValueError, TypeError, ArithmeticError) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'recorded': not data.get('preview'),
+        'net_amount': str(sum((payment.net_amount for payment in payments), Decimal('0'))),
+        'payments': [{
+            'id': payment.pk,
+            'invoice_id': payment.invoice_id,
+            'amount': str(payment.amount),
+            'tds_amount': str(payment.tds_amount),
+            'fine_amount': str(payment.fine_amount),
+            'net_amount': str(payment.net_amount),
+        } for payment in payments],
+    })
+
+
+@login_required
+def queue_invoice_pdf(request, pk):
+    """API endpoint to build an invoice PDF in the background (restricted to user's companies)."""
+    from . import jobs
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    invoice = _user_invoices(request).filter(pk=pk).first()
+    if not invoice:
+        return JsonResponse({'error': 'Invoice not found'}, status=404)
+    job = jobs.enqueue('invoice_pdf', {'invoice_id': invoice.pk}, user=request.user)
+    return JsonResponse({
+        'id': job.pk,
+        'status': job.status,
+        'status_url': reverse('invoices:job_status', args=[job.pk]),
+    }, status=202)
+
+
+@login_required
+def job_status(request, pk):
+    """API endpoint to poll a background job (restricted to jobs created by the user)."""
+    job = Job.objects.filter(pk=pk, created_by=request.user).first()
+    if not job:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    data = {
+        'id': job.pk,
+        'name': job.name,
+        'queue': job.queue,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': job.result,
+        'error': job.last_error if job.status == 'FAILED' else None,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': None,
+    }
+    if job.status == 'DONE' and job.result_file:
+        data['download_url'] = reverse('invoices:job_download', args=[job.pk])
+    return JsonResponse(data)
+
+
+@login_required
+def job_download(request, pk):
+    """Download the file produced by a finished job."""
+    job = get_object_or_404(Job, pk=pk, created_by=request.user, status='DONE')
+    if not job.result_file:
+        from django.http import Http404
+        raise Http404("Job has no file")
+    return FileResponse(job.result_file.open('rb'), as_attachment=True, filename=job.result_file.name.split('/')[-1])
+
+
 @login_required
 def add_payment(request, invoice_id):
     """Add payment to invoice (restricted to user's companies)."""
@@ -818,6 +1208,76 @@ def add_payment(request, invoice_id):
     })
 
 
+# Rows listed on the review page; the rest are summarized
+UNMATCHED_PREVIEW = 100
+
+
+@login_required
+def bank_reconcile(request):
+    """Upload a bank statement CSV, review the proposed invoice matches and record them as payments."""
+    companies = _user_companies(request)
+    
+    if request.method == 'POST' and request.POST.get('action') == 'apply':
+        import_id = request.POST.get('statement_import', '')
+        with transaction.atomic():
+            pending = take_proposals(import_id, request.user) if import_id.isdigit() else None
+            if not pending or not companies.filter(pk=pending.company_id).exists():
+                messages.error(request, 'These matches were already recorded or have expired. Upload the statement again.')
+                return redirect('invoices:bank_reconcile')
+            
+            # Confident matches are applied unless skipped; weak ones only when ticked
+            skipped = set(request.POST.getlist('skip'))
+            included = set(request.POST.getlist('include'))
+            selected = [
+                match for match in deserialize_matches(pending.matches)
+                if (match['match'] in CONFIDENT_MATCHES and str(match['line']) not in skipped)
+                or str(match['line']) in included
+            ]
+            payments, stale = apply_matches(selected, user=request.user, bank_name=pending.bank_name)
+        total = sum((payment.net_amount for payment in payments), Decimal('0'))
+        messages.success(request, f'Recorded {len(payments)} payment(s) totalling ₹{total:,.2f}.')
+        for match in stale[:10]:
+            messages.warning(request, f"Line {match['line']} not recorded: {match['reason']}.")
+        if len(stale) > 10:
+            messages.warning(request, f'{len(stale) - 10} more line(s) not recorded.')
+        return redirect('invoices:invoice_list')
+    
+    if request.method == 'POST':
+        company = companies.filter(pk=request.POST.get('company') or None).first()
+        statement = request.FILES.get('statement')
+        if not company or not statement:
+            messages.error(request, 'Choose a company and a statement CSV.')
+            return redirect('invoices:bank_reconcile')
+        try:
+            rows = parse_bank_statement(statement.read())
+        except ValueError as e:
+            messages.error(request, f'Could not read the statement: {e}')
+            return redirect('invoices:bank_reconcile')
+        
+        result = reconcile(company, rows)
+        bank_name = request.POST.get('bank_name', '').strip()
+        statement_import = save_proposals(company, request.user, result['matches'], bank_name=bank_name)
+        context = {
+            'companies': companies,
+            'company': company,
+            'statement_import': statement_import,
+            'bank_name': bank_name,
+            'rows': len(rows),
+            'matches': result['matches'],
+            'confident_matches': CONFIDENT_MATCHES,
+            'unmatched': result['unmatched'][:UNMATCHED_PREVIEW],
+            'unmatched_count': len(result['unmatched']),
+            'duplicates_count': len(result['duplicates']),
+            'matched_amount': sum((match['amount'] for match in result['matches']), Decimal('0')),
+        }
+        return render(request, 'invoices/bank_reconcile.html', context)
+    
+    return render(request, 'invoices/bank_reconcile.html', {
+        'companies': companies,
+        'company': Company.get_default(request.user),
+    })
+
+
 @login_required
 def edit_payment(request, pk):
     """Edit payment (restricted to user's invoices)."""
@@ -899,84 +1359,34 @@ def eway_bill_data(request, pk):
         messages.error(request, 'Company not found for this invoice.')
         return redirect('invoices:invoice_detail', pk=pk)
     
-    # Prepare e-way bill data according to GSTN format
-    eway_bill_data = {
-        "version": "1.0.0421",
-        "billLists": [
-            {
-                "userGstin": company.gstin or "",
-                "supplyType": "O",  # O=Outward, I=Inward
-                "subSupplyType": "1",  # 1=Supply, 2=Import, etc.
-                "docType": "INV",  # INV=Invoice, CHL=Challan, etc.
-                "docNo": invoice.invoice_number,
-                "docDate": invoice.invoice_date.strftime("%d/%m/%Y"),
-                "fromGstin": company.gstin or "",
-                "fromTrdName": company.name,
-                "fromAddr1": company.address.split('\n')[0] if company.address else "",
-                "fromAddr2": '\n'.join(company.address.split('\n')[1:]) if company.address and '\n' in company.address else "",
-                "fromPlace": company.address.split(',')[-1].strip() if company.address else "",
-                "fromPincode": "",  # Add if available in Company model
-                "fromStateCode": "",  # Extract from address or add field
-                "actFromStateCode": "",  # Actual state code
-                "toGstin": client.address or "",  # Client GSTIN if available
-                "toTrdName": client.name,
-                "toAddr1": client.address.split('\n')[0] if client.address else "",
-                "toAddr2": '\n'.join(client.address.split('\n')[1:]) if client.address and '\n' in client.address else "",
-                "toPlace": client.address.split(',')[-1].strip() if client.address else "",
-                "toPincode": "",
-                "toStateCode": invoice.state_code or "",
-                "actToStateCode": invoice.state_code or "",
-                "transactionType": "1",  # 1=Regular, 2=Bill to Ship to
-                "otherValue": 0,
-                "totInvValue": float(invoice.total),
-                "cgstValue": float(invoice.cgst_amount),
-                "sgstValue": float(invoice.sgst_amount),
-                "igstValue": 0,
-                "cessValue": 0,
-                "transMode": "",  # 1=Road, 2=Rail, 3=Air, 4=Ship
-                "transDistance": "",
-                "transporterName": "",
-                "transporterId": "",
-                "transporterDocNo": "",
-                "transporterDocDate": "",
-                "vehicleNo": "",
-                "vehicleType": "",
-                "itemList": []
-            }
-        ]
-    }
-    
-    # Add items
-    for idx, item in enumerate(items, 1):
-        item_data = {
-            "itemNo": idx,
-            "productName": item.description,
-            "productDesc": item.description,
-            "hsnCode": item.sac_code or "",
-            "qtyUnit": "",  # UOM code
-            "quantity": float(item.quantity),
-            "taxableAmount": float(item.total),
-            "igstRate": 0,
-            "igstValue": 0,
-            "cgstRate": float(invoice.cgst_rate),
-            "cgstValue": float(item.total * invoice.cgst_rate / 100),
-            "sgstRate": float(invoice.sgst_rate),
-            "sgstValue": float(item.total * invoice.sgst_rate / 100),
-            "cessRate": 0,
-            "cessValue": 0,
-            "cessNonAdvolValue": 0
-        }
-        eway_bill_data["billLists"][0]["itemList"].append(item_data)
+    eway_bill_data = build_eway_bill_data(invoice, items, company, client)
     
     # Return as downloadable JSON file
     response = HttpResponse(
-        json.dumps(eway_bill_data, indent=2),
+        dumps_json(eway_bill_data),
         content_type='application/json'
     )
     response['Content-Disposition'] = f'attachment; filename="eway_bill_{invoice.invoice_number}.json"'
     return response
 
 
+@login_required
+def eway_bill_export(request):
+    """Stream one e-way bill JSON with a billLists entry per selected invoice (restricted to user's companies)."""
+    # POSTed as one comma-separated field: thousands of ids would overflow a
+    # GET URL, and thousands of separate fields DATA_UPLOAD_MAX_NUMBER_FIELDS
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    ids = [value for field in request.POST.getlist('ids') for value in field.replace(' ', '').split(',') if value.isdigit()]
+    if not ids:
+        return JsonResponse({'error': 'Select at least one invoice (ids=<id>,<id>).'}, status=400)
+    
+    invoices = eway_bill_queryset(_user_invoices(request).filter(pk__in=ids))
+    response = StreamingHttpResponse(iter_eway_bill_export(invoices), content_type='application/json')
+    response['Content-Disposition'] = f'attachment; filename="eway_bills_{timezone.now():%Y%m%d_%H%M%S}.json"'
+    return response
+
+
 @login_required
 def eway_bill_info(request, pk):
     """Show e-way bill information (restricted to user's companies)."""
@@ -1019,156 +1429,60 @@ def einvoice_data(request, pk):
         messages.error(request, 'Company not found for this invoice.')
         return redirect('invoices:invoice_detail', pk=pk)
     
-    # Prepare e-invoice data according to GST INV-01 schema
-    from datetime import datetime
-    
-    # Extract address components
-    company_addr_lines = company.address.split('\n') if company.address else [""]
-    client_addr_lines = client.address.split('\n') if client.address else [""]
-    
-    # Extract PIN code (if available in address)
-    company_pin = ""
-    client_pin = ""
-    if company.address:
-        import re
-        pin_match = re.search(r'\b\d{6}\b', company.address)
-        if pin_match:
-            company_pin = pin_match.group()
-    if client.address:
-        pin_match = re.search(r'\b\d{6}\b', client.address)
-        if pin_match:
-            client_pin = pin_match.group()
-    
-    einvoice_data = {
-        "Version": "1.1",
-        "TranDtls": {
-            "TaxSch": "GST",
-            "SupTyp": "B2B",  # B2B, B2C, etc.
-            "IgstOnIntra": "N",  # Y if IGST, N if CGST+SGST
-            "RegRev": "N",
-            "EcmGstin": ""
-        },
-        "DocDtls": {
-            "Typ": "INV",  # INV=Invoice, CRN=Credit Note, DBN=Debit Note
-            "No": invoice.invoice_number,
-            "Dt": invoice.invoice_date.strftime("%d/%m/%Y")
-        },
-        "SellerDtls": {
-            "Gstin": company.gstin or "",
-            "LglNm": company.name,
-            "TrdNm": company.name,
-            "Addr1": company_addr_lines[0] if len(company_addr_lines) > 0 else "",
-            "Addr2": '\n'.join(company_addr_lines[1:]) if len(company_addr_lines) > 1 else "",
-            "Loc": company.address.split(',')[-1].strip() if company.address else "",
-            "Pin": company_pin,
-            "Stcd": "",  # State code - extract if available
-            "Ph": company.phone or "",
-            "Em": company.email or ""
-        },
-        "BuyerDtls": {
-            "Gstin": client.gstin or "",
-            "LglNm": client.name,
-            "TrdNm": client.name,
-            "Pos": invoice.state_code or "",  # Place of Supply state code
-            "Addr1": client_addr_lines[0] if len(client_addr_lines) > 0 else "",
-            "Addr2": '\n'.join(client_addr_lines[1:]) if len(client_addr_lines) > 1 else "",
-            "Loc": client.address.split(',')[-1].strip() if client.address else "",
-            "Pin": client_pin,
-            "Stcd": invoice.state_code or "",
-            "Ph": client.phone or "",
-            "Em": client.email or ""
-        },
-        "ItemList": [],
-        "ValDtls": {
-            "AssVal": float(invoice.subtotal - invoice.discount),
-            "CgstVal": float(invoice.cgst_amount),
-            "SgstVal": float(invoice.sgst_amount),
-            "IgstVal": 0.0,
-            "CesVal": 0.0,
-            "StCesVal": 0.0,
-            "Discount": float(invoice.discount),
-            "OthChrg": 0.0,
-            "RndOffAmt": 0.0,
-            "TotInvVal": float(invoice.total),
-            "TotInvValFc": float(invoice.total)
-        },
-        "PayDtls": {
-            "Nm": company.bank_name or "",
-            "AccDet": company.account_number or "",
-            "Mode": "",
-            "FinInsBr": company.ifsc_code or "",
-            "PayTerm": "",
-            "PayInstr": "",
-            "CrTrn": "",
-            "DirDr": "",
-            "CrDay": "",
-            "PaidAmt": 0.0,
-            "PaymtDue": float(invoice.total)
-        },
-        "RefDtls": {
-            "InvRm": "",
-            "DocPerdDtls": {
-                "InvStDt": invoice.invoice_date.strftime("%d/%m/%Y"),
-                "InvEndDt": invoice.due_date.strftime("%d/%m/%Y")
-            },
-            "PrecDocDtls": [],
-            "ContrDtls": []
-        },
-        "AddlDocDtls": [],
-        "ExpDtls": {},
-        "EwbDtls": {}
-    }
-    
-    # Add items
-    for idx, item in enumerate(items, 1):
-        # Calculate tax values for item
-        item_taxable_amt = float(item.total)
-        item_cgst = float(item_taxable_amt * invoice.cgst_rate / 100)
-        item_sgst = float(item_taxable_amt * invoice.sgst_rate / 100)
-        
-        item_data = {
-            "SlNo": str(idx),
-            "PrdDesc": item.description,
-            "IsServc": "Y",  # Y=Service, N=Goods
-            "HsnCd": item.sac_code or "",
-            "Barcde": "",
-            "Qty": float(item.quantity),
-            "FreeQty": 0.0,
-            "Unit": "",  # UOM code
-            "UnitPrice": float(item.rate),
-            "TotAmt": item_taxable_amt,
-            "Discount": 0.0,
-            "PreTaxVal": item_taxable_amt,
-            "AssAmt": item_taxable_amt,
-            "GstRt": float(invoice.tax_rate),
-            "IgstAmt": 0.0,
-            "CgstAmt": item_cgst,
-            "SgstAmt": item_sgst,
-            "CesRt": 0.0,
-            "CesAmt": 0.0,
-            "CesNonAdvlAmt": 0.0,
-            "StateCesRt": 0.0,
-            "StateCesAmt": 0.0,
-            "StateCesNonAdvlAmt": 0.0,
-            "OthChrg": 0.0,
-            "TotItemVal": item_taxable_amt + item_cgst + item_sgst,
-            "OrdLineRef": "",
-            "OrgCntry": "IN",
-            "PrdSlNo": "",
-            "BchDtls": {},
-            "AttribDtls": []
-        }
-        einvoice_data["ItemList"].append(item_data)
+    einvoice_data = build_einvoice_data(invoice, items, company, client)
     
     # Return as downloadable JSON file
     response = HttpResponse(
-        json.dumps(einvoice_data, indent=2),
+        dumps_json(einvoice_data),
         content_type='application/json'
     )
     response['Content-Disposition'] = f'attachment; filename="einvoice_{invoice.invoice_number}.json"'
     return response
 
 
+def _parse_export_period(request):
+    """Read company/from/to GET parameters for bulk exports; returns (company, from, to) or an error string."""
+    from django.utils.dateparse import parse_date
+    
+    company = _user_companies(request).filter(pk=request.GET.get('company') or None).first()
+    if not company:
+        return None, None, None, 'Select one of your companies (?company=<id>).'
+    try:
+        date_from = parse_date(request.GET.get('from', ''))
+        date_to = parse_date(request.GET.get('to', ''))
+    except ValueError:
+        date_from = date_to = None
+    if not date_from or not date_to or date_from > date_to:
+        return None, None, None, 'Provide a valid period as ?from=YYYY-MM-DD&to=YYYY-MM-DD.'
+    return company, date_from, date_to, None
+
+
+@login_required
+def einvoice_export(request):
+    """Stream e-invoice JSON for all of a company's invoices in a period (restricted to user's companies)."""
+    company, date_from, date_to, error = _parse_export_period(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    invoices = export_invoices_queryset(company, date_from, date_to)
+    response = StreamingHttpResponse(iter_einvoice_export(invoices), content_type='application/json')
+    response['Content-Disposition'] = (
+        f'attachment; filename="einvoices_{company.invoice_prefix.strip("-")}_{date_from:%Y%m%d}_{date_to:%Y%m%d}.json"'
+    )
+    return response
+
+
+@login_required
+def einvoice_preflight(request):
+    """Validate e-invoice and e-way bill JSON for a company's period before export (restricted to user's companies)."""
+    company, date_from, date_to, error = _parse_export_period(request)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    
+    report = preflight_report(export_invoices_queryset(company, date_from, date_to))
+    return JsonResponse(report)
+
+
 @login_required
 def einvoice_info(request, pk):
     """Show e-invoice information (restricted to user's companies)."""
@@ -1194,3 +1508,43 @@ def einvoice_info(request, pk):
     }
     
     return render(request, 'invoices/einvoice_info.html', einvoice_info)
+
+
+@staff_member_required
+def profile_list(request):
+    """Recent request profiles recorded with ?_profile=1 (staff only)."""
+    from .profiling import list_profiles
+    return render(request, 'admin/profiles/profile_list.html', {
+        'title': 'Request profiles',
+        'profiles': list_profiles(),
+    })
+
+
+@staff_member_required
+def profile_detail(request, name):
+    """Top functions of one profile, or its raw .prof file with ?download=1 (staff only)."""
+    from django.http import Http404
+    from .profiling import profile_path, read_profile
+    if request.GET.get('download'):
+        path = profile_path(name, '.prof')
+        if not path:
+            raise Http404("Profile not found")
+        return FileResponse(path.open('rb'), as_attachment=True, filename=f'{name}.prof')
+    path = profile_path(name, '.txt')
+    if not path:
+        raise Http404("Profile not found")
+    profile, report = read_profile(path)
+    return render(request, 'admin/profiles/profile_detail.html', {
+        'title': f'Profile {name}',
+        'name': name,
+        'profile': profile,
+        'report': report,
+    })
+
+
+def metrics(request):
+    """Prometheus scrape endpoint; see invoices.metrics for access control."""
+    from .metrics import render_metrics, scrape_allowed
+    if not scrape_allowed(request):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')